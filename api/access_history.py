@@ -0,0 +1,62 @@
+import logging
+import time
+from collections import Counter
+from typing import List
+from urllib import parse
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+
+def _bucket_key(hour):
+    return f'galaxy.api.access.{hour}'
+
+
+def _current_hour():
+    return int(time.time() // 3600)
+
+
+def request_path(request):
+    """
+    Path of request with sorted query params, requests differing in params order are counted together
+    """
+    query = parse.urlencode(sorted(request.GET.lists()), doseq=True)
+    return f'{request.path}?{query}' if query else request.path
+
+
+def mark_warming(request):
+    """
+    Marks request made by cache warming, it is not counted in access history
+    """
+    request.cache_warming = True
+
+
+def record(request):
+    """
+    Counts request in hourly buckets of access history, does nothing if history is disabled or request warms cache
+    """
+    if not settings.ACCESS_HISTORY_HOURS or getattr(request, 'cache_warming', False):
+        return
+    key = _bucket_key(_current_hour())
+    try:
+        pipeline = get_redis_connection('default').pipeline(transaction=False)
+        pipeline.zincrby(key, 1, request_path(request))
+        pipeline.expire(key, (settings.ACCESS_HISTORY_HOURS + 1) * 3600)
+        pipeline.execute()
+    except Exception:
+        logger.warning('Failed to record access history', exc_info=True)
+
+
+def popular(hours: int, top: int) -> List[str]:
+    """
+    Most requested paths during the last hours
+    """
+    connection = get_redis_connection('default')
+    current_hour = _current_hour()
+    counts = Counter()
+    for hour in range(current_hour - hours + 1, current_hour + 1):
+        for path, count in connection.zrevrange(_bucket_key(hour), 0, top - 1, withscores=True):
+            counts[path.decode()] += count
+    return [path for path, _ in counts.most_common(top)]
@@ -0,0 +1,158 @@
+import contextlib
+import functools
+import json
+import logging
+from collections import defaultdict
+from typing import List, Dict, Any
+from urllib import parse
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousOperation
+from rest_framework.exceptions import APIException
+
+from api.endpoint_data_wrapper import run_concurrently
+from api.endpoint_loader import EndpointStorage
+from api.endpoint_processor import EndpointProcessor
+
+logger = logging.getLogger(__name__)
+
+
+class _ItemRequest:
+    """
+    Request of batch item, pagination links of its page refer to the endpoint
+    """
+
+    def __init__(self, url):
+        self.url = url
+
+    def build_absolute_uri(self):
+        return self.url
+
+
+class BatchItem:
+    def __init__(self, endpoint_name: str, params: Dict[str, str]):
+        self.endpoint_name = endpoint_name
+        self.params = params
+        self.status = None
+        self.data = None
+        self.error = None
+
+    @property
+    def key(self):
+        return self.endpoint_name, json.dumps(self.params, sort_keys=True)
+
+    def succeed(self, data):
+        self.status, self.data = 200, data
+
+    def fail(self, status, error):
+        self.status, self.error = status, error
+
+    def result(self) -> Dict[str, Any]:
+        result = {'endpoint': self.endpoint_name, 'params': self.params, 'status': self.status}
+        if self.error is not None:
+            result['error'] = self.error
+        else:
+            result['data'] = self.data
+        return result
+
+
+def parse_item(data) -> BatchItem:
+    if not isinstance(data, dict) or not isinstance(data.get('endpoint'), str):
+        raise SuspiciousOperation(f'Batch item should be an object with endpoint name: {data}')
+    params = data.get('params', {})
+    if not isinstance(params, dict):
+        raise SuspiciousOperation(f'Params of batch item should be an object: {data}')
+    # params are passed to endpoints like query params
+    return BatchItem(data['endpoint'], {
+        name: value if _is_multiple(value) else str(value)
+        for name, value in params.items()
+    })
+
+
+def _is_multiple(value):
+    return isinstance(value, (dict, list)) or value is None
+
+
+def _params_error(params):
+    for name, value in params.items():
+        if _is_multiple(value):
+            return f'Incorrect parameter {name}: expected a single value, actual {value}'
+    return None
+
+
+@contextlib.contextmanager
+def _failures(items: List[BatchItem]):
+    try:
+        yield
+    except SuspiciousOperation as e:
+        for item in items:
+            item.fail(400, str(e))
+    except APIException as e:
+        for item in items:
+            item.fail(e.status_code, str(e.detail))
+    except Exception:
+        logger.exception(f'Batch item of {items[0].endpoint_name} failed')
+        for item in items:
+            item.fail(500, 'Internal server error')
+
+
+class BatchProcessor:
+    """
+    Processes items of a batch request concurrently, items with the same endpoint and params are processed once.
+    Items of endpoints without pagination are processed together with the batched queries of process_many.
+    """
+
+    def __init__(self, request):
+        self.request = request
+
+    def process(self, items_data) -> List[Dict[str, Any]]:
+        if not isinstance(items_data, list):
+            raise SuspiciousOperation('Batch request should be a list of items')
+        if len(items_data) > settings.BATCH_MAX_ITEMS:
+            raise SuspiciousOperation(f'Batch request has more than {settings.BATCH_MAX_ITEMS} items')
+        items = [parse_item(item_data) for item_data in items_data]
+        distinct_items = {}
+        for item in items:
+            distinct_items.setdefault(item.key, item)
+
+        run_concurrently(self.tasks(list(distinct_items.values())), settings.BATCH_CONCURRENCY)
+        return [distinct_items[item.key].result() for item in items]
+
+    def tasks(self, items: List[BatchItem]):
+        by_endpoint = defaultdict(list)
+        for item in items:
+            params_error = _params_error(item.params)
+            if params_error is not None:
+                item.fail(400, params_error)
+            elif item.endpoint_name not in EndpointStorage.endpoints:
+                item.fail(404, f'Endpoint not found: {item.endpoint_name}')
+            else:
+                by_endpoint[item.endpoint_name].append(item)
+
+        tasks = []
+        for endpoint_name, endpoint_items in by_endpoint.items():
+            processor = EndpointProcessor(EndpointStorage.endpoints[endpoint_name])
+            valid_items = [item for item in endpoint_items if self.validate(processor, item)]
+            if processor.endpoint.pagination_enabled:
+                tasks += [functools.partial(self.process_page, processor, item) for item in valid_items]
+            elif valid_items:
+                tasks.append(functools.partial(self.process_many, processor, valid_items))
+        return tasks
+
+    def validate(self, processor: EndpointProcessor, item: BatchItem):
+        try:
+            processor.process_parameters(item.params)
+            return True
+        except SuspiciousOperation as e:
+            item.fail(400, str(e))
+            return False
+
+    def process_page(self, processor: EndpointProcessor, item: BatchItem):
+        url = self.request.build_absolute_uri(f'/{item.endpoint_name}?{parse.urlencode(sorted(item.params.items()))}')
+        with _failures([item]):
+            item.succeed(processor.process(item.params, _ItemRequest(url)))
+
+    def process_many(self, processor: EndpointProcessor, items: List[BatchItem]):
+        with _failures(items):
+            for item, data in zip(items, processor.process_many([item.params for item in items])):
+                item.succeed(data)
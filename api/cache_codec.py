@@ -0,0 +1,21 @@
+import pickle
+import zlib
+
+from api.rows import Columns, Rows
+
+# fast levels compress query results almost as well as the default one
+COMPRESSION_LEVEL = 1
+
+
+def encode(rows: Rows) -> bytes:
+    """
+    Compressed query result with column names stored once and rows stored as tuples of values
+    """
+    # rows of database drivers may be other sequences than tuples, tuple() of a tuple is the tuple itself
+    values = list(map(tuple, rows))
+    return zlib.compress(pickle.dumps((rows.columns.names, values), pickle.HIGHEST_PROTOCOL), COMPRESSION_LEVEL)
+
+
+def decode(data: bytes) -> Rows:
+    names, values = pickle.loads(zlib.decompress(data))
+    return Rows(Columns(names), values)
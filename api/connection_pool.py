@@ -0,0 +1,204 @@
+import contextlib
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable
+
+from django.conf import settings
+from django.db import OperationalError, connections
+
+logger = logging.getLogger(__name__)
+
+
+def _ping(connection):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchall()
+        return True
+    except Exception:
+        return False
+
+
+def _close(connection):
+    try:
+        connection.close()
+    except Exception:
+        logger.warning('Failed to close pooled database connection', exc_info=True)
+
+
+class PoolTimeout(OperationalError):
+    """
+    All connections of the pool stayed in use for the whole timeout, the database server itself may be fine
+    """
+
+
+class ConnectionPool:
+    """
+    Pool of open database connections (django DatabaseWrapper instances shareable between threads).
+    Connections idle for more than max_idle seconds are closed, but min_size of them are kept open.
+    With pre_ping connections are checked with SELECT 1 before being handed out.
+    """
+
+    def __init__(self, create: Callable, min_size: int, max_size: int, max_idle: float, pre_ping: bool,
+                 timeout: float):
+        if max_size < 1 or min_size > max_size:
+            raise ValueError(f'Invalid connection pool size: min {min_size} max {max_size}')
+        self.create = create
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.pre_ping = pre_ping
+        self.timeout = timeout
+        # (connection, idle since), most recently released on the right
+        self._idle = deque()
+        self._size = 0
+        self._condition = threading.Condition()
+        self._stats = dict(created=0, closed=0, acquired=0, waited=0, timeouts=0, failed_pings=0)
+
+    @contextlib.contextmanager
+    def connection(self):
+        connection = self.acquire()
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            connection = self._take_idle_or_reserve(deadline)
+            if connection is None:
+                connection = self._open()
+            elif self.pre_ping and not _ping(connection):
+                self._discard(connection, failed_ping=True)
+                continue
+            with self._condition:
+                self._stats['acquired'] += 1
+            return connection
+
+    def release(self, connection):
+        if connection.errors_occurred:
+            if not _ping(connection):
+                self._discard(connection, failed_ping=True)
+                return
+            connection.errors_occurred = False
+        with self._condition:
+            self._idle.append((connection, time.monotonic()))
+            self._evict_idle()
+            self._condition.notify()
+
+    def close_all(self):
+        with self._condition:
+            idle, self._idle = list(self._idle), deque()
+            self._size -= len(idle)
+            self._stats['closed'] += len(idle)
+        for connection, _ in idle:
+            _close(connection)
+
+    def stats(self):
+        with self._condition:
+            return dict(
+                self._stats,
+                size=self._size,
+                idle=len(self._idle),
+                in_use=self._size - len(self._idle),
+                min_size=self.min_size,
+                max_size=self.max_size,
+            )
+
+    def _take_idle_or_reserve(self, deadline):
+        """
+        Most recently used idle connection, or None when a slot for a new connection is reserved
+        """
+        with self._condition:
+            self._evict_idle()
+            waited = False
+            while not self._idle and self._size >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(f'No database connection available in {self.timeout}s, '
+                                           f'all {self.max_size} connections of the pool are in use')
+                waited = True
+                self._condition.wait(remaining)
+            if waited:
+                self._stats['waited'] += 1
+            if self._idle:
+                connection, _ = self._idle.pop()
+                return connection
+            self._size += 1
+            return None
+
+    def _open(self):
+        try:
+            connection = self.create()
+            connection.ensure_connection()
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self._stats['created'] += 1
+        return connection
+
+    def _discard(self, connection, failed_ping=False):
+        _close(connection)
+        with self._condition:
+            self._size -= 1
+            self._stats['closed'] += 1
+            self._stats['failed_pings'] += failed_ping
+            self._condition.notify()
+
+    def _evict_idle(self):
+        # called with condition acquired, the least recently used connections are on the left
+        expired_before = time.monotonic() - self.max_idle
+        while self._idle and self._size > self.min_size and self._idle[0][1] < expired_before:
+            connection, _ = self._idle.popleft()
+            self._size -= 1
+            self._stats['closed'] += 1
+            _close(connection)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias):
+    """
+    Pool of connections to database alias, None if pooling is not configured for it
+    """
+    options = settings.DATABASE_POOLS.get(alias)
+    if options is None:
+        return None
+    with _pools_lock:
+        if alias not in _pools:
+            def create():
+                return connections[alias].copy(allow_thread_sharing=True)
+
+            _pools[alias] = ConnectionPool(create, **options)
+        return _pools[alias]
+
+
+def stats():
+    """
+    Stats of all created pools by database alias
+    """
+    with _pools_lock:
+        pools = dict(_pools)
+    return {alias: pool.stats() for alias, pool in pools.items()}
+
+
+@contextlib.contextmanager
+def connection(alias):
+    """
+    Pooled connection to database alias, or connection of the current thread if pooling is not configured
+    """
+    pool = get_pool(alias)
+    if pool is None:
+        yield connections[alias]
+        return
+    with pool.connection() as pooled:
+        yield pooled
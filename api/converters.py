@@ -0,0 +1,283 @@
+from operator import itemgetter
+from typing import Optional, List, Callable
+
+from api.endpoint import SchemaFieldType, Field, Select, Object
+from api.rows import Columns
+
+
+class Converter:
+    """
+    Converter compiled for the columns of rows it gets: values are taken from rows by their positions.
+    Rows of a query have the same columns, so it is compiled once per query of an endpoint.
+    """
+
+    def __init__(self, compile_for: Callable[[Columns], Callable]):
+        self._compile_for = compile_for
+        self._compiled = {}
+
+    def bind(self, columns: Columns) -> Callable:
+        convert = self._compiled.get(columns.names)
+        if convert is None:
+            convert = self._compiled[columns.names] = self._compile_for(columns)
+        return convert
+
+
+def _only_fields(obj: Object):
+    return all(isinstance(value, Field) for value in obj.fields.values())
+
+
+def _record_converter(obj: Object, columns: Columns):
+    """
+    Function record -> dict for object consisting only of fields
+    """
+    keys = tuple(obj.fields.keys())
+    db_names = [value.db_name for value in obj.fields.values()]
+    if len(keys) == 1:
+        key, getter = keys[0], itemgetter(columns.positions[db_names[0]])
+        return lambda record: {key: getter(record)}
+    values = columns.getter(db_names)
+    return lambda record: dict(zip(keys, values(record)))
+
+
+def _records_converter(obj: Object, columns: Columns):
+    """
+    Function records -> list of dicts for object consisting only of fields
+    """
+    keys = tuple(obj.fields.keys())
+    db_names = [value.db_name for value in obj.fields.values()]
+    if len(keys) == 1:
+        key, getter = keys[0], itemgetter(columns.positions[db_names[0]])
+        return lambda records: [{key: getter(record)} for record in records]
+    values = columns.getter(db_names)
+    return lambda records: [dict(zip(keys, values(record))) for record in records]
+
+
+def compile_converter(field: SchemaFieldType) -> Converter:
+    """
+    Compiles schema field into a converter of functions (record, selected_data) -> response item
+    """
+    return Converter(lambda columns: _compile(field, columns))
+
+
+def _compile(field: SchemaFieldType, columns: Columns):
+    """
+    Compiles schema field into a function (record, selected_data) -> response item for records with the columns
+    """
+    if isinstance(field, Field):
+        getter = itemgetter(columns.positions[field.db_name])
+        return lambda record, selected_data: getter(record)
+    elif isinstance(field, Select):
+        endpoint = field.endpoint
+        return lambda record, selected_data: selected_data.get_data(endpoint, record)
+    elif isinstance(field, Object):
+        keys = tuple(field.fields.keys())
+        if _only_fields(field):
+            convert_record = _record_converter(field, columns)
+            return lambda record, selected_data: convert_record(record)
+        converters = [_compile(value, columns) for value in field.fields.values()]
+        return lambda record, selected_data: dict(zip(keys, [
+            convert(record, selected_data) for convert in converters
+        ]))
+    else:
+        raise ValueError(f"Unknown schema field type: {field}")
+
+
+class _Grouping:
+    """
+    Aggregation level of a schema: groups of the level are keyed by the field value
+    """
+
+    def __init__(self, field: Optional[str]):
+        self.field = field
+        self.nested: List[_Grouping] = []
+        # groups keep all their rows only when a non-aggregate many object iterates them
+        self.keeps_rows = False
+
+    def add_nested(self, field: str):
+        self.nested.append(_Grouping(field))
+        return len(self.nested) - 1, self.nested[-1]
+
+
+class _Chain:
+    """
+    Path of aggregation levels from the root to a level without nested ones
+    """
+
+    def __init__(self, steps, columns: Columns):
+        self.key = columns.getter([level.field for _, level, _ in steps])
+        # (slot of level in parent group, nested levels count, group keeps all rows, group keeps first row)
+        self.steps = [
+            (
+                slot,
+                len(level.nested),
+                not level.nested or (level.keeps_rows and owns),
+                level.nested and not level.keeps_rows
+            )
+            for slot, level, owns in steps
+        ]
+
+
+def _paths(grouping: _Grouping, path=()):
+    """
+    Paths of (slot, level) from the grouping to every level without nested ones
+    """
+    result = []
+    for slot, level in enumerate(grouping.nested):
+        steps = path + ((slot, level),)
+        if level.nested:
+            result += _paths(level, steps)
+        else:
+            result.append(steps)
+    return result
+
+
+def _chains(grouping: _Grouping, columns: Columns):
+    # a level is passed by every chain to its nested levels, only the first of them keeps rows of its groups
+    visited = set()
+    result = []
+    for path in _paths(grouping):
+        steps = [(slot, level, id(level) not in visited) for slot, level in path]
+        visited.update(id(level) for _, level in path)
+        result.append(_Chain(steps, columns))
+    return result
+
+
+class _Group(list):
+    """
+    Rows of a group and groups of its nested aggregation levels
+    """
+    __slots__ = ('children',)
+
+
+def _new_group(nested_count):
+    group = _Group()
+    group.children = [{} for _ in range(nested_count)]
+    return group
+
+
+def _locate(root: _Group, row, path, chain: _Chain):
+    """
+    Creates groups of the row along the chain, returns row lists the rows with the same path go to
+    """
+    node = root
+    targets = []
+    for value, (slot, nested_count, keeps_rows, keeps_first_row) in zip(path, chain.steps):
+        children = node.children[slot]
+        child = children.get(value)
+        if child is None:
+            # groups of the last level have no nested groups, so plain lists are enough
+            child = children[value] = _new_group(nested_count) if nested_count else []
+            if keeps_first_row:
+                # first row of a group represents the group
+                child.append(row)
+        if keeps_rows:
+            targets.append(child)
+        node = child
+    return targets
+
+
+def _appender(targets):
+    if len(targets) == 1:
+        return targets[0].append
+    appends = [target.append for target in targets]
+
+    def append(row):
+        for append_to in appends:
+            append_to(row)
+
+    return append
+
+
+def group_rows(rows, grouping: _Grouping, chains: List[_Chain]) -> _Group:
+    """
+    Builds groups of all aggregation levels in a single pass over rows.
+    """
+    root = _new_group(len(grouping.nested))
+    chains_appends = [(chain, chain.key, {}) for chain in chains]
+    for chain, path_key, path_appends in chains_appends:
+        if len(chains_appends) > 1:
+            break
+        # schemas without sibling aggregate objects are grouped by one chain
+        for row in rows:
+            path = path_key(row)
+            append = path_appends.get(path)
+            if append is None:
+                append = path_appends[path] = _appender(_locate(root, row, path, chain))
+            append(row)
+        return root
+
+    for row in rows:
+        for chain, path_key, path_appends in chains_appends:
+            path = path_key(row)
+            append = path_appends.get(path)
+            if append is None:
+                append = path_appends[path] = _appender(_locate(root, row, path, chain))
+            append(row)
+    return root
+
+
+def _compile_grouped(field: SchemaFieldType, grouping: _Grouping, columns: Columns):
+    """
+    Compiles schema field into a function (record, group, selected_data) -> response item.
+    Aggregate objects of the field become nested levels of grouping.
+    """
+    if isinstance(field, Field):
+        getter = itemgetter(columns.positions[field.db_name])
+        return lambda record, group, selected_data: getter(record)
+    elif isinstance(field, Select):
+        endpoint = field.endpoint
+        return lambda record, group, selected_data: selected_data.get_data(endpoint, record)
+    elif isinstance(field, Object):
+        if field.aggregate and not field.many:
+            raise ValueError(f"Aggregation on non many field: {field}")
+
+        slot, object_grouping = grouping.add_nested(field.aggregation_field) if field.aggregate else (None, grouping)
+        keys = tuple(field.fields.keys())
+        if _only_fields(field):
+            convert_record = _record_converter(field, columns)
+
+            def convert_object(record, group, selected_data):
+                return convert_record(record)
+        else:
+            converters = [_compile_grouped(value, object_grouping, columns) for value in field.fields.values()]
+
+            def convert_object(record, group, selected_data):
+                return dict(zip(keys, [convert(record, group, selected_data) for convert in converters]))
+
+        if not field.aggregate and not field.many:
+            return convert_object
+        if not field.aggregate and field.many and _only_fields(field):
+            grouping.keeps_rows = True
+            convert_records = _records_converter(field, columns)
+            return lambda record, group, selected_data: convert_records(group)
+        if not field.aggregate and field.many:
+            grouping.keeps_rows = True
+            return lambda record, group, selected_data: [
+                convert_object(item, group, selected_data) for item in group
+            ]
+        return lambda record, group, selected_data: [
+            convert_object(child[0], child, selected_data) for child in group.children[slot].values()
+        ]
+    else:
+        raise ValueError(f"Unknown schema field type: {field}")
+
+
+def compile_aggregated_converter(schema: SchemaFieldType, key: str) -> Converter:
+    """
+    Compiles schema of aggregated endpoint into a converter of functions (rows, selected_data) -> response items.
+    Rows are grouped by the endpoint key and by aggregate objects at once, then items are built from the groups.
+    """
+    return Converter(lambda columns: _compile_aggregated(schema, key, columns))
+
+
+def _compile_aggregated(schema: SchemaFieldType, key: str, columns: Columns):
+    grouping = _Grouping(None)
+    _, key_grouping = grouping.add_nested(key)
+    convert = _compile_grouped(schema, key_grouping, columns)
+    chains = _chains(grouping, columns)
+
+    def convert_rows(rows, selected_data):
+        root = group_rows(rows, grouping, chains)
+        return [convert(group[0], group, selected_data) for group in root.children[0].values()]
+
+    return convert_rows
@@ -0,0 +1,156 @@
+import contextlib
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.db import InterfaceError, OperationalError
+
+from api.connection_pool import PoolTimeout
+
+logger = logging.getLogger(__name__)
+
+PRIMARY = 'primary'
+
+
+class _Server:
+    def __init__(self, name, alias):
+        self.name = name
+        self.alias = alias
+        self.in_flight = 0
+        self.failures = 0
+        self.down_until = 0.0
+        self.queries = 0
+        self.failed_queries = 0
+
+    def is_up(self, now):
+        return self.down_until <= now
+
+
+class DatabaseRouter:
+    """
+    Routes queries across galaxy_db servers by name: the primary and replicas.
+    A query goes to the balanced server with the fewest queries in flight, and fails over to the others
+    when the server is unreachable. Servers failing max_failures times in a row are skipped for retry_after seconds.
+    """
+
+    def __init__(self, servers: Dict[str, str], balanced: List[str], max_failures: int, retry_after: float):
+        if not balanced or not set(balanced) <= set(servers):
+            raise ValueError(f'Invalid balanced database servers: {balanced} of {list(servers)}')
+        self._servers = {name: _Server(name, alias) for name, alias in servers.items()}
+        self.balanced = balanced
+        self.max_failures = max_failures
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._turn = 0
+
+    @property
+    def names(self):
+        return list(self._servers)
+
+    def candidates(self, pinned: Optional[str] = None) -> List[_Server]:
+        """
+        Servers to try in order: healthy balanced servers by load, other healthy servers, then servers that are down
+        """
+        if pinned is not None:
+            return [self._servers[pinned]]
+        with self._lock:
+            now = time.monotonic()
+            self._turn = (self._turn + 1) % len(self.balanced)
+            # rotation spreads queries between servers with the same load
+            names = self.balanced[self._turn:] + self.balanced[:self._turn]
+            balanced = sorted((self._servers[name] for name in names), key=lambda server: server.in_flight)
+            others = [server for name, server in self._servers.items() if name not in self.balanced]
+            servers = balanced + others
+            return [server for server in servers if server.is_up(now)] + \
+                [server for server in servers if not server.is_up(now)]
+
+    def execute(self, pinned: Optional[str], func: Callable):
+        """
+        Result of func called with database alias of a chosen server, the next candidate is tried on connection errors.
+        Busy servers whose pools have no free connections are not failed over.
+        """
+        candidates = self.candidates(pinned)
+        for idx, server in enumerate(candidates):
+            try:
+                with self._in_flight(server):
+                    result = func(server.alias)
+            except PoolTimeout:
+                raise
+            except (OperationalError, InterfaceError):
+                self._failed(server)
+                if idx == len(candidates) - 1:
+                    raise
+                logger.warning(f'Query failed on database server {server.name}, failing over', exc_info=True)
+                continue
+            self._succeeded(server)
+            return result
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                name: dict(
+                    alias=server.alias,
+                    balanced=name in self.balanced,
+                    up=server.is_up(now),
+                    in_flight=server.in_flight,
+                    queries=server.queries,
+                    failed_queries=server.failed_queries,
+                    failures_in_row=server.failures,
+                )
+                for name, server in self._servers.items()
+            }
+
+    @contextlib.contextmanager
+    def _in_flight(self, server):
+        with self._lock:
+            server.in_flight += 1
+            server.queries += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                server.in_flight -= 1
+
+    def _succeeded(self, server):
+        with self._lock:
+            server.failures = 0
+            server.down_until = 0.0
+
+    def _failed(self, server):
+        with self._lock:
+            server.failures += 1
+            server.failed_queries += 1
+            if server.failures >= self.max_failures:
+                server.down_until = time.monotonic() + self.retry_after
+                logger.error(f'Database server {server.name} is down, it is skipped for {self.retry_after}s')
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> DatabaseRouter:
+    global _router
+    with _router_lock:
+        if _router is None:
+            servers = dict({PRIMARY: 'galaxy_db'}, **settings.GALAXY_DB_REPLICAS)
+            balanced = list(settings.GALAXY_DB_REPLICAS)
+            if settings.DATABASE_READ_PRIMARY or not balanced:
+                balanced.insert(0, PRIMARY)
+            _router = DatabaseRouter(servers, balanced, settings.DATABASE_MAX_FAILURES,
+                                     settings.DATABASE_RETRY_AFTER_SECONDS)
+        return _router
+
+
+def server_names() -> List[str]:
+    return [PRIMARY] + list(settings.GALAXY_DB_REPLICAS)
+
+
+def execute(pinned: Optional[str], func: Callable):
+    """
+    Result of func called with alias of the galaxy_db server chosen for a query, pinned is the name of a required server
+    """
+    return get_router().execute(pinned, func)
@@ -1,6 +1,6 @@
 from dataclasses import dataclass, field
 from enum import Enum
-from typing import Union, Optional, Dict, List
+from typing import Union, Optional, Dict, List, Any
 
 
 class TypeEnum(Enum):
@@ -26,6 +26,20 @@ class TypeEnum(Enum):
             raise ValueError(f"Unknown TypeEnum value: {value}")
 
 
+class PaginationMode(Enum):
+    OFFSET = 'offset'
+    KEYSET = 'keyset'
+
+    @classmethod
+    def create(cls, value):
+        if value == cls.OFFSET.value:
+            return PaginationMode.OFFSET
+        elif value == cls.KEYSET.value:
+            return PaginationMode.KEYSET
+        else:
+            raise ValueError(f"Unknown PaginationMode value: {value}")
+
+
 SchemaFieldType = Union['Object', 'Select', 'Field']
 
 
@@ -90,6 +104,15 @@ def _collect_selects(field: SchemaFieldType):
         return []
 
 
+@dataclass
+class CachePolicy:
+    enabled: bool = True
+    # seconds, global CACHE_TIMEOUT when not specified
+    sql_timeout: Optional[int] = None
+    response_timeout: Optional[int] = None
+    cache_empty: bool = True
+
+
 @dataclass
 class Endpoint:
     name: str
@@ -98,12 +121,32 @@ class Endpoint:
     key: Optional[str]
     description: Optional[str]
     pagination_enabled: bool = False
+    pagination_mode: PaginationMode = PaginationMode.OFFSET
     aggregation_enabled: bool = False
+    streaming_enabled: bool = False
+    # seconds, global QUERY_TIMEOUT when not specified, 0 means no limit
+    timeout: Optional[int] = None
+    # name of galaxy_db server (primary or a replica) all queries of endpoint go to, balanced when not specified
+    database: Optional[str] = None
+    # rows of a query result, global MAX_ROWS when not specified, 0 means no limit
+    max_rows: Optional[int] = None
+    cache: CachePolicy = field(default_factory=CachePolicy)
 
     params: List[Parameter] = field(default_factory=list)
     sql_params: List[SQLParameter] = field(default_factory=list)
 
     selects: List[Select] = field(init=False)
+    # compiled query_execution.Query, filled by load_endpoints
+    query: Any = field(init=False, default=None, repr=False)
+    # hash of description, SQL and versions of selected endpoints, filled by load_endpoints
+    version: str = field(init=False, default='', repr=False)
+    # compiled converters.Converter
+    converter: Any = field(init=False, repr=False)
+    # not Optional: dacite would reset Optional fields to None after __post_init__
+    aggregated_converter: Any = field(init=False, repr=False)
 
     def __post_init__(self):
-        self.selects = _collect_selects(self.schema)
\ No newline at end of file
+        from api.converters import compile_converter, compile_aggregated_converter
+        self.selects = _collect_selects(self.schema)
+        self.converter = compile_converter(self.schema)
+        self.aggregated_converter = compile_aggregated_converter(self.schema, self.key) if self.aggregation_enabled else None
\ No newline at end of file
@@ -1,7 +1,16 @@
-from typing import List
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Callable
 
+from django.conf import settings
+from django.db import close_old_connections
+
+from api import metrics
 from api.endpoint import Select
 from api.endpoint_loader import EndpointStorage
+from api.rows import Rows
 
 
 class _EndpointDataWrapper:
@@ -9,23 +18,24 @@ class _EndpointDataWrapper:
         self.select_from_endpoint = select_from_endpoint
         self._endpoint = EndpointStorage.endpoints[select_from_endpoint.endpoint]
         self._parameters = sorted(self.select_from_endpoint.params.items())
+        # values of parameters in rows, rows of the select have the columns of the rows it is loaded for
+        self._selection_key = None
         self.endpoint_data = {}
 
-    def _selection_key(self, data):
-        key = [
-            (name, data[field])
-            for name, field in self._parameters
-        ]
-        return tuple(key)
-
-    def load_for(self, data):
+    def load_for(self, data: Rows):
         from api.endpoint_processor import EndpointProcessor
         processor = EndpointProcessor(self._endpoint)
 
-        key_set = set([self._selection_key(row) for row in data])
-        for key in key_set:
-            value = processor.process(dict(key), request=None, disable_pagination=True)
-            self.endpoint_data[key] = value
+        if not data:
+            # empty results may come without columns, e.g. of streams or of selects from empty results
+            return self.endpoint_data
+
+        self._selection_key = data.columns.getter([field for _, field in self._parameters])
+        names = [name for name, _ in self._parameters]
+        keys = list(set(map(self._selection_key, data)))
+        metrics.SELECT_FANOUT.observe(len(keys), select=self._endpoint.name)
+        values = processor.process_many([dict(zip(names, key)) for key in keys])
+        self.endpoint_data.update(zip(keys, values))
 
         return self.endpoint_data
 
@@ -34,6 +44,55 @@ class _EndpointDataWrapper:
         return self.endpoint_data[key]
 
 
+_executor = None
+_executor_lock = threading.Lock()
+_worker = threading.local()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.SELECT_THREAD_POOL_SIZE,
+                                           thread_name_prefix='select-loader')
+        return _executor
+
+
+def _in_worker():
+    return getattr(_worker, 'active', False)
+
+
+def _run_in_worker(context, func):
+    _worker.active = True
+    try:
+        return context.run(func)
+    finally:
+        _worker.active = False
+        # database connections are per thread, they are released like at the end of a request
+        close_old_connections()
+
+
+def run_concurrently(functions: List[Callable], limit: int) -> list:
+    """
+    Results of functions called in threads of the shared pool, at most limit at a time.
+    Functions called from pool threads are called one by one in the calling thread, so the pool never waits for itself.
+    """
+    if len(functions) <= 1 or limit <= 1 or _in_worker():
+        return [func() for func in functions]
+
+    executor = _get_executor()
+    futures = []
+    running = set()
+    for func in functions:
+        if len(running) >= limit:
+            _, running = wait(running, return_when=FIRST_COMPLETED)
+        future = executor.submit(_run_in_worker, contextvars.copy_context(), func)
+        futures.append(future)
+        running.add(future)
+    wait(futures)
+    return [future.result() for future in futures]
+
+
 class EndpointSelectWrapper:
     def __init__(self, endpoints: List[Select]):
         self.endpoints_data_wrappers = {
@@ -41,10 +100,16 @@ class EndpointSelectWrapper:
             for endpoint_select in endpoints
         }
 
-    def load(self, data):
-        for data_wrapper in self.endpoints_data_wrappers.values():
-            data_wrapper.load_for(data)
+    def load(self, data: Rows):
+        """
+        Loads data of independent selects concurrently, at most SELECT_CONCURRENCY at a time.
+        Selects nested in loaded endpoints are loaded in the same worker thread.
+        """
+        run_concurrently([
+            functools.partial(data_wrapper.load_for, data)
+            for data_wrapper in self.endpoints_data_wrappers.values()
+        ], settings.SELECT_CONCURRENCY)
 
-    def get_data(self, endpoint_name, data: dict):
+    def get_data(self, endpoint_name, data: tuple):
         data_wrapper = self.endpoints_data_wrappers[endpoint_name]
         return data_wrapper.get_data(data)
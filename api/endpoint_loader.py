@@ -1,10 +1,15 @@
+import copy
+import hashlib
 import os
+import threading
+
 import yaml
 
 from dacite import Config, from_dict
 
 from django.conf import settings
 
+from api import database_router, query_execution
 from api.endpoint import *
 
 
@@ -21,33 +26,150 @@ def validate_pagination_key(endpoints):
             raise ValueError(f'Pagination enabled for endpoint withou key specified: {endpoint}')
 
 
+def validate_streaming(endpoints):
+    for endpoint in endpoints.values():
+        if endpoint.streaming_enabled and (endpoint.pagination_enabled or endpoint.aggregation_enabled):
+            raise ValueError(f'Streaming enabled for endpoint with pagination or aggregation: {endpoint.name}')
+
+
+def validate_database(endpoints):
+    servers = database_router.server_names()
+    for endpoint in endpoints.values():
+        if endpoint.database is not None and endpoint.database not in servers:
+            raise ValueError(f'Unknown database server {endpoint.database} of endpoint {endpoint.name}, '
+                             f'expected one of {servers}')
+
+
 class EndpointStorage:
     endpoints: Dict[str, Endpoint] = None
 
 
-def load_endpoints():
+class _LoadedFile:
+    """
+    Endpoint parsed from a description file, stamps of the file and of its SQL tell whether they changed since
+    """
+
+    def __init__(self, stamps, endpoint: Endpoint, digest: str):
+        self.stamps = stamps
+        self.endpoint = endpoint
+        self.digest = digest
+
+
+_loaded: Dict[str, _LoadedFile] = {}
+_load_lock = threading.Lock()
+
+
+def _stamp(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _sql_path(endpoint: Endpoint):
+    return os.path.join(settings.QUERIES_DIR, 'sql', endpoint.sql)
+
+
+def _stamps(file, endpoint: Endpoint):
+    return _stamp(file), _stamp(_sql_path(endpoint))
+
+
+def _description_files():
     files = (
         os.path.join(settings.QUERIES_DIR, file)
         for file in os.listdir(settings.QUERIES_DIR)
     )
-    files = [file for file in files if os.path.isfile(file) and file.endswith('.yaml')]
-    endpoints = {}
+    return [file for file in files if os.path.isfile(file) and file.endswith('.yaml')]
+
+
+def _parse(file) -> _LoadedFile:
     config = Config(forward_references={
         'Object': Object,
         'Select': Select,
         'Field': Field
     }, type_hooks={
-        TypeEnum: TypeEnum.create
+        TypeEnum: TypeEnum.create,
+        PaginationMode: PaginationMode.create
     })
-    for file in files:
-        with open(file) as f:
-            data = yaml.safe_load(f)
-            endpoint = from_dict(data_class=Endpoint, data=data, config=config)
-            endpoints[endpoint.name] = endpoint
+    description_stamp = _stamp(file)
+    with open(file, 'rb') as f:
+        content = f.read()
+    try:
+        data = yaml.safe_load(content)
+        endpoint = from_dict(data_class=Endpoint, data=data, config=config)
+        sql_stamp = _stamp(_sql_path(endpoint))
+        endpoint.query = query_execution.Query.load(
+            endpoint.sql, endpoint.timeout, endpoint.database, endpoint.max_rows
+        )
+    except Exception as e:
+        raise ValueError(f'Invalid endpoint description {file}: {e}') from e
+    digest = hashlib.sha256(content + b'\0' + endpoint.query.sql.encode('utf8')).hexdigest()
+    return _LoadedFile((description_stamp, sql_stamp), endpoint, digest)
+
+
+def _versions(endpoints: Dict[str, Endpoint], digests: Dict[str, str]) -> Dict[str, str]:
+    """
+    Versions of endpoints: hashes of their descriptions, SQL and versions of endpoints they select from
+    """
+    versions = {}
+
+    def version(name, visiting):
+        if name in versions:
+            return versions[name]
+        if name in visiting:
+            return digests[name]
+        selected = sorted({version(select.endpoint, visiting | {name}) for select in endpoints[name].selects})
+        versions[name] = hashlib.sha256('|'.join([digests[name]] + selected).encode('utf8')).hexdigest()[:16]
+        return versions[name]
+
+    for name in endpoints:
+        version(name, frozenset())
+    return versions
+
+
+def files_changed() -> bool:
+    """
+    Whether description files or their SQL changed since endpoints were loaded
+    """
+    files = _description_files()
+    with _load_lock:
+        if set(files) != set(_loaded):
+            return True
+        return any(_stamps(file, loaded.endpoint) != loaded.stamps for file, loaded in _loaded.items())
+
+
+def load_endpoints():
+    """
+    Loads endpoints of description files in QUERIES_DIR, only files changed since the previous load are parsed again.
+    Endpoints replace the registry at once after they are validated, the registry is kept when they are invalid.
+    """
+    with _load_lock:
+        loaded = {}
+        for file in _description_files():
+            previous = _loaded.get(file)
+            if previous is not None and _stamps(file, previous.endpoint) == previous.stamps:
+                loaded[file] = previous
+            else:
+                loaded[file] = _parse(file)
+        endpoints = {item.endpoint.name: item.endpoint for item in loaded.values()}
+
+        validate_selects(endpoints)
+        validate_pagination_key(endpoints)
+        validate_streaming(endpoints)
+        validate_database(endpoints)
 
-    validate_selects(endpoints)
-    validate_pagination_key(endpoints)
+        versions = _versions(endpoints, {item.endpoint.name: item.digest for item in loaded.values()})
+        for item in loaded.values():
+            version = versions[item.endpoint.name]
+            if item.endpoint.version and item.endpoint.version != version:
+                # endpoint may be in use by requests of the previous registry, so it is changed in a copy
+                item.endpoint = copy.copy(item.endpoint)
+            item.endpoint.version = version
+        endpoints = {item.endpoint.name: item.endpoint for item in loaded.values()}
 
-    EndpointStorage.endpoints = endpoints
+        _loaded.clear()
+        _loaded.update(loaded)
+        EndpointStorage.endpoints = endpoints
 
-    return endpoints
+        return endpoints
@@ -1,14 +1,13 @@
 import datetime
-from collections import defaultdict
-from typing import List, Dict, Any
+import itertools
 
 from django.conf import settings
 from django.core.exceptions import SuspiciousOperation
 
-from api import query_execution
-from api.endpoint import SchemaFieldType, Field, Select, Object, TypeEnum
+from api import metrics, query_execution, rows, server_timing
+from api.endpoint import TypeEnum, PaginationMode
 from api.endpoint_data_wrapper import EndpointSelectWrapper
-from api.utils import replace_query_param
+from api.utils import replace_query_param, replace_query_params, encode_cursor, decode_cursor
 
 
 class EndpointProcessor:
@@ -16,36 +15,100 @@ class EndpointProcessor:
         self.endpoint = endpoint
 
     def process(self, request_params, request, disable_pagination=False):
+        with metrics.labels(endpoint=self.endpoint.name):
+            return self._process(request_params, request, disable_pagination)
+
+    def _process(self, request_params, request, disable_pagination):
         sql_parameters, sql_required_parameters = self.process_parameters(request_params)
-        query = query_execution.Query(self.endpoint.sql)
+        query = self.endpoint.query
 
         page = None
         if self.endpoint.pagination_enabled and not disable_pagination:
-            page_number = int(request_params.get(settings.PAGE_QUERY_PARAM, 0))
-            page_size = int(request_params.get(settings.PAGE_SIZE_QUERY_PARAM, settings.DEFAULT_PAGE_SIZE))
-            page = query_execution.Page(self.endpoint.key, page_size, page_number)
+            page = self.page(request_params)
 
-        sql_page = None if self.endpoint.aggregation_enabled else page
-        query_result = query_execution.execute_query(query, sql_required_parameters, sql_parameters, sql_page)
+        with server_timing.phase('query'):
+            query_result = query_execution.execute_query(
+                query, sql_required_parameters, sql_parameters, page, self.endpoint.cache
+            )
 
         selected_data = EndpointSelectWrapper(self.endpoint.selects)
-        selected_data.load(query_result)
-
-        if self.endpoint.aggregation_enabled:
-            data = self.convert_data_aggregated(query_result, selected_data)
-            if self.endpoint.pagination_enabled and not disable_pagination:
-                idx_from = page.number * page.size
-                idx_to = (page.number + 1) * page.size
-                data = data[idx_from:idx_to]
-        else:
-            data = self.convert_data(query_result, selected_data)
+        with server_timing.phase('select'):
+            selected_data.load(query_result)
+
+        data = self.convert(query_result, selected_data)
 
+        if self.endpoint.pagination_enabled and not disable_pagination and page.keyset:
+            keys = [query_result.value(record, self.endpoint.key) for record in query_result[:1] + query_result[-1:]]
+            return self.paginate_keyset(request, data, page, keys)
         if self.endpoint.pagination_enabled and not disable_pagination:
             data_with_pagination = self.paginate(request, data, page)
             return data_with_pagination
         else:
             return data
 
+    @property
+    def streamable(self):
+        return not self.endpoint.pagination_enabled and not self.endpoint.aggregation_enabled
+
+    def process_stream(self, request_params):
+        """
+        Converted records in batches, rows are fetched from database while the batches are consumed.
+        Available for endpoints without pagination and aggregation.
+        """
+        with metrics.labels(endpoint=self.endpoint.name):
+            # batches are consumed while the response is sent, outside of the request context
+            metric_labels = metrics.current_labels()
+            sql_parameters, sql_required_parameters = self.process_parameters(request_params)
+            batches = query_execution.stream_query(
+                self.endpoint.query, sql_required_parameters, sql_parameters, metric_labels
+            )
+            # fetch first batch right away, so query errors are reported before response is started
+            first_batch = next(batches, None)
+        if first_batch is None:
+            # empty result has no batches
+            return iter([])
+        return self._convert_batches(itertools.chain([first_batch], batches), metric_labels)
+
+    def _convert_batches(self, batches, metric_labels):
+        for query_result in batches:
+            with metrics.labels(**metric_labels):
+                selected_data = EndpointSelectWrapper(self.endpoint.selects)
+                if query_result:
+                    selected_data.load(query_result)
+                with metrics.CONVERSION_SECONDS.time():
+                    converted = self.convert_data(query_result, selected_data)
+            yield converted
+
+    def process_many(self, requests_params):
+        """
+        Unpaginated data for each of requests parameters.
+        Queries for all parameters and nested selects are executed in batches.
+        """
+        with metrics.labels(endpoint=self.endpoint.name):
+            return self._process_many(requests_params)
+
+    def _process_many(self, requests_params):
+        parameters = [self.process_parameters(request_params) for request_params in requests_params]
+        query_results = query_execution.execute_batch_query(self.endpoint.query, [
+            (sql_required_parameters, sql_parameters)
+            for sql_parameters, sql_required_parameters in parameters
+        ], self.endpoint.cache)
+
+        if query_results:
+            # results from cache may have columns in other order than executed ones
+            columns = query_results[0].columns
+            query_results = [query_result.with_columns(columns) for query_result in query_results]
+        selected_data = EndpointSelectWrapper(self.endpoint.selects)
+        selected_data.load(rows.concat(query_results))
+
+        return [self.convert(query_result, selected_data) for query_result in query_results]
+
+    def convert(self, query_result, selected_data: EndpointSelectWrapper):
+        with metrics.CONVERSION_SECONDS.time():
+            if self.endpoint.aggregation_enabled:
+                return self.convert_data_aggregated(query_result, selected_data)
+            return self.convert_data(query_result, selected_data)
+
     def validate_parameter(self, param, param_name: str, param_type: TypeEnum):
         if param_type in (TypeEnum.STRING, TypeEnum.INT, TypeEnum.BOOL):
             converters = {TypeEnum.STRING: str, TypeEnum.INT: int, TypeEnum.BOOL: bool}
@@ -101,6 +164,50 @@ class EndpointProcessor:
 
         return sql_parameters, sql_required_parameters
 
+    def page(self, request_params):
+        page_size = int(request_params.get(settings.PAGE_SIZE_QUERY_PARAM, settings.DEFAULT_PAGE_SIZE))
+        if self.endpoint.pagination_mode == PaginationMode.KEYSET:
+            after = request_params.get(settings.PAGE_AFTER_QUERY_PARAM)
+            before = request_params.get(settings.PAGE_BEFORE_QUERY_PARAM)
+            return query_execution.Page(
+                self.endpoint.key, page_size, 0, keyset=True,
+                after=decode_cursor(after) if after is not None else None,
+                before=decode_cursor(before) if before is not None else None,
+                aggregated=self.endpoint.aggregation_enabled
+            )
+        page_number = int(request_params.get(settings.PAGE_QUERY_PARAM, 0))
+        return query_execution.Page(
+            self.endpoint.key, page_size, page_number, aggregated=self.endpoint.aggregation_enabled
+        )
+
+    def paginate_keyset(self, request, data, page, keys):
+        """
+        Pagination links of keyset pages refer to the first and the last keys of current page.
+        """
+        url = request.build_absolute_uri()
+        is_full = len(data) == page.size
+        has_prev = is_full if page.backward else page.after is not None
+        has_next = True if page.backward else is_full
+        prev_link, next_link = None, None
+        if has_prev and keys:
+            prev_link = replace_query_params(url, {
+                settings.PAGE_BEFORE_QUERY_PARAM: encode_cursor(keys[0]),
+                settings.PAGE_AFTER_QUERY_PARAM: None
+            })
+        if has_next and keys:
+            next_link = replace_query_params(url, {
+                settings.PAGE_AFTER_QUERY_PARAM: encode_cursor(keys[-1]),
+                settings.PAGE_BEFORE_QUERY_PARAM: None
+            })
+
+        return {
+            'has_next': next_link is not None,
+            'has_prev': prev_link is not None,
+            'prev': prev_link,
+            'next': next_link,
+            self.endpoint.name: data
+        }
+
     def paginate(self, request, data, page):
         url = request.build_absolute_uri()
         has_prev = page.number > 0
@@ -119,69 +226,13 @@ class EndpointProcessor:
             self.endpoint.name: data
         }
 
-    def convert_single_record(self, record, field: SchemaFieldType, selected_data: EndpointSelectWrapper):
-        if isinstance(field, Field):
-            return record[field.db_name]
-        elif isinstance(field, Select):
-            return selected_data.get_data(field.endpoint, record)
-        elif isinstance(field, Object):
-            return {
-                key: self.convert_single_record(record, value, selected_data)
-                for key, value in field.fields.items()
-            }
-        else:
-            raise ValueError(f"Unknown schema field type: {field}")
+    def convert_data(self, data: rows.Rows, selected_data: EndpointSelectWrapper):
+        if not data:
+            return []
+        convert = self.endpoint.converter.bind(data.columns)
+        return [convert(record, selected_data) for record in data]
 
-    def convert_data(self, data: List[Dict[str, Any]], selected_data: EndpointSelectWrapper):
-        return [
-            self.convert_single_record(record, self.endpoint.schema, selected_data)
-            for record in data
-        ]
-
-    def convert_single_record_aggregated(self, record, all_data, field: SchemaFieldType,
-                                         selected_data: EndpointSelectWrapper):
-        if isinstance(field, Field):
-            return record[field.db_name]
-        elif isinstance(field, Select):
-            return selected_data.get_data(field.endpoint, record)
-        elif isinstance(field, Object):
-            if not field.aggregate and not field.many:
-                return {
-                    key: self.convert_single_record_aggregated(record, all_data, value, selected_data)
-                    for key, value in field.fields.items()
-                }
-            if not field.aggregate and field.many:
-                return [
-                    {
-                        key: self.convert_single_record_aggregated(record, all_data, value, selected_data)
-                        for key, value in field.fields.items()
-                    } for record in all_data
-                ]
-            if field.aggregate and field.many:
-                data = defaultdict(list)
-                for item in all_data:
-                    key = item[field.aggregation_field]
-                    data[key].append(item)
-                aggregated_data = list(data.values())
-
-                return [
-                    {
-                        key: self.convert_single_record_aggregated(records[0], records, value, selected_data)
-                        for key, value in field.fields.items()
-                    }
-                    for records in aggregated_data
-                ]
-            raise ValueError(f"Aggregation on non many field: {field}")
-
-        else:
-            raise ValueError(f"Unknown schema field type: {field}")
-
-    def convert_data_aggregated(self, data: List[Dict[str, Any]], selected_data: EndpointSelectWrapper):
-        result_data = defaultdict(list)
-        for item in data:
-            key = item[self.endpoint.key]
-            result_data[key].append(item)
-        return [
-            self.convert_single_record_aggregated(records[0], records, self.endpoint.schema, selected_data)
-            for records in result_data.values()
-        ]
+    def convert_data_aggregated(self, data: rows.Rows, selected_data: EndpointSelectWrapper):
+        if not data:
+            return []
+        return self.endpoint.aggregated_converter.bind(data.columns)(data, selected_data)
@@ -0,0 +1,86 @@
+import threading
+import time
+from collections import OrderedDict
+
+GENERATION_KEY = 'galaxy.api.query.generation'
+
+
+class LocalCache:
+    """
+    Bounded LRU cache of query results inside the worker process, in front of the shared cache.
+    Entries expire after timeout seconds. All workers drop their entries when generation in the shared cache changes,
+    generation is checked at most once per check_interval seconds.
+    """
+
+    def __init__(self, shared_cache, max_entries: int, max_rows: int, timeout: float, check_interval: float):
+        self.shared_cache = shared_cache
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self._entries = OrderedDict()
+        self._rows = 0
+        self._generation = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        self._check_generation(now)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, result = entry
+            if expires_at <= now:
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return result
+
+    def set(self, key, result):
+        if not self.enabled or len(result) > self.max_rows:
+            return
+        expires_at = time.monotonic() + self.timeout
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = expires_at, result
+            self._rows += len(result)
+            while len(self._entries) > self.max_entries or self._rows > self.max_rows:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._rows -= len(evicted)
+
+    def invalidate(self):
+        """
+        Drops entries of local caches in all workers
+        """
+        try:
+            self.shared_cache.incr(GENERATION_KEY)
+        except ValueError:
+            self.shared_cache.add(GENERATION_KEY, 1, timeout=None)
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._rows = 0
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._rows -= len(entry[1])
+
+    def _check_generation(self, now):
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        generation = self.shared_cache.get(GENERATION_KEY, 0)
+        if self._generation is not None and generation != self._generation:
+            self.clear()
+        self._generation = generation
@@ -0,0 +1,104 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib import parse
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import RequestFactory
+from django.urls import resolve, Resolver404
+
+from api import access_history, query_execution
+
+
+def read_paths(file_name):
+    with open(file_name, encoding='utf8') as paths_file:
+        return [
+            line.strip()
+            for line in paths_file
+            if line.strip() and not line.startswith('#')
+        ]
+
+
+def warm(path, host, secure):
+    """
+    Executes request bypassing cached results, returns response status
+    """
+    try:
+        match = resolve(parse.urlsplit(path).path)
+    except Resolver404:
+        return 404
+    headers = {'HTTP_' + settings.API_KEY_HEADER_NAME.upper().replace('-', '_'): settings.API_KEY}
+    request = RequestFactory().get(path, secure=secure, HTTP_HOST=host, **headers)
+    # popularity of requests is not raised by warming them
+    access_history.mark_warming(request)
+    try:
+        with query_execution.forced_refresh():
+            response = match.func(request, *match.args, **match.kwargs)
+            if response.streaming:
+                # streamed responses are not cached, the query is released with the response
+                response.close()
+                return 'streamed responses are not cached'
+            if hasattr(response, 'render'):
+                response.render()
+        return response.status_code
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Populates query and response caches with configured or most popular requests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=settings.CACHE_WARMING_FILE,
+                            help='File with request paths to warm, one per line')
+        parser.add_argument('--history', action='store_true',
+                            help='Warm the most popular requests from access history')
+        parser.add_argument('--top', type=int, default=100, help='Number of popular requests to warm')
+        parser.add_argument('--hours', type=int, default=settings.ACCESS_HISTORY_HOURS,
+                            help='Popularity is counted for the last hours')
+        parser.add_argument('--concurrency', type=int, default=4, help='Requests executed at the same time')
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Repeat warming every interval seconds, should be less than cache timeouts')
+        parser.add_argument('--host', default='localhost', help='Host clients request, it is a part of cache keys')
+        parser.add_argument('--secure', action='store_true', help='Clients request https')
+
+    def paths(self, options):
+        paths = []
+        if options['file']:
+            paths += read_paths(options['file'])
+        if options['history']:
+            paths += access_history.popular(options['hours'], options['top'])
+        return list(dict.fromkeys(paths))
+
+    def handle(self, *args, **options):
+        if not options['file'] and not options['history']:
+            raise CommandError('Nothing to warm: specify --file or --history')
+        while True:
+            self.warm_all(self.paths(options), options)
+            if options['interval'] is None:
+                return
+            time.sleep(options['interval'])
+
+    def warm_all(self, paths, options):
+        def timed_warm(path):
+            start = time.monotonic()
+            try:
+                status = warm(path, options['host'], options['secure'])
+            except Exception as e:
+                status = repr(e)
+            return path, status, time.monotonic() - start
+
+        start = time.monotonic()
+        warmed = 0
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            for path, status, duration in executor.map(timed_warm, paths):
+                if status == 200:
+                    warmed += 1
+                    self.stdout.write(f'{duration:8.3f}s {path}')
+                else:
+                    self.stderr.write(f'{duration:8.3f}s {path} failed: {status}')
+        if warmed:
+            # workers drop local copies of results refreshed in the shared cache
+            query_execution.local_cache.invalidate()
+        self.stdout.write(f'Warmed {warmed} of {len(paths)} requests in {time.monotonic() - start:.3f}s')
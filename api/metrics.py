@@ -0,0 +1,179 @@
+import contextlib
+import contextvars
+import json
+import logging
+import math
+import threading
+import time
+from collections import defaultdict
+from typing import Tuple, Optional
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from api import server_timing
+
+logger = logging.getLogger(__name__)
+
+METRICS_KEY = 'galaxy.api.metrics'
+
+_labels = contextvars.ContextVar('metrics_labels', default={})
+_metrics = {}
+_pending = defaultdict(float)
+_pending_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+@contextlib.contextmanager
+def labels(**values):
+    """
+    Metrics observed inside the context, including nested selects loaded in worker threads, get the labels
+    """
+    token = _labels.set({**_labels.get(), **values})
+    try:
+        yield
+    finally:
+        _labels.reset(token)
+
+
+def current_labels():
+    return dict(_labels.get())
+
+
+def _add(field, amount):
+    if not settings.METRICS_ENABLED:
+        return
+    with _pending_lock:
+        _pending[field] += amount
+        due = time.monotonic() - _last_flush >= settings.METRICS_FLUSH_INTERVAL_SECONDS
+    if due:
+        flush()
+
+
+def flush():
+    """
+    Adds metrics observed by the worker process since the last flush to the metrics shared by all workers
+    """
+    global _last_flush
+    with _pending_lock:
+        pending = dict(_pending)
+        _pending.clear()
+        _last_flush = time.monotonic()
+    if not pending:
+        return
+    try:
+        pipeline = get_redis_connection('default').pipeline(transaction=False)
+        for field, amount in pending.items():
+            pipeline.hincrbyfloat(METRICS_KEY, field, amount)
+        pipeline.execute()
+    except Exception:
+        logger.warning('Failed to flush metrics', exc_info=True)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = ('endpoint', 'format')):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        _metrics[name] = self
+
+    def _labels(self, values):
+        current = {**_labels.get(), **values}
+        return [[name, str(current.get(name, ''))] for name in self.label_names]
+
+    def _add(self, suffix, sample_labels, amount):
+        # field of Redis hash, so samples of all workers are added up
+        _add(json.dumps([self.name, suffix, sample_labels]), amount)
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **label_values):
+        self._add('_total', self._labels(label_values), amount)
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, buckets: Tuple[float, ...],
+                 label_names: Tuple[str, ...] = ('endpoint', 'format'), phase: Optional[str] = None):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # name in Server-Timing header of the request, durations measured with time() are added to it
+        self.phase = phase
+
+    def observe(self, value, **label_values):
+        sample_labels = self._labels(label_values)
+        for bound in self.buckets:
+            if value <= bound:
+                self._add('_bucket', sample_labels + [['le', _format_value(bound)]], 1)
+        self._add('_sum', sample_labels, value)
+        self._add('_count', sample_labels, 1)
+
+    @contextlib.contextmanager
+    def time(self, **label_values):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start
+            self.observe(elapsed, **label_values)
+            if self.phase is not None:
+                server_timing.add(self.phase, elapsed)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _sample_order(sample):
+    suffix, sample_labels, _ = sample
+    le = [value for name, value in sample_labels if name == 'le']
+    other_labels = [label for label in sample_labels if label[0] != 'le']
+    return other_labels, suffix, float(le[0].replace('+Inf', 'inf')) if le else 0
+
+
+def render():
+    """
+    Metrics of all workers in Prometheus text format
+    """
+    flush()
+    samples = defaultdict(list)
+    for field, value in get_redis_connection('default').hgetall(METRICS_KEY).items():
+        name, suffix, sample_labels = json.loads(field)
+        samples[name].append((suffix, sample_labels, float(value)))
+
+    lines = []
+    for name, metric in sorted(_metrics.items()):
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.type}')
+        for suffix, sample_labels, value in sorted(samples[name], key=_sample_order):
+            label_pairs = ','.join(f'{label}="{_escape(label_value)}"' for label, label_value in sample_labels)
+            lines.append(f'{name}{suffix}{{{label_pairs}}} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+_SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+REQUEST_SECONDS = Histogram('galaxy_api_request_seconds', 'Time of handling requests including rendering',
+                            _SECONDS_BUCKETS)
+SQL_SECONDS = Histogram('galaxy_api_sql_seconds', 'Time of executing queries and fetching their rows',
+                        _SECONDS_BUCKETS, phase='sql')
+SQL_ROWS = Counter('galaxy_api_sql_rows', 'Rows fetched from database')
+CONVERSION_SECONDS = Histogram('galaxy_api_conversion_seconds', 'Time of converting rows to endpoint schema',
+                               _SECONDS_BUCKETS, phase='convert')
+RENDER_SECONDS = Histogram('galaxy_api_render_seconds', 'Time of rendering responses', _SECONDS_BUCKETS,
+                           phase='render')
+CACHE_REQUESTS = Counter('galaxy_api_cache_requests', 'Lookups of cached query results and responses',
+                         ('endpoint', 'format', 'cache', 'result'))
+SELECT_FANOUT = Histogram('galaxy_api_select_fanout', 'Distinct keys a nested select loads data for',
+                          (1, 5, 10, 50, 100, 500, 1000, 5000), ('endpoint', 'format', 'select'))
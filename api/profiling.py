@@ -0,0 +1,49 @@
+import contextlib
+import cProfile
+import marshal
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from api.utils import http_headers
+
+
+def _key(profile_id):
+    return f'galaxy.api.profile.{profile_id}'
+
+
+def is_admin(request):
+    admin_key = settings.ADMIN_API_KEY
+    return admin_key is not None and http_headers(request).get(settings.ADMIN_KEY_HEADER_NAME) == admin_key
+
+
+def requested(request):
+    return bool(http_headers(request).get(settings.PROFILE_HEADER_NAME)) and is_admin(request)
+
+
+@contextlib.contextmanager
+def profiled(request):
+    """
+    Profiles code executed inside the context if an admin requested it, yields id of the stored profile or None
+    """
+    if not requested(request):
+        yield None
+        return
+    profile_id = uuid.uuid4().hex
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profile_id
+    finally:
+        profiler.disable()
+        profiler.create_stats()
+        # the format of cProfile.Profile.dump_stats, readable with pstats
+        cache.set(_key(profile_id), marshal.dumps(profiler.stats), settings.PROFILE_TIMEOUT_SECONDS)
+
+
+def load(profile_id):
+    """
+    Stored profile in pstats format, None if it is expired or unknown
+    """
+    return cache.get(_key(profile_id))
@@ -1,18 +1,107 @@
+import contextlib
+import contextvars
 import hashlib
+import logging
+import math
 import os
 import re
-from typing import Union, List, Dict, Any
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Union, List, Dict, Tuple, Iterator, Optional
 
 import sqlparse
 from django.conf import settings
-from django.db import connections
+from django.db import connections, OperationalError
 from django.utils import encoding
+from django.utils.functional import cached_property
 from django.core.cache import cache
+from django_redis import get_redis_connection
+from rest_framework.exceptions import APIException
+
+from api import cache_codec, connection_pool, database_router, metrics
+from api.endpoint import CachePolicy
+from api.local_cache import LocalCache
+from api.rows import Columns, Rows
+
+logger = logging.getLogger(__name__)
 
 
 class Query:
-    def __init__(self, name: str):
+    """
+    SQL of an endpoint compiled once at load time.
+    Filters and pagination are spliced into the stored text without reparsing.
+    """
+
+    def __init__(self, name: str, sql: str, timeout: Optional[float] = None, database: Optional[str] = None,
+                 max_rows: Optional[int] = None):
         self.name = name
+        self.sql = sql
+        # seconds, QUERY_TIMEOUT_SECONDS when not specified
+        self.timeout = timeout
+        # name of galaxy_db server, see database_router
+        self.database = database
+        # rows of a result, MAX_ROWS when not specified
+        self.max_rows = max_rows
+        # results cached for other SQL of the query are not used
+        self.version = hashlib.sha256(encoding.force_bytes(sql)).hexdigest()[:16]
+        analyzed = _SqlQuery(sql)
+        self.required_params_count = analyzed.count_required_params()
+        self.filters_allowed = analyzed.may_apply_filters()
+        self.batch_allowed = self.filters_allowed and not analyzed.has_order_by()
+        self._head, self._where_condition, self._tail = analyzed.filters_placement()
+        # required params placed after spliced filters (e.g. in HAVING)
+        self._trailing_params_count = _SqlQuery(self._tail).count_required_params() if self.filters_allowed else 0
+
+    @classmethod
+    def load(cls, name: str, timeout: Optional[float] = None, database: Optional[str] = None,
+             max_rows: Optional[int] = None):
+        with open(os.path.join(settings.QUERIES_DIR, 'sql', name), encoding='utf8') as sql_file:
+            return cls(name, sql_file.read(), timeout, database, max_rows)
+
+    def with_filters(self, filters: List[str]) -> str:
+        if not filters or not self.filters_allowed:
+            return self.sql
+        conditions = ' AND '.join(filters)
+        if self._where_condition is None:
+            return f'{self._head}\nWHERE {conditions}\n{self._tail}'
+        return f'{self._head}({self._where_condition}) AND {conditions}{self._tail}'
+
+    def arrange_values(self, required_values: list, filter_values: list) -> list:
+        if not filter_values or not self._trailing_params_count:
+            return required_values + filter_values
+        split = len(required_values) - self._trailing_params_count
+        return required_values[:split] + filter_values + required_values[split:]
+
+    def render(self, filters: List[str], page: 'Page') -> str:
+        sql = self.with_filters(filters)
+        if page is not None and page.aggregated:
+            sql = _paginate_aggregated(sql, page)
+        elif page is not None and page.keyset:
+            sql = _paginate_keyset(sql, page.pagination_key, page.size, bool(page.get_value()), page.backward)
+        elif page is not None:
+            sql = _paginate(sql, page.pagination_key, page.size, page.number)
+        return sql
+
+    def render_batch(self, filters: List[str], keys_count: int, values_count: int) -> str:
+        """
+        Query for several parameter sets at once.
+        Every placeholder of the query refers to a column of the VALUES table,
+        so each row of the result is tagged with index of its parameter set.
+        """
+        columns = [f'p{idx}' for idx in range(values_count)]
+        references = iter([f'{_BATCH_KEYS_ALIAS}.{column}' for column in columns])
+        sql = re.sub('%s', lambda _: next(references), self.with_filters(filters))
+        values_row = '(' + ', '.join(['%s'] * (values_count + 1)) + ')'
+        values = ', '.join([values_row] * keys_count)
+        keys_columns = ', '.join([BATCH_INDEX_COLUMN] + columns)
+        return f"""SELECT {_BATCH_KEYS_ALIAS}.{BATCH_INDEX_COLUMN}, query.*
+        FROM (VALUES {values}) AS {_BATCH_KEYS_ALIAS} ({keys_columns})
+        CROSS APPLY (
+        {sql}
+        ) query
+        """
 
 
 class Param:
@@ -36,16 +125,201 @@ class RequiredParam:
 
 
 class Page:
-    def __init__(self, pagination_key: str, size: int, number: int):
+    def __init__(self, pagination_key: str, size: int, number: int, keyset=False, after=None, before=None,
+                 aggregated=False):
         self.pagination_key = pagination_key
         self.size = size
         self.number = number
+        self.keyset = keyset
+        self.aggregated = aggregated
+        self.after = after
+        self.before = before
+
+    @property
+    def backward(self):
+        return self.keyset and self.before is not None
+
+    def get_value(self):
+        if not self.keyset:
+            return []
+        cursor = self.before if self.backward else self.after
+        return [] if cursor is None else [cursor]
+
+
+BATCH_INDEX_COLUMN = '__batch_index'
+_BATCH_KEYS_ALIAS = '__batch_keys'
+PAGE_RANK_COLUMN = '__page_rank'
+
+# SQL Server accepts at most 2100 parameters per statement
+_MAX_BATCH_PARAMS = 2000
+
+_LOCK_POLL_INTERVAL_SECONDS = 0.05
+
+_DEFAULT_CACHE_POLICY = CachePolicy()
+
+_refresh_forced = contextvars.ContextVar('refresh_forced', default=False)
+
+local_cache = LocalCache(
+    cache,
+    max_entries=settings.LOCAL_CACHE_MAX_ENTRIES,
+    max_rows=settings.LOCAL_CACHE_MAX_ROWS,
+    timeout=settings.LOCAL_CACHE_TIMEOUT_SECONDS,
+    check_interval=settings.LOCAL_CACHE_CHECK_INTERVAL_SECONDS,
+)
+
+
+def _is_sqlite():
+    """
+    galaxy_db is a SQLite stand-in for SQL Server, as in benchmarks. Engine is checked to not load the backend.
+    """
+    return settings.DATABASES['galaxy_db']['ENGINE'] == 'django.db.backends.sqlite3'
+
+
+def _paginate(sql, pagination_key, page_size, page_number):
+    limit = f'OFFSET {page_number * page_size} ROWS FETCH NEXT {page_size}  ROWS ONLY'
+    if _is_sqlite():
+        limit = f'LIMIT {page_size} OFFSET {page_number * page_size}'
+    return f"""SELECT * FROM (
+        {sql}
+        ) query
+        ORDER BY {pagination_key}
+        {limit}
+        """
+
+
+def _paginate_keyset(sql, pagination_key, page_size, has_cursor, backward):
+    comparison, order = ('<', 'DESC') if backward else ('>', 'ASC')
+    condition = f'WHERE {pagination_key} {comparison} %s' if has_cursor else ''
+    limit = f'LIMIT {page_size}' if _is_sqlite() else f'OFFSET 0 ROWS FETCH NEXT {page_size} ROWS ONLY'
+    return f"""SELECT * FROM (
+        {sql}
+        ) query
+        {condition}
+        ORDER BY {pagination_key} {order}
+        {limit}
+        """
+
+
+def _paginate_aggregated(sql, page: Page):
+    """
+    Page of aggregated endpoint contains all rows of page.size distinct keys.
+    """
+    key = page.pagination_key
+    comparison, order = ('<', 'DESC') if page.backward else ('>', 'ASC')
+    condition = f'WHERE {key} {comparison} %s' if page.get_value() else ''
+    first_rank = 0 if page.keyset else page.number * page.size
+    return f"""SELECT * FROM (
+        SELECT query.*, DENSE_RANK() OVER (ORDER BY {key} {order}) AS {PAGE_RANK_COLUMN} FROM (
+        {sql}
+        ) query
+        {condition}
+        ) ranked
+        WHERE {PAGE_RANK_COLUMN} > {first_rank} AND {PAGE_RANK_COLUMN} <= {first_rank + page.size}
+        ORDER BY {key} {order}
+        """
+
+
+class QueryTimeout(APIException):
+    status_code = 504
+    default_detail = 'Request took too long, try to narrow it down with parameters or pagination'
+    default_code = 'query_timeout'
+
+
+class TooManyRows(APIException):
+    status_code = 400
+    default_code = 'too_many_rows'
+
+    def __init__(self, query_name: str, max_rows: int):
+        super().__init__(f'Result has more than {max_rows} rows, narrow it down with parameters or use pagination')
+        self.query_name = query_name
+        self.max_rows = max_rows
+
+
+def _max_rows(max_rows: Optional[int]) -> int:
+    """
+    Rows a query result may have, 0 if it is not limited
+    """
+    return settings.MAX_ROWS if max_rows is None else max_rows
+
+
+_deadline = contextvars.ContextVar('deadline', default=None)
+
+
+@contextlib.contextmanager
+def deadline(seconds: float):
+    """
+    Queries executed inside the context, including queries of nested selects, are cancelled when seconds pass
+    """
+    token = _deadline.set(time.monotonic() + seconds if seconds else None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time() -> Optional[float]:
+    request_deadline = _deadline.get()
+    if request_deadline is None:
+        return None
+    return request_deadline - time.monotonic()
+
+
+def _query_timeout(timeout: Optional[float]) -> float:
+    """
+    Seconds query may take within the query timeout and the request deadline, 0 if it is not limited
+    """
+    timeout = settings.QUERY_TIMEOUT_SECONDS if timeout is None else timeout
+    remaining = remaining_time()
+    if remaining is None:
+        return timeout
+    if remaining <= 0:
+        raise QueryTimeout()
+    return min(timeout, remaining) if timeout else remaining
+
+
+@contextlib.contextmanager
+def _cancelled_after(connection, timeout: float):
+    """
+    Cancels statements executed inside the context by the database driver when timeout passes
+    """
+    if not timeout:
+        yield
+        return
+    query_deadline = time.monotonic() + timeout
+    if connection.vendor == 'microsoft':
+        # pyodbc cancels statements running longer than timeout of the connection, whole seconds only
+        connection.connection.timeout = math.ceil(timeout)
+    elif connection.vendor == 'sqlite':
+        connection.connection.set_progress_handler(lambda: time.monotonic() > query_deadline, 1000)
+    try:
+        yield
+    except OperationalError as e:
+        if time.monotonic() >= query_deadline:
+            raise QueryTimeout() from e
+        raise
+    finally:
+        if connection.vendor == 'microsoft':
+            connection.connection.timeout = 0
+        elif connection.vendor == 'sqlite':
+            connection.connection.set_progress_handler(None, 0)
 
 
 class _SqlQuery:
-    def __init__(self, sql):
+    _FILTERS_INSERTED_BEFORE = ('GROUP BY', 'HAVING', 'ORDER BY')
+
+    def __init__(self, sql, timeout: Optional[float] = None, database: Optional[str] = None,
+                 max_rows: Optional[int] = None, name: Optional[str] = None):
         self.sql = sql
-        self.tokens = sqlparse.parse(sql)
+        self.timeout = timeout
+        # name of galaxy_db server the query is pinned to, balanced between servers when not specified
+        self.database = database
+        self.max_rows = max_rows
+        # name of the endpoint query it is built from
+        self.name = name
+
+    @cached_property
+    def tokens(self):
+        return sqlparse.parse(self.sql)
 
     def count_required_params(self):
         return len(re.findall('(%s)', self.sql))
@@ -61,45 +335,39 @@ class _SqlQuery:
             return False
         return True
 
-    def add_filters(self, filters):
-        if not filters:
-            return
-        statement = self.tokens[0]
-        where_token = statement.token_matching(lambda tk: isinstance(tk, sqlparse.sql.Where), 0)
-        filter_tokens = [sqlparse.sql.Token(sqlparse.tokens.Comparison, it) for it in filters]
-        and_token = sqlparse.sql.Token(sqlparse.tokens.Keyword, 'AND')
-        whitespace = sqlparse.sql.Token(sqlparse.tokens.Whitespace, ' ')
-        where_tk = sqlparse.sql.Token(sqlparse.tokens.Keyword, 'WHERE')
-
-        def combine_filters_with_and(need_trailing):
-            result = []
-            if need_trailing:
-                result += [whitespace, and_token, whitespace]
-
-            for tk in filter_tokens[:-1]:
-                result += [tk, whitespace, and_token, whitespace]
-
-            result += [filter_tokens[-1]]
-            return result
-
-        if where_token is None:
-            where_token = sqlparse.sql.Where([where_tk, whitespace] + combine_filters_with_and(False))
-            statement.tokens.append(where_token)
-        else:
-            where_token.tokens += combine_filters_with_and(True)
-
-        self.sql = str(statement)
-        self.tokens = sqlparse.parse(self.sql)
-
-    def paginate(self, pagination_key, page_size, page_number):
-        paginated_sql = f"""SELECT * FROM (
-        {self.sql}
-        ) query
-        ORDER BY {pagination_key}
-        OFFSET {page_number * page_size} ROWS FETCH NEXT {page_size}  ROWS ONLY
+    def filters_placement(self):
         """
-        self.sql = paginated_sql
-        self.tokens = sqlparse.parse(paginated_sql)
+        Split query text around the place where filters go.
+        Returns (head, where condition, tail); condition is None when query has no WHERE clause.
+        """
+        if not self.may_apply_filters():
+            return self.sql, None, ''
+        offset = 0
+        for token in self.tokens[0].tokens:
+            token_text = str(token)
+            if isinstance(token, sqlparse.sql.Where):
+                keyword = token.tokens[0]
+                where_text = token_text[len(str(keyword)):]
+                condition_start = offset + len(str(keyword)) + len(where_text) - len(where_text.lstrip())
+                # trailing comments stay after the condition, a line comment would swallow the closing parenthesis
+                condition_end = length = offset
+                for leaf in token.flatten():
+                    length += len(str(leaf))
+                    if not leaf.is_whitespace and leaf.ttype not in sqlparse.tokens.Comment:
+                        condition_end = length
+                return self.sql[:condition_start], self.sql[condition_start:condition_end], self.sql[condition_end:]
+            if token.ttype in sqlparse.tokens.Keyword and token.normalized in self._FILTERS_INSERTED_BEFORE:
+                return self.sql[:offset].rstrip(), None, self.sql[offset:]
+            offset += len(token_text)
+        stripped = self.sql.rstrip()
+        return stripped, None, self.sql[len(stripped):]
+
+    def has_order_by(self):
+        return any(
+            token.ttype in sqlparse.tokens.Keyword and token.normalized == 'ORDER BY'
+            for statement in self.tokens
+            for token in statement.tokens
+        )
 
     @staticmethod
     def _fix_percents_signs(query):
@@ -108,22 +376,85 @@ class _SqlQuery:
         query_text = query_text.replace('<$parameter_placeholder$>', '%s')
         return query_text
 
-    def execute(self, required_params, params):
+    def execute(self, params):
         sql = self._fix_percents_signs(self.sql)
-        with connections['galaxy_db'].cursor() as cursor:
-            cursor.execute(sql, required_params + params)
-            columns = [col[0] for col in cursor.description]
-            return [
-                dict(zip(columns, row))
-                for row in cursor.fetchall()
-            ]
+        return database_router.execute(self.database, lambda alias: self._execute_on(alias, sql, params))
+
+    def _execute_on(self, alias, sql, params):
+        timeout = _query_timeout(self.timeout)
+        max_rows = _max_rows(self.max_rows)
+        with connection_pool.connection(alias) as connection, connection.cursor() as cursor:
+            with _cancelled_after(connection, timeout), metrics.SQL_SECONDS.time():
+                cursor.execute(sql, params)
+                rows = Rows(Columns.of_cursor(cursor))
+                # rows are kept as fetched, chunks limit memory of the driver's buffers
+                while True:
+                    # one row over the limit is enough to tell the result is too large
+                    remaining = max_rows + 1 - len(rows) if max_rows else settings.FETCH_SIZE
+                    chunk = cursor.fetchmany(min(settings.FETCH_SIZE, remaining))
+                    if not chunk:
+                        break
+                    rows.extend(chunk)
+                    if max_rows and len(rows) > max_rows:
+                        # the rest of the result is never fetched
+                        raise TooManyRows(self.name, max_rows)
+        metrics.SQL_ROWS.inc(len(rows))
+        return rows
+
+    def iterate(self, params, fetch_size, metric_labels=None):
+        """
+        Rows in batches of fetch_size, metric_labels are used for rows fetched outside the context of the request
+        """
+        metric_labels = metric_labels or {}
+        sql = self._fix_percents_signs(self.sql)
+
+        def execute(alias):
+            # separate connection keeps the shared one free for nested selects while rows are fetched
+            pool = connection_pool.get_pool(alias)
+            connection = pool.acquire() if pool is not None else connections[alias].copy()
+            try:
+                cursor = connection.cursor()
+                try:
+                    # rows are fetched while the response is sent, so only execution is limited
+                    timeout = _query_timeout(self.timeout)
+                    with _cancelled_after(connection, timeout), metrics.SQL_SECONDS.time(**metric_labels):
+                        cursor.execute(sql, params)
+                except BaseException:
+                    cursor.close()
+                    raise
+            except BaseException:
+                _release(pool, connection)
+                raise
+            return pool, connection, cursor
+
+        pool, connection, cursor = database_router.execute(self.database, execute)
+        try:
+            with cursor:
+                columns = Columns.of_cursor(cursor)
+                while True:
+                    rows = cursor.fetchmany(fetch_size)
+                    if not rows:
+                        break
+                    metrics.SQL_ROWS.inc(len(rows), **metric_labels)
+                    yield Rows(columns, rows)
+        finally:
+            _release(pool, connection)
+
+
+def _release(pool, connection):
+    if pool is not None:
+        pool.release(connection)
+    else:
+        connection.close()
 
 
 def _generate_cache_key(query: Query, required_params: List[RequiredParam], params: List[Param], page: Page):
     required_params_key = ','.join([f'{param.name}:{param.value}' for param in required_params])
-    params_key = ','.join([f'{param.name}:{param.value}' for param in params])
-    page_key = page and f'{page.pagination_key}:{page.size}:{page.number}'
-    key = f'{query.name}| rp {required_params_key}| p {params_key}| pg {page_key}'
+    # conditions come from endpoint descriptions, which may change without the SQL
+    params_key = ','.join([f'{param.name}:{param.condition}:{param.value}' for param in params])
+    page_key = page and f'{page.pagination_key}:{page.size}:{page.number}:{page.after!r}:{page.before!r}' \
+        f':{page.aggregated}'
+    key = f'{query.name}| v {query.version}| db {query.database}| rp {required_params_key}| p {params_key}| pg {page_key}'
     key_hash = hashlib.sha256(encoding.force_bytes(key))
     digest = key_hash.hexdigest()
     return f'galaxy.api.query.{digest}'
@@ -137,36 +468,427 @@ def _get_param_values(params):
     ]
 
 
-def _execute_query(
-        query: Query, required_params: List[RequiredParam], params: List[Param], page: Page
-) -> List[Dict[str, Any]]:
-    with open(os.path.join(settings.QUERIES_DIR, 'sql', query.name), encoding='utf8') as sql_file:
-        query_text = ''.join(sql_file.readlines())
-    sql_query = _SqlQuery(query_text)
-    required_params_count = sql_query.count_required_params()
-    if required_params_count != len(required_params):
+def _check_required_params(query: Query, required_params: List[RequiredParam]):
+    if query.required_params_count != len(required_params):
         error_msg = f'Not enough required params for query {query.name}: ' \
-            f'expected {required_params_count} actual {len(required_params)}'
+            f'expected {query.required_params_count} actual {len(required_params)}'
         raise ValueError(error_msg)
 
-    if sql_query.may_apply_filters() and params:
-        sql_query.add_filters([param.condition for param in params])
 
-    if page is not None:
-        sql_query.paginate(page.pagination_key, page.size, page.number)
+def _build_query(query: Query, required_params: List[RequiredParam], params: List[Param], page: Page):
+    _check_required_params(query, required_params)
+
+    sql = query.render([param.condition for param in params], page)
+    sql_query = _SqlQuery(sql, query.timeout, query.database, query.max_rows, query.name)
 
     required_param_values = _get_param_values(required_params)
     param_values = _get_param_values(params)
-    return sql_query.execute(required_param_values, param_values)
+    page_values = page.get_value() if page is not None else []
+    return sql_query, query.arrange_values(required_param_values, param_values) + page_values
 
 
-def execute_query(
+def _execute_query(
         query: Query, required_params: List[RequiredParam], params: List[Param], page: Page
-) -> List[Dict[str, Any]]:
-    key = _generate_cache_key(query, required_params, params, page)
-    cached_result = cache.get(key)
-    if cached_result:
+) -> Rows:
+    sql_query, values = _build_query(query, required_params, params, page)
+    # PAGE_RANK_COLUMN of aggregated pages is left in rows, converters do not read it
+    result = sql_query.execute(values)
+    if page is not None and page.backward:
+        # rows preceding the cursor are selected in descending order
+        result.reverse()
+    return result
+
+
+def _execute_batch_chunk(
+        query: Query, filters: List[str], parameters: List[Tuple[List[RequiredParam], List[Param]]]
+) -> List[Rows]:
+    keys_values = [
+        query.arrange_values(_get_param_values(required_params), _get_param_values(params))
+        for required_params, params in parameters
+    ]
+    values_count = len(keys_values[0])
+    max_rows = _max_rows(query.max_rows)
+    # the limit applies to the result of each parameter set, the batch is limited to all of them together
+    sql_query = _SqlQuery(
+        query.render_batch(filters, len(keys_values), values_count), query.timeout, query.database,
+        max_rows * len(keys_values), query.name
+    )
+    rows = sql_query.execute([
+        value
+        for idx, values in enumerate(keys_values)
+        for value in [idx] + values
+    ])
+    # BATCH_INDEX_COLUMN is the first one, results have the columns of the query
+    columns = Columns(rows.columns.names[1:])
+    results = [Rows(columns) for _ in parameters]
+    for row in rows:
+        results[row[0]].append(row[1:])
+    if max_rows and any(len(result) > max_rows for result in results):
+        raise TooManyRows(query.name, max_rows)
+    return results
+
+
+def _execute_batch(
+        query: Query, parameters: List[Tuple[List[RequiredParam], List[Param]]]
+) -> List[Rows]:
+    for required_params, _ in parameters:
+        _check_required_params(query, required_params)
+
+    results = [None] * len(parameters)
+    by_filters = defaultdict(list)
+    for idx, (required_params, params) in enumerate(parameters):
+        filters = tuple(param.condition for param in params) if query.filters_allowed else ()
+        by_filters[filters].append(idx)
+
+    for filters, indices in by_filters.items():
+        required_params, params = parameters[indices[0]]
+        values_count = len(query.arrange_values(_get_param_values(required_params), _get_param_values(params)))
+        # CROSS APPLY of batched queries is not available on SQLite
+        batched = query.batch_allowed and values_count and settings.SELECT_BATCH_SIZE > 1 and not _is_sqlite()
+        if not batched or len(indices) == 1:
+            for idx in indices:
+                results[idx] = _execute_query(query, *parameters[idx], None)
+            continue
+        chunk_size = min(settings.SELECT_BATCH_SIZE, _MAX_BATCH_PARAMS // (values_count + 1))
+        for start in range(0, len(indices), chunk_size):
+            chunk = indices[start:start + chunk_size]
+            chunk_results = _execute_batch_chunk(query, list(filters), [parameters[idx] for idx in chunk])
+            for idx, result in zip(chunk, chunk_results):
+                results[idx] = result
+    return results
+
+
+def _lock_key(key):
+    return f'{key}.lock'
+
+
+def _acquire_lock(key):
+    """
+    Lease on recomputation of the cached result, expires by itself if its holder dies
+    """
+    token = uuid.uuid4().hex
+    if cache.add(_lock_key(key), token, settings.SQL_QUERY_CACHE_LOCK_TIMEOUT_SECONDS):
+        return token
+    return None
+
+
+# lease is deleted only by its holder, it may have expired and been taken by another process in between
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def _release_lock(key, token):
+    client = getattr(cache, 'client', None)
+    if client is None:
+        # caches local to the process, e.g. of tests and benchmarks
+        if cache.get(_lock_key(key)) == token:
+            cache.delete(_lock_key(key))
+        return
+    # keys and values are stored as the redis cache encodes them
+    get_redis_connection('default').eval(
+        _RELEASE_LOCK_SCRIPT, 1, client.make_key(_lock_key(key)), client.encode(token)
+    )
+
+
+def _fresh_timeout(policy: CachePolicy):
+    if policy.sql_timeout is None:
+        return settings.SQL_QUERY_CACHE_TIMEOUT_SECONDS
+    return policy.sql_timeout
+
+
+def _cache_timeout(policy: CachePolicy):
+    return _fresh_timeout(policy) + settings.SQL_QUERY_CACHE_STALE_SECONDS
+
+
+def _cacheable(result, policy: CachePolicy):
+    return bool(result) or policy.cache_empty
+
+
+def _cache_entry(result, policy: CachePolicy):
+    fresh_until = time.time() + _fresh_timeout(policy)
+    return fresh_until, cache_codec.encode(result)
+
+
+def _cache_entries(results: Dict[str, Rows], policy: CachePolicy):
+    """
+    Cache entries of results, results encoded into more than CACHE_MAX_ENTRY_SIZE bytes are not cached
+    """
+    entries = {}
+    for key, result in results.items():
+        if not _cacheable(result, policy):
+            continue
+        entry = _cache_entry(result, policy)
+        if settings.CACHE_MAX_ENTRY_SIZE and len(entry[1]) > settings.CACHE_MAX_ENTRY_SIZE:
+            logger.warning(f'Query result of {len(result)} rows is not cached: {len(entry[1])} bytes encoded, '
+                           f'at most {settings.CACHE_MAX_ENTRY_SIZE} are allowed')
+            continue
+        entries[key] = entry
+    return entries
+
+
+def _store(key, result, policy: CachePolicy):
+    entries = _cache_entries({key: result}, policy)
+    if entries:
+        cache.set(key, entries[key], _cache_timeout(policy))
+
+
+def _cached_result(entry, policy: CachePolicy):
+    if entry is None:
+        return None
+    result = cache_codec.decode(entry[1])
+    if not _cacheable(result, policy):
+        return None
+    return result
+
+
+def _get_cached(key, policy: CachePolicy):
+    """
+    Cached result and whether it is fresh, (None, False) on miss
+    """
+    entry = cache.get(key)
+    result = _cached_result(entry, policy)
+    if result is None:
+        return None, False
+    return result, entry[0] > time.time()
+
+
+def _in_background(target, *args):
+    def run():
+        try:
+            target(*args)
+        except Exception:
+            logger.exception('Background refresh of cached query failed')
+        finally:
+            connections.close_all()
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def _refresh(
+        key, token, query: Query, required_params: List[RequiredParam], params: List[Param], page: Page,
+        policy: CachePolicy
+):
+    try:
+        result = _execute_query(query, required_params, params, page)
+        _store(key, result, policy)
+        return result
+    finally:
+        _release_lock(key, token)
+
+
+def _lock_wait_seconds():
+    wait_seconds = settings.SQL_QUERY_CACHE_LOCK_WAIT_SECONDS
+    remaining = remaining_time()
+    if remaining is not None:
+        wait_seconds = min(wait_seconds, remaining)
+    return wait_seconds
+
+
+def _wait_for_refresh(key, policy: CachePolicy):
+    wait_until = time.monotonic() + _lock_wait_seconds()
+    while time.monotonic() < wait_until:
+        time.sleep(_LOCK_POLL_INTERVAL_SECONDS)
+        result, _ = _get_cached(key, policy)
+        if result is not None:
+            return result
+    return None
+
+
+def _execute_shared_cached(
+        key, query: Query, required_params: List[RequiredParam], params: List[Param], page: Page, policy: CachePolicy
+) -> Rows:
+    cached_result, fresh = (None, False) if refresh_forced() else _get_cached(key, policy)
+    metrics.CACHE_REQUESTS.inc(cache='query', result=_lookup_result(cached_result, fresh))
+    if fresh:
+        return cached_result
+
+    token = _acquire_lock(key)
+    if cached_result is not None:
+        if token is not None:
+            _in_background(_refresh, key, token, query, required_params, params, page, policy)
+        return cached_result
+
+    if token is not None:
+        return _refresh(key, token, query, required_params, params, page, policy)
+    cached_result = _wait_for_refresh(key, policy)
+    if cached_result is not None:
         return cached_result
     result = _execute_query(query, required_params, params, page)
-    cache.set(key, result, settings.SQL_QUERY_CACHE_TIMEOUT_SECONDS)
+    _store(key, result, policy)
+    return result
+
+
+def _lookup_result(cached_result, fresh):
+    if cached_result is None:
+        return 'miss'
+    return 'hit' if fresh else 'stale'
+
+
+@contextlib.contextmanager
+def forced_refresh():
+    """
+    Queries executed inside the context ignore cached results and cache new ones
+    """
+    token = _refresh_forced.set(True)
+    try:
+        yield
+    finally:
+        _refresh_forced.reset(token)
+
+
+def refresh_forced():
+    return _refresh_forced.get()
+
+
+def execute_query(
+        query: Query, required_params: List[RequiredParam], params: List[Param], page: Page,
+        policy: CachePolicy = _DEFAULT_CACHE_POLICY
+) -> Rows:
+    """
+    Query result cached according to the endpoint cache policy, hot results are kept in the local cache of the worker.
+    Only one worker at a time recomputes an expired result: stale results are served while it is refreshed in background,
+    on cache miss the others wait for it for SQL_QUERY_CACHE_LOCK_WAIT_SECONDS before executing query themselves.
+    """
+    if not policy.enabled:
+        return _execute_query(query, required_params, params, page)
+
+    key = _generate_cache_key(query, required_params, params, page)
+    result = None if refresh_forced() else local_cache.get(key)
+    if result is not None:
+        metrics.CACHE_REQUESTS.inc(cache='local', result='hit')
+    else:
+        result = _execute_shared_cached(key, query, required_params, params, page, policy)
+        if _cacheable(result, policy):
+            local_cache.set(key, result)
     return result
+
+
+def stream_query(
+        query: Query, required_params: List[RequiredParam], params: List[Param], metric_labels=None
+) -> Iterator[Rows]:
+    """
+    Uncached query results fetched in batches of STREAMING_FETCH_SIZE rows.
+    Query is executed when the first batch is requested.
+    """
+    sql_query, values = _build_query(query, required_params, params, None)
+    return sql_query.iterate(values, settings.STREAMING_FETCH_SIZE, metric_labels)
+
+
+def execute_batch_query(
+        query: Query, parameters: List[Tuple[List[RequiredParam], List[Param]]],
+        policy: CachePolicy = _DEFAULT_CACHE_POLICY
+) -> List[Rows]:
+    """
+    Unpaginated results of query for each of (required params, params) pairs.
+    Results are cached under the same keys as execute_query uses, and like there only one worker at a time
+    recomputes a result: missing results recomputed by others are waited for, the rest are executed in one batch.
+    """
+    if not policy.enabled:
+        return _execute_batch(query, parameters)
+
+    keys = [
+        _generate_cache_key(query, required_params, params, None)
+        for required_params, params in parameters
+    ]
+    results = [None if refresh_forced() else local_cache.get(key) for key in keys]
+    missing = [idx for idx, result in enumerate(results) if result is None]
+    if len(missing) < len(keys):
+        metrics.CACHE_REQUESTS.inc(len(keys) - len(missing), cache='local', result='hit')
+    if missing:
+        fetched = _execute_batch_shared_cached(
+            query, [keys[idx] for idx in missing], [parameters[idx] for idx in missing], policy
+        )
+        for idx, result in zip(missing, fetched):
+            results[idx] = result
+            if _cacheable(result, policy):
+                local_cache.set(keys[idx], result)
+    return results
+
+
+def _execute_batch_shared_cached(
+        query: Query, keys: List[str], parameters: List[Tuple[List[RequiredParam], List[Param]]], policy: CachePolicy
+) -> List[Rows]:
+    cached_entries = {} if refresh_forced() else cache.get_many(keys)
+    now = time.time()
+    results = [None] * len(keys)
+    stale = []
+    for idx, key in enumerate(keys):
+        entry = cached_entries.get(key)
+        results[idx] = _cached_result(entry, policy)
+        if results[idx] is not None:
+            if entry[0] <= now:
+                stale.append(idx)
+    missing = [idx for idx, result in enumerate(results) if result is None]
+    lookups = {'hit': len(keys) - len(missing) - len(stale), 'stale': len(stale), 'miss': len(missing)}
+    for result, count in lookups.items():
+        if count:
+            metrics.CACHE_REQUESTS.inc(count, cache='query', result=result)
+    tokens = {idx: _acquire_lock(keys[idx]) for idx in missing}
+    owned = [idx for idx in missing if tokens[idx] is not None]
+    if owned:
+        try:
+            _fetch_batch(query, keys, parameters, owned, results, policy)
+        finally:
+            for idx in owned:
+                _release_lock(keys[idx], tokens[idx])
+    others = [idx for idx in missing if tokens[idx] is None]
+    if others:
+        refreshed = _wait_for_batch_refresh([keys[idx] for idx in others], policy)
+        for idx in others:
+            results[idx] = refreshed.get(keys[idx])
+        # results not cached by the others in time are executed here
+        _fetch_batch(query, keys, parameters, [idx for idx in others if results[idx] is None], results, policy)
+
+    locked = [(idx, _acquire_lock(keys[idx])) for idx in stale]
+    locked = [(idx, token) for idx, token in locked if token is not None]
+    if locked:
+        _in_background(_refresh_batch, query, [(keys[idx], token, parameters[idx]) for idx, token in locked], policy)
+    return results
+
+
+def _fetch_batch(query: Query, keys: List[str], parameters: List[Tuple[List[RequiredParam], List[Param]]],
+                 fetched: List[int], results: List[Rows], policy: CachePolicy):
+    if not fetched:
+        return
+    for idx, result in zip(fetched, _execute_batch(query, [parameters[idx] for idx in fetched])):
+        results[idx] = result
+    _store_many({keys[idx]: results[idx] for idx in fetched}, policy)
+
+
+def _wait_for_batch_refresh(keys: List[str], policy: CachePolicy) -> Dict[str, Rows]:
+    """
+    Results of keys cached by other workers in time, keys without results are left out
+    """
+    wait_until = time.monotonic() + _lock_wait_seconds()
+    results = {}
+    pending = keys
+    while pending and time.monotonic() < wait_until:
+        time.sleep(_LOCK_POLL_INTERVAL_SECONDS)
+        entries = cache.get_many(pending)
+        for key in pending:
+            result = _cached_result(entries.get(key), policy)
+            if result is not None:
+                results[key] = result
+        pending = [key for key in pending if key not in results]
+    return results
+
+
+def _store_many(results: Dict[str, Rows], policy: CachePolicy):
+    entries = _cache_entries(results, policy)
+    if entries:
+        cache.set_many(entries, _cache_timeout(policy))
+
+
+def _refresh_batch(
+        query: Query, refreshed: List[Tuple[str, str, Tuple[List[RequiredParam], List[Param]]]], policy: CachePolicy
+):
+    try:
+        results = _execute_batch(query, [parameters for _, _, parameters in refreshed])
+        _store_many({key: result for (key, _, _), result in zip(refreshed, results)}, policy)
+    finally:
+        for key, token, _ in refreshed:
+            _release_lock(key, token)
@@ -0,0 +1,120 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import clear_url_caches
+from rest_framework.exceptions import APIException
+
+from api import endpoint_loader, query_execution
+from api.endpoint_loader import EndpointStorage
+
+logger = logging.getLogger(__name__)
+
+GENERATION_KEY = 'galaxy.api.endpoints.generation'
+
+
+class InvalidEndpoints(APIException):
+    status_code = 400
+    default_code = 'invalid_endpoints'
+
+
+class _Routes:
+    """
+    URL configuration of reloaded endpoints, requests are resolved with it instead of ROOT_URLCONF.
+    ROOT_URLCONF only includes api.urls, so its patterns are enough.
+    """
+
+    def __init__(self, urlpatterns):
+        self.urlpatterns = urlpatterns
+
+
+_routes = None
+_generation = None
+_checked_at = None
+_lock = threading.Lock()
+
+
+def _changes(previous, current):
+    return {
+        'added': sorted(set(current) - set(previous)),
+        'removed': sorted(set(previous) - set(current)),
+        'changed': sorted(
+            name for name in set(previous) & set(current)
+            if previous[name].version != current[name].version
+        ),
+    }
+
+
+def reload():
+    """
+    Reloads endpoints of changed description files in this worker process and swaps the routes of endpoints.
+    Returns names of added, removed and changed endpoints, the previous ones are kept when new ones are invalid.
+    """
+    global _routes
+    from api import urls
+    with _lock:
+        previous = EndpointStorage.endpoints or {}
+        endpoints = endpoint_loader.load_endpoints()
+        _routes = _Routes(urls.build_urlpatterns(endpoints))
+        # resolvers of the previous routes are dropped
+        clear_url_caches()
+    changes = _changes(previous, endpoints)
+    if any(changes.values()):
+        logger.info(f'Endpoints reloaded: {changes}')
+    return changes
+
+
+def trigger():
+    """
+    Reloads endpoints in this worker process, the other workers reload them on their next check.
+    Local caches of all workers are dropped when endpoints changed, results of previous endpoints are not used anymore.
+    """
+    global _generation
+    changes = reload()
+    if any(changes.values()):
+        query_execution.local_cache.invalidate()
+    try:
+        _generation = cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, 1, timeout=None)
+        _generation = cache.get(GENERATION_KEY, 1)
+    return changes
+
+
+def check():
+    """
+    Reloads endpoints when another worker triggered reloading or, with ENDPOINTS_WATCH, when description files changed.
+    Checks are made at most once per ENDPOINTS_CHECK_INTERVAL_SECONDS, 0 disables them.
+    """
+    global _generation, _checked_at
+    interval = settings.ENDPOINTS_CHECK_INTERVAL_SECONDS
+    now = time.monotonic()
+    if not interval or (_checked_at is not None and now - _checked_at < interval):
+        return
+    _checked_at = now
+    try:
+        generation = cache.get(GENERATION_KEY, 0)
+        triggered = _generation is not None and generation != _generation
+        _generation = generation
+        if triggered or (settings.ENDPOINTS_WATCH and endpoint_loader.files_changed()):
+            reload()
+    except Exception:
+        logger.exception('Failed to reload endpoints, the previous ones are kept')
+
+
+class ReloadMiddleware:
+    """
+    Requests are routed to the endpoints loaded last
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        check()
+        routes = _routes
+        if routes is not None:
+            request.urlconf = routes
+        return self.get_response(request)
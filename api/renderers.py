@@ -1,4 +1,8 @@
+import logging
+
+from rest_framework.compat import SHORT_SEPARATORS, LONG_SEPARATORS
 from rest_framework.exceptions import ErrorDetail
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from rest_framework_xml.renderers import XMLRenderer
 from django.utils.xmlutils import SimplerXMLGenerator
 from django.utils.encoding import force_text
@@ -8,6 +12,41 @@ from six import StringIO
 from api.endpoint import Endpoint, SchemaFieldType, Field, Select, Object
 from api.endpoint_loader import EndpointStorage
 
+logger = logging.getLogger(__name__)
+
+
+def _streaming_failed(renderer_context):
+    view = (renderer_context or {}).get('view')
+    endpoint_name = view.endpoint.name if view is not None else 'response'
+    # response is already started, the error aborts the connection so clients do not take the response as complete
+    logger.exception(f'Streaming of {endpoint_name} failed')
+
+
+class ApiJsonRenderer(JSONRenderer):
+    def render_stream(self, batches, renderer_context=None):
+        """
+        Renders batches of records into chunks of a JSON list.
+        """
+        separators = SHORT_SEPARATORS if self.compact else LONG_SEPARATORS
+        encoder = self.encoder_class(ensure_ascii=self.ensure_ascii, allow_nan=not self.strict, separators=separators)
+        item_separator = separators[0]
+        yield b'['
+        first = True
+        try:
+            for batch in batches:
+                if not batch:
+                    continue
+                chunk = item_separator.join([encoder.encode(record) for record in batch])
+                chunk = chunk.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+                if not first:
+                    chunk = item_separator + chunk
+                first = False
+                yield chunk.encode('utf-8')
+        except Exception:
+            _streaming_failed(renderer_context)
+            raise
+        yield b']'
+
 
 class ApiXmlRenderer(XMLRenderer):
     def render(self, data, accepted_media_type=None, renderer_context=None):
@@ -32,6 +71,39 @@ class ApiXmlRenderer(XMLRenderer):
         xml.endDocument()
         return stream.getvalue()
 
+    def render_stream(self, batches, renderer_context=None):
+        """
+        Renders batches of records into chunks of serialized XML.
+        """
+        endpoint: Endpoint = renderer_context['view'].endpoint
+
+        stream = StringIO()
+
+        xml = SimplerXMLGenerator(stream, self.charset, short_empty_elements=True)
+        xml.startDocument()
+        self.start_response(xml, {}, endpoint)
+        try:
+            for batch in batches:
+                self.xml_for_endpoint(xml, batch, endpoint)
+                yield self.drain(stream)
+        except Exception:
+            _streaming_failed(renderer_context)
+            # error is reported inside of the document too, it is left unclosed
+            xml.startElement('error', {})
+            xml.characters('Response is incomplete due to internal server error')
+            xml.endElement('error')
+            yield self.drain(stream)
+            raise
+        xml.endElement(endpoint.name)
+        xml.endDocument()
+        yield self.drain(stream)
+
+    def drain(self, stream):
+        content = stream.getvalue()
+        stream.seek(0)
+        stream.truncate()
+        return content.encode(self.charset)
+
     def is_error_response(self, data):
         return 'detail' in data and isinstance(data['detail'], ErrorDetail)
 
@@ -43,16 +115,18 @@ class ApiXmlRenderer(XMLRenderer):
         xml.endElement(self.root_tag_name)
 
     def render_response(self, xml, data, endpoint):
+        content = self.start_response(xml, data, endpoint)
+        self.xml_for_endpoint(xml, content, endpoint)
+        xml.endElement(endpoint.name)
+
+    def start_response(self, xml, data, endpoint):
         if endpoint.pagination_enabled:
             pagination_attributes = {key: force_text(data.get(key)) for key in ['has_next', 'has_prev', 'prev', 'next']}
-            content = data.get(endpoint.name, [])
             xml.startElement(endpoint.name, pagination_attributes)
-            self.xml_for_endpoint(xml, content, endpoint)
-            xml.endElement(endpoint.name)
+            return data.get(endpoint.name, [])
         else:
             xml.startElement(endpoint.name, {})
-            self.xml_for_endpoint(xml, data, endpoint)
-            xml.endElement(endpoint.name)
+            return data
 
     def _to_xml(self, xml, data):
         return NotImplemented
@@ -101,3 +175,53 @@ class ApiXmlRenderer(XMLRenderer):
 
     def field_is_attribute(self, field):
         return isinstance(field, Field) and field.xml_attribute
+
+
+class BatchXmlRenderer(ApiXmlRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """
+        Renders results of batch items, each item is rendered like a response of its endpoint.
+        """
+        if data is None:
+            return ''
+
+        stream = StringIO()
+
+        xml = SimplerXMLGenerator(stream, self.charset, short_empty_elements=True)
+        xml.startDocument()
+
+        if self.is_error_response(data):
+            self.render_error_response(xml, data)
+        else:
+            xml.startElement('batch', {})
+            for result in data['results']:
+                self.render_result(xml, result)
+            xml.endElement('batch')
+
+        xml.endDocument()
+        return stream.getvalue()
+
+    def render_result(self, xml, result):
+        xml.startElement('result', {'endpoint': result['endpoint'], 'status': force_text(result['status'])})
+        xml.startElement('params', {})
+        for name, value in result['params'].items():
+            xml.startElement('param', {'name': name})
+            xml.characters(force_text(value))
+            xml.endElement('param')
+        xml.endElement('params')
+        if 'error' in result:
+            xml.startElement('error', {})
+            xml.characters(force_text(result['error']))
+            xml.endElement('error')
+        else:
+            self.render_response(xml, result['data'], EndpointStorage.endpoints[result['endpoint']])
+        xml.endElement('result')
+
+
+class PlainTextRenderer(BaseRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return force_text(data).encode(self.charset)
@@ -0,0 +1,86 @@
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils import encoding
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework.settings import api_settings
+
+from api.endpoint import Endpoint
+
+logger = logging.getLogger(__name__)
+
+
+def response_timeout(endpoint: Endpoint):
+    if endpoint.cache.response_timeout is None:
+        return settings.API_RESPONSE_CACHE_TIMEOUT_SECONDS
+    return endpoint.cache.response_timeout
+
+
+def cache_key(endpoint: Endpoint, request):
+    """
+    Key of canonical request: order of query params and the way format is requested do not matter
+    """
+    params = sorted(
+        (key, values)
+        for key, values in request.query_params.lists()
+        if key != api_settings.URL_FORMAT_OVERRIDE
+    )
+    params_key = '&'.join(f'{key}={value}' for key, values in params for value in values)
+    key = f'{endpoint.name}| v {endpoint.version}| f {request.accepted_renderer.format}' \
+        f'| h {request.scheme}://{request.get_host()}| p {params_key}'
+    digest = hashlib.sha256(encoding.force_bytes(key)).hexdigest()
+    return f'galaxy.api.response.{digest}'
+
+
+def _conditional(request, response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_vary_headers(response, ['Accept'])
+    return get_conditional_response(request, etag=etag, last_modified=last_modified, response=response)
+
+
+def cached_response(request, key):
+    """
+    Response rendered earlier or 304 Not Modified if client has it already, None on cache miss
+    """
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    etag, last_modified, content_type, content = entry
+    return _conditional(request, HttpResponse(content, content_type=content_type), etag, last_modified)
+
+
+def _empty(endpoint: Endpoint, data):
+    # records of paginated responses are listed under the endpoint name
+    records = data.get(endpoint.name) if isinstance(data, dict) else data
+    return not records
+
+
+def store_on_render(request, response, key, endpoint: Endpoint):
+    """
+    Caches rendered content of response together with its hash, content of more than CACHE_MAX_ENTRY_SIZE bytes is not
+    cached, empty responses are not cached when the cache policy of endpoint disables caching of empty results
+    """
+    if not endpoint.cache.cache_empty and _empty(endpoint, response.data):
+        return response
+    timeout = response_timeout(endpoint)
+
+    def store(rendered):
+        if rendered.status_code != 200:
+            return rendered
+        if settings.CACHE_MAX_ENTRY_SIZE and len(rendered.content) > settings.CACHE_MAX_ENTRY_SIZE:
+            logger.warning(f'Response of {endpoint.name} is not cached: {len(rendered.content)} bytes rendered, '
+                           f'at most {settings.CACHE_MAX_ENTRY_SIZE} are allowed')
+            return rendered
+        etag = quote_etag(hashlib.sha256(rendered.content).hexdigest()[:32])
+        last_modified = int(time.time())
+        cache.set(key, (etag, last_modified, rendered['Content-Type'], rendered.content), timeout)
+        return _conditional(request, rendered, etag, last_modified)
+
+    response.add_post_render_callback(store)
+    return response
@@ -0,0 +1,72 @@
+from operator import itemgetter
+from typing import Any, Dict, Iterable, List, Sequence
+
+
+class Columns:
+    """
+    Names of result columns and their positions in rows, shared by all rows of a result
+    """
+    __slots__ = ('names', 'positions')
+
+    def __init__(self, names: Sequence[str]):
+        self.names = tuple(names)
+        self.positions = {name: idx for idx, name in enumerate(self.names)}
+
+    @classmethod
+    def of_cursor(cls, cursor):
+        return cls([col[0] for col in cursor.description])
+
+    def getter(self, names: Sequence[str]):
+        """
+        Function row -> tuple of values of the columns
+        """
+        if not names:
+            return lambda row: ()
+        if len(names) == 1:
+            getter = itemgetter(self.positions[names[0]])
+            return lambda row: (getter(row),)
+        return itemgetter(*[self.positions[name] for name in names])
+
+
+class Rows(list):
+    """
+    Rows of a query result: tuples of values in the order of columns, column names are stored once
+    """
+    __slots__ = ('columns',)
+
+    def __init__(self, columns: Columns, rows: Iterable[Sequence[Any]] = ()):
+        super().__init__(rows)
+        self.columns = columns
+
+    @classmethod
+    def from_dicts(cls, records: List[Dict[str, Any]]) -> 'Rows':
+        columns = Columns(records[0].keys() if records else ())
+        return cls(columns, [tuple(record.values()) for record in records])
+
+    def value(self, row, name: str):
+        return row[self.columns.positions[name]]
+
+    def dicts(self) -> List[Dict[str, Any]]:
+        return [dict(zip(self.columns.names, row)) for row in self]
+
+    def with_columns(self, columns: Columns) -> 'Rows':
+        """
+        Rows with values rearranged to the columns, the rows themselves when they already have the columns
+        """
+        if columns.names == self.columns.names:
+            return self
+        values = self.columns.getter(columns.names)
+        return Rows(columns, [values(row) for row in self])
+
+
+def concat(results: List[Rows]) -> Rows:
+    """
+    Rows of all results with the columns of the first one
+    """
+    if not results:
+        return Rows(Columns(()))
+    columns = results[0].columns
+    rows = Rows(columns)
+    for result in results:
+        rows.extend(result.with_columns(columns))
+    return rows
@@ -0,0 +1,54 @@
+import contextlib
+import contextvars
+import threading
+import time
+from typing import Optional
+
+_timings = contextvars.ContextVar('server_timings', default=None)
+
+
+class Timings:
+    """
+    Durations of request phases, durations measured in select worker threads are added up
+    """
+
+    def __init__(self):
+        self._durations = {}
+        self._lock = threading.Lock()
+
+    def add(self, phase, seconds):
+        with self._lock:
+            self._durations[phase] = self._durations.get(phase, 0) + seconds
+
+    def header(self, total_seconds):
+        with self._lock:
+            durations = list(self._durations.items())
+        phases = [f'{phase};dur={seconds * 1000:.1f}' for phase, seconds in durations]
+        return ', '.join(phases + [f'total;dur={total_seconds * 1000:.1f}'])
+
+
+@contextlib.contextmanager
+def collect(timings: Optional[Timings]):
+    """
+    Phases measured inside the context are added to timings, nothing is collected if timings is None
+    """
+    token = _timings.set(timings)
+    try:
+        yield
+    finally:
+        _timings.reset(token)
+
+
+def add(phase, seconds):
+    timings = _timings.get()
+    if timings is not None:
+        timings.add(phase, seconds)
+
+
+@contextlib.contextmanager
+def phase(name):
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        add(name, time.monotonic() - start)
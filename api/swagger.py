@@ -27,6 +27,31 @@ class ApiSwaggerAutoSchema(SwaggerAutoSchema):
         ),
     ]
 
+    keyset_pagination_parameters = [
+        openapi.Parameter(
+            name=settings.PAGE_AFTER_QUERY_PARAM,
+            description='Cursor of the page following the given one, taken from next page link',
+            required=False,
+            in_=openapi.IN_QUERY,
+            type=openapi.TYPE_STRING
+        ),
+        openapi.Parameter(
+            name=settings.PAGE_BEFORE_QUERY_PARAM,
+            description='Cursor of the page preceding the given one, taken from previous page link',
+            required=False,
+            in_=openapi.IN_QUERY,
+            type=openapi.TYPE_STRING
+        ),
+        openapi.Parameter(
+            name=settings.PAGE_SIZE_QUERY_PARAM,
+            description='Pagination page size',
+            required=False,
+            in_=openapi.IN_QUERY,
+            type=openapi.TYPE_INTEGER,
+            default=settings.DEFAULT_PAGE_SIZE
+        ),
+    ]
+
     authentication_parameters = [
         openapi.Parameter(
             settings.API_KEY_HEADER_NAME,
@@ -88,7 +113,9 @@ class ApiSwaggerAutoSchema(SwaggerAutoSchema):
             for param in endpoint.sql_params
         ]
 
-        if endpoint.pagination_enabled:
+        if endpoint.pagination_enabled and endpoint.pagination_mode == PaginationMode.KEYSET:
+            parameter_fields += self.keyset_pagination_parameters
+        elif endpoint.pagination_enabled:
             parameter_fields += self.pagination_parameters
 
         parameter_fields += self.format_parameters
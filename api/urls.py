@@ -4,11 +4,7 @@ from drf_yasg.views import get_schema_view
 from rest_framework import permissions
 
 from api import views
-
-api_endpoints = [
-    path(name, view)
-    for name, view in views.generate_endpoint_views().items()
-]
+from api.endpoint_loader import load_endpoints
 
 api_info = openapi.Info(
     title="Galaxy API",
@@ -16,15 +12,32 @@ api_info = openapi.Info(
     license=openapi.License(name="GNU General Public License v3.0"),
 )
 
-schema_view = get_schema_view(
-    api_info,
-    public=True,
-    permission_classes=(permissions.AllowAny,),
-    patterns=api_endpoints
-)
 
-urlpatterns = [
-    path('', schema_view.with_ui('swagger'))
-]
+def build_urlpatterns(endpoints):
+    """
+    Routes of endpoints and service views, rebuilt when endpoints are reloaded
+    """
+    api_endpoints = [
+        path(name, view)
+        for name, view in views.generate_endpoint_views(endpoints).items()
+    ]
+
+    schema_view = get_schema_view(
+        api_info,
+        public=True,
+        permission_classes=(permissions.AllowAny,),
+        patterns=api_endpoints
+    )
+
+    return [
+        path('', schema_view.with_ui('swagger')),
+        path('_batch', views.BatchView.as_view()),
+        path('_status/pools', views.PoolStatsView.as_view()),
+        path('_status/databases', views.DatabaseStatusView.as_view()),
+        path('_metrics', views.MetricsView.as_view()),
+        path('_profiles/<str:profile_id>', views.ProfileView.as_view()),
+        path('_endpoints/reload', views.ReloadView.as_view()),
+    ] + api_endpoints
+
 
-urlpatterns += api_endpoints
+urlpatterns = build_urlpatterns(load_endpoints())
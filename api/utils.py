@@ -1,7 +1,12 @@
+import base64
+import binascii
+import json
 import time
 
 from urllib import parse
 
+from django.core.exceptions import SuspiciousOperation
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils.encoding import force_str
 
 
@@ -9,10 +14,14 @@ def replace_query_params(url, params: dict):
     """
     Given a URL and a key/val pair, set or replace an item in the query
     parameters of the URL, and return the new URL.
+    Items with None value are removed.
     """
     (scheme, netloc, path, query, fragment) = parse.urlsplit(force_str(url))
     query_dict = parse.parse_qs(query, keep_blank_values=True)
     for key, val in params.items():
+        if val is None:
+            query_dict.pop(force_str(key), None)
+            continue
         query_dict[force_str(key)] = [force_str(val)]
     query = parse.urlencode(sorted(list(query_dict.items())), doseq=True)
     return parse.urlunsplit((scheme, netloc, path, query, fragment))
@@ -27,6 +36,22 @@ def replace_query_path(url, new_path):
     return parse.urlunsplit((scheme, netloc, new_path, '', ''))
 
 
+def encode_cursor(value):
+    """
+    Opaque url-safe representation of a pagination key value.
+    """
+    serialized = json.dumps([value], cls=DjangoJSONEncoder)
+    return base64.urlsafe_b64encode(serialized.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        value, = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        return value
+    except (binascii.Error, UnicodeError, ValueError, TypeError):
+        raise SuspiciousOperation(f"Incorrect pagination cursor: {cursor}")
+
+
 class HttpHeaders:
     HTTP_PREFIX = 'HTTP_'
     # PEP 333 gives two headers which aren't prepended with HTTP_.
@@ -1,18 +1,26 @@
+import logging
+import time
+
 from django.conf import settings
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
+from django.http import StreamingHttpResponse, HttpResponse, Http404
+from django.template.response import SimpleTemplateResponse
 from rest_framework import permissions
 from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from api import access_history, connection_pool, database_router, metrics, profiling, query_execution
+from api import reloading, response_cache, server_timing
 from api.endpoint import Endpoint
 from api.endpoint_loader import load_endpoints
+from api.batch_processor import BatchProcessor
 from api.endpoint_processor import EndpointProcessor
-from api.renderers import ApiXmlRenderer
+from api.renderers import ApiJsonRenderer, ApiXmlRenderer, BatchXmlRenderer, PlainTextRenderer
 from api.swagger import ApiSwaggerAutoSchema
 from api.utils import http_headers
 
+logger = logging.getLogger(__name__)
+
 
 class ApiKeyPermission(permissions.BasePermission):
 
@@ -29,22 +37,206 @@ class ApiKeyPermission(permissions.BasePermission):
         return True
 
 
-class EndpointView(APIView):
-    renderer_classes = [JSONRenderer, ApiXmlRenderer]
+class AdminKeyPermission(permissions.BasePermission):
+
+    def has_permission(self, request, view):
+        return profiling.is_admin(request)
+
+
+class MeasuredResponse(Response):
+    """
+    Response recording time of its rendering
+    """
+
+    @property
+    def rendered_content(self):
+        view = self.renderer_context['view']
+        with server_timing.collect(view.timings):
+            with metrics.RENDER_SECONDS.time(endpoint=view.metrics_name, format=self.accepted_renderer.format):
+                return super().rendered_content
+
+
+class MeasuredView(APIView):
+    """
+    View recording time of handling requests, including rendering of their responses.
+    Responses break the time down in Server-Timing header if SERVER_TIMING_ENABLED,
+    requests of admins with the profile header are profiled.
+    """
+    metrics_name = None
+    timings = None
+
+    def dispatch(self, request, *args, **kwargs):
+        start = time.monotonic()
+        self.timings = server_timing.Timings() if settings.SERVER_TIMING_ENABLED else None
+        with profiling.profiled(request) as profile_id:
+            with server_timing.collect(self.timings):
+                response = super().dispatch(request, *args, **kwargs)
+            if profile_id is not None and isinstance(response, SimpleTemplateResponse):
+                # rendering is profiled too
+                response = response.render()
+        if profile_id is not None:
+            response[settings.PROFILE_HEADER_NAME] = profile_id
+        renderer = getattr(self.request, 'accepted_renderer', None)
+        metric_labels = dict(endpoint=self.metrics_name, format=renderer.format if renderer else '')
+
+        def observe(rendered):
+            elapsed = time.monotonic() - start
+            metrics.REQUEST_SECONDS.observe(elapsed, **metric_labels)
+            if self.timings is not None:
+                rendered['Server-Timing'] = self.timings.header(elapsed)
+            return rendered
+
+        if isinstance(response, SimpleTemplateResponse) and not response.is_rendered:
+            response.add_post_render_callback(observe)
+        else:
+            observe(response)
+        return response
+
+    def handle_request(self, request, handler):
+        with metrics.labels(endpoint=self.metrics_name, format=request.accepted_renderer.format):
+            with query_execution.deadline(settings.REQUEST_TIMEOUT_SECONDS):
+                return handler()
+
+
+class EndpointView(MeasuredView):
+    renderer_classes = [ApiJsonRenderer, ApiXmlRenderer]
     permission_classes = (ApiKeyPermission,)
 
     endpoint: Endpoint = None
     swagger_schema = ApiSwaggerAutoSchema
 
-    @method_decorator(cache_page(settings.API_RESPONSE_CACHE_TIMEOUT_SECONDS))
+    @property
+    def metrics_name(self):
+        return self.endpoint.name
+
     def get(self, request, *args, **kwargs):
+        return self.handle_request(request, lambda: self.respond(request))
+
+    def respond(self, request):
         request_params = request.GET
-        result = EndpointProcessor(self.endpoint).process(request_params, request)
-        return Response(result)
+        processor = EndpointProcessor(self.endpoint)
+        renderer = request.accepted_renderer
+        if self.endpoint.streaming_enabled and hasattr(renderer, 'render_stream'):
+            batches = processor.process_stream(request_params)
+            return self.streaming_response(renderer, batches)
+        try:
+            return self.respond_loaded(request, processor)
+        except query_execution.TooManyRows as e:
+            # results too large to be loaded at once are streamed when the endpoint allows it
+            own_query = e.query_name == self.endpoint.query.name
+            if not own_query or not processor.streamable or not hasattr(renderer, 'render_stream'):
+                raise
+            logger.warning(f'Result of {self.endpoint.name} has more than {e.max_rows} rows, streaming it')
+            return self.streaming_response(renderer, processor.process_stream(request_params))
+
+    def respond_loaded(self, request, processor: EndpointProcessor):
+        request_params = request.GET
+        if not self.endpoint.cache.enabled:
+            return MeasuredResponse(processor.process(request_params, request))
+
+        access_history.record(request)
+        key = response_cache.cache_key(self.endpoint, request)
+        cached = None if query_execution.refresh_forced() else response_cache.cached_response(request, key)
+        metrics.CACHE_REQUESTS.inc(cache='response', result='miss' if cached is None else 'hit')
+        if cached is not None:
+            return cached
+        result = processor.process(request_params, request)
+        return response_cache.store_on_render(request, MeasuredResponse(result), key, self.endpoint)
+
+    def streaming_response(self, renderer, batches):
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f'{content_type}; charset={renderer.charset}'
+        content = renderer.render_stream(batches, self.get_renderer_context())
+        return StreamingHttpResponse(content, content_type=content_type)
+
+
+class BatchView(MeasuredView):
+    """
+    Results of many endpoint requests: POST a list of {"endpoint": name, "params": {name: value}} items
+    """
+    renderer_classes = [ApiJsonRenderer, BatchXmlRenderer]
+    permission_classes = (ApiKeyPermission,)
+    swagger_schema = None
+    metrics_name = '_batch'
+
+    def post(self, request, *args, **kwargs):
+        return self.handle_request(
+            request, lambda: MeasuredResponse({'results': BatchProcessor(request).process(request.data)})
+        )
+
+
+class PoolStatsView(APIView):
+    """
+    Connection pools stats of the worker process handling the request
+    """
+    renderer_classes = [JSONRenderer]
+    permission_classes = (ApiKeyPermission,)
+    swagger_schema = None
+
+    def get(self, request, *args, **kwargs):
+        return Response(connection_pool.stats())
+
+
+class DatabaseStatusView(APIView):
+    """
+    Health and load of galaxy_db servers as seen by the worker process handling the request
+    """
+    renderer_classes = [JSONRenderer]
+    permission_classes = (ApiKeyPermission,)
+    swagger_schema = None
+
+    def get(self, request, *args, **kwargs):
+        return Response(database_router.get_router().stats())
+
+
+class MetricsView(APIView):
+    """
+    Metrics of all worker processes in Prometheus text format
+    """
+    renderer_classes = [PlainTextRenderer]
+    permission_classes = (ApiKeyPermission,)
+    swagger_schema = None
+
+    def get(self, request, *args, **kwargs):
+        return Response(metrics.render())
+
+
+class ProfileView(APIView):
+    """
+    Profile of a request in pstats format, the id is returned in the profile header of the profiled response
+    """
+    renderer_classes = [JSONRenderer]
+    permission_classes = (AdminKeyPermission,)
+    swagger_schema = None
+
+    def get(self, request, profile_id, *args, **kwargs):
+        data = profiling.load(profile_id)
+        if data is None:
+            raise Http404(f'Profile not found: {profile_id}')
+        response = HttpResponse(data, content_type='application/octet-stream')
+        response['Content-Disposition'] = f'attachment; filename="{profile_id}.prof"'
+        return response
+
+
+class ReloadView(APIView):
+    """
+    Reloads changed endpoint descriptions in all worker processes, responds with names of changed endpoints
+    """
+    renderer_classes = [JSONRenderer]
+    permission_classes = (AdminKeyPermission,)
+    swagger_schema = None
+
+    def post(self, request, *args, **kwargs):
+        try:
+            return Response(reloading.trigger())
+        except ValueError as e:
+            raise reloading.InvalidEndpoints(str(e))
 
 
-def generate_endpoint_views():
+def generate_endpoint_views(endpoints=None):
+    endpoints = load_endpoints() if endpoints is None else endpoints
     return {
         name: EndpointView.as_view(endpoint=ep)
-        for name, ep in load_endpoints().items()
+        for name, ep in endpoints.items()
     }
@@ -0,0 +1,105 @@
+"""
+Benchmark of compact cached query results against pickled lists of row dicts:
+entry sizes, encoding and decoding time, and hit ratio of a memory-bounded LRU cache
+like Redis with maxmemory and allkeys-lru.
+
+Usage: python -m benchmarks.cache_codec [rows per result]
+"""
+import bisect
+import datetime
+import itertools
+import pickle
+import random
+import sys
+import timeit
+from collections import OrderedDict
+from decimal import Decimal
+
+from api import cache_codec
+from api.rows import Rows
+
+STATUSES = ['studying', 'academic leave', 'expelled', 'graduated']
+GROUPS = [f'group {idx}' for idx in range(40)]
+
+
+def rows(count, seed=0):
+    rnd = random.Random(seed)
+    return [
+        {
+            'ID': 100000 + idx,
+            'SURNAME': f'surname {rnd.randrange(5000)}',
+            'NAME': f'name {rnd.randrange(300)}',
+            'BIRTH_DATE': datetime.date(1995, 1, 1) + datetime.timedelta(days=rnd.randrange(3000)),
+            'GROUP_NAME': rnd.choice(GROUPS),
+            'STATUS': rnd.choice(STATUSES),
+            'AVERAGE_MARK': Decimal(rnd.randrange(300, 500)) / 100,
+            'BUDGET': rnd.random() < 0.6,
+        }
+        for idx in range(count)
+    ]
+
+
+def sizes(data):
+    return len(pickle.dumps(data, pickle.HIGHEST_PROTOCOL)), len(cache_codec.encode(Rows.from_dicts(data)))
+
+
+def times(data, repeat=5):
+    pickled = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+    compact = Rows.from_dicts(data)
+    encoded = cache_codec.encode(compact)
+    return (
+        min(timeit.repeat(lambda: pickle.dumps(data, pickle.HIGHEST_PROTOCOL), number=10, repeat=repeat)) / 10,
+        min(timeit.repeat(lambda: pickle.loads(pickled), number=10, repeat=repeat)) / 10,
+        min(timeit.repeat(lambda: cache_codec.encode(compact), number=10, repeat=repeat)) / 10,
+        min(timeit.repeat(lambda: cache_codec.decode(encoded), number=10, repeat=repeat)) / 10,
+    )
+
+
+def hit_ratio(entry_sizes, budget, requests):
+    cache = OrderedDict()
+    used = hits = 0
+    for key in requests:
+        if key in cache:
+            hits += 1
+            cache.move_to_end(key)
+            continue
+        cache[key] = entry_sizes[key]
+        used += entry_sizes[key]
+        while used > budget:
+            _, evicted_size = cache.popitem(last=False)
+            used -= evicted_size
+    return hits / len(requests)
+
+
+def simulate(keys=5000, request_count=200000, budget_share=0.2, seed=0):
+    """
+    Hit ratios of the same byte budget filled with pickled and compact entries,
+    keys are requested with zipf-like popularity, results have from 1 to 200 rows
+    """
+    rnd = random.Random(seed)
+    lengths = [1, 5, 20, 50, 100, 200]
+    length_sizes = {length: sizes(rows(length, seed=length)) for length in lengths}
+    key_lengths = [rnd.choice(lengths) for _ in range(keys)]
+    pickled_sizes = [length_sizes[length][0] for length in key_lengths]
+    compact_sizes = [length_sizes[length][1] for length in key_lengths]
+
+    weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(keys)))
+    requests = [bisect.bisect(weights, rnd.random() * weights[-1]) for _ in range(request_count)]
+
+    budget = sum(pickled_sizes) * budget_share
+    return hit_ratio(pickled_sizes, budget, requests), hit_ratio(compact_sizes, budget, requests)
+
+
+def run(count=200):
+    data = rows(count)
+    return sizes(data), times(data), simulate()
+
+
+if __name__ == '__main__':
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    (pickled_size, compact_size), (dumps, loads, encode, decode), (pickled_hits, compact_hits) = run(row_count)
+    print(f'entry of {row_count} rows: pickled {pickled_size} bytes, compact {compact_size} bytes, '
+          f'x{pickled_size / compact_size:.2f} smaller')
+    print(f'  pickled: dumps {dumps * 1000:.3f}ms, loads {loads * 1000:.3f}ms')
+    print(f'  compact: encode {encode * 1000:.3f}ms, decode {decode * 1000:.3f}ms')
+    print(f'hit ratio with memory for 20% of pickled working set: pickled {pickled_hits:.3f}, compact {compact_hits:.3f}')
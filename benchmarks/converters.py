@@ -0,0 +1,164 @@
+"""
+Micro-benchmark of compiled schema converters against the recursive schema walk they replaced.
+
+Usage: python -m benchmarks.converters [rows]
+"""
+import sys
+import timeit
+from collections import defaultdict
+
+from api.endpoint import Endpoint, Object, Field, TypeEnum
+from api.rows import Rows
+
+
+def _walk(record, field, selected_data):
+    if isinstance(field, Field):
+        return record[field.db_name]
+    elif isinstance(field, Object):
+        return {
+            key: _walk(record, value, selected_data)
+            for key, value in field.fields.items()
+        }
+    raise ValueError(f"Unknown schema field type: {field}")
+
+
+def _walk_aggregated(record, all_data, field, selected_data):
+    if isinstance(field, Field):
+        return record[field.db_name]
+    if not field.aggregate and not field.many:
+        return {
+            key: _walk_aggregated(record, all_data, value, selected_data)
+            for key, value in field.fields.items()
+        }
+    if not field.aggregate and field.many:
+        return [
+            {
+                key: _walk_aggregated(record, all_data, value, selected_data)
+                for key, value in field.fields.items()
+            } for record in all_data
+        ]
+    data = defaultdict(list)
+    for item in all_data:
+        data[item[field.aggregation_field]].append(item)
+    return [
+        {
+            key: _walk_aggregated(records[0], records, value, selected_data)
+            for key, value in field.fields.items()
+        }
+        for records in data.values()
+    ]
+
+
+def _group(data, key):
+    groups = defaultdict(list)
+    for item in data:
+        groups[item[key]].append(item)
+    return groups.values()
+
+
+def _fields(*names):
+    return {name.lower(): Field(type=TypeEnum.STRING, db_name=name) for name in names}
+
+
+def flat_endpoint():
+    schema = Object(name='item', many=False, aggregate=False, aggregation_field=None,
+                    fields=_fields('ID', 'NAME', 'CODE', 'GROUP_ID', 'SUBJECT', 'VALUE'))
+    return Endpoint(name='flat', sql='flat.sql', schema=schema, key='ID', description=None)
+
+
+def nested_endpoint():
+    fields = _fields('ID', 'NAME')
+    fields['group'] = Object(name='group', many=False, aggregate=False, aggregation_field=None,
+                             fields=_fields('GROUP_ID', 'CODE'))
+    fields['marks'] = Object(name='mark', many=True, aggregate=True, aggregation_field='SUBJECT', fields={
+        'subject': Field(type=TypeEnum.STRING, db_name='SUBJECT'),
+        'values': Object(name='value', many=True, aggregate=False, aggregation_field=None, fields=_fields('VALUE')),
+    })
+    schema = Object(name='item', many=False, aggregate=False, aggregation_field=None, fields=fields)
+    return Endpoint(name='nested', sql='nested.sql', schema=schema, key='ID', description=None,
+                    aggregation_enabled=True)
+
+
+def deep_endpoint():
+    values = Object(name='value', many=True, aggregate=False, aggregation_field=None, fields=_fields('VALUE'))
+    codes = Object(name='code', many=True, aggregate=True, aggregation_field='CODE', fields={
+        'code': Field(type=TypeEnum.STRING, db_name='CODE'),
+        'values': values,
+    })
+    subjects = Object(name='subject', many=True, aggregate=True, aggregation_field='SUBJECT', fields={
+        'subject': Field(type=TypeEnum.STRING, db_name='SUBJECT'),
+        'codes': codes,
+    })
+    groups = Object(name='group', many=True, aggregate=True, aggregation_field='GROUP_ID', fields={
+        'group': Field(type=TypeEnum.STRING, db_name='GROUP_ID'),
+        'subjects': subjects,
+    })
+    schema = Object(name='item', many=False, aggregate=False, aggregation_field=None, fields={
+        'id': Field(type=TypeEnum.STRING, db_name='ID'),
+        'groups': groups,
+    })
+    return Endpoint(name='deep', sql='deep.sql', schema=schema, key='NAME', description=None,
+                    aggregation_enabled=True)
+
+
+def repeated_endpoint():
+    marks = Object(name='mark', many=True, aggregate=True, aggregation_field='SUBJECT', fields={
+        'subject': Field(type=TypeEnum.STRING, db_name='SUBJECT'),
+    })
+    history = Object(name='history', many=True, aggregate=False, aggregation_field=None, fields={
+        'value': Field(type=TypeEnum.STRING, db_name='VALUE'),
+        'marks': marks,
+    })
+    schema = Object(name='item', many=False, aggregate=False, aggregation_field=None, fields={
+        'id': Field(type=TypeEnum.STRING, db_name='ID'),
+        'history': history,
+    })
+    return Endpoint(name='repeated', sql='repeated.sql', schema=schema, key='ID', description=None,
+                    aggregation_enabled=True)
+
+
+def rows(count, rows_per_key=200):
+    return [
+        {'ID': idx // rows_per_key, 'NAME': f'name {idx // rows_per_key}', 'CODE': idx % 4,
+         'GROUP_ID': idx // rows_per_key % 13, 'SUBJECT': f'subject {idx % 10}', 'VALUE': idx}
+        for idx in range(count)
+    ]
+
+
+def run(count=100000, repeat=5):
+    data = rows(count)
+    # compiled converters take values from tuples by positions
+    compact = Rows.from_dicts(data)
+    results = {}
+
+    endpoint = flat_endpoint()
+    convert = endpoint.converter.bind(compact.columns)
+    assert [convert(record, None) for record in compact] == [_walk(record, endpoint.schema, None) for record in data]
+    results['flat'] = (
+        min(timeit.repeat(lambda: [_walk(record, endpoint.schema, None) for record in data], number=1, repeat=repeat)),
+        min(timeit.repeat(lambda: [convert(record, None) for record in compact], number=1, repeat=repeat)),
+    )
+
+    aggregated_endpoints = [
+        ('aggregated', nested_endpoint()),
+        ('deep', deep_endpoint()),
+        ('repeated', repeated_endpoint()),
+    ]
+    for name, endpoint in aggregated_endpoints:
+        def walk():
+            return [_walk_aggregated(group[0], group, endpoint.schema, None) for group in _group(data, endpoint.key)]
+
+        convert = endpoint.aggregated_converter.bind(compact.columns)
+        assert convert(compact, None) == walk()
+        results[name] = (
+            min(timeit.repeat(walk, number=1, repeat=repeat)),
+            min(timeit.repeat(lambda: convert(compact, None), number=1, repeat=repeat)),
+        )
+    return results
+
+
+if __name__ == '__main__':
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    for name, (walk_time, compiled_time) in run(row_count).items():
+        print(f'{name:>10}: recursive walk {walk_time:.3f}s, compiled {compiled_time:.3f}s, '
+              f'speedup x{walk_time / compiled_time:.2f}')
@@ -0,0 +1,107 @@
+"""
+Benchmark of query results fetched in chunks into tuples with shared columns against
+results fetched at once into a dict per row: peak memory of fetching and time of converting rows.
+
+Usage: python -m benchmarks.rows [rows]
+"""
+import sqlite3
+import sys
+import timeit
+import tracemalloc
+
+from api.endpoint import Endpoint, Object, Field, TypeEnum
+from api.rows import Columns, Rows
+
+FETCH_SIZE = 1000
+COLUMNS = ['ID', 'SURNAME', 'NAME', 'BIRTH_DATE', 'GROUP_NAME', 'STATUS', 'AVERAGE_MARK', 'BUDGET']
+
+
+def database(count):
+    connection = sqlite3.connect(':memory:')
+    connection.execute(f'CREATE TABLE STUDENTS ({", ".join(COLUMNS)})')
+    connection.executemany('INSERT INTO STUDENTS VALUES (?, ?, ?, ?, ?, ?, ?, ?)', [
+        (idx, f'surname {idx % 5000}', f'name {idx % 300}', f'199{idx % 10}-01-0{1 + idx % 9}', f'group {idx % 40}',
+         'studying', 3 + idx % 200 / 100, idx % 3 != 0)
+        for idx in range(count)
+    ])
+    return connection
+
+
+def fetch_dicts(connection):
+    cursor = connection.execute('SELECT * FROM STUDENTS')
+    columns = [col[0] for col in cursor.description]
+    rows = cursor.fetchall()
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def fetch_rows(connection):
+    cursor = connection.execute('SELECT * FROM STUDENTS')
+    rows = Rows(Columns.of_cursor(cursor))
+    while True:
+        chunk = cursor.fetchmany(FETCH_SIZE)
+        if not chunk:
+            break
+        rows.extend(chunk)
+    return rows
+
+
+def peak_memory(fetch, connection):
+    tracemalloc.start()
+    try:
+        result = fetch(connection)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return peak
+
+
+def endpoint():
+    schema = Object(name='student', many=False, aggregate=False, aggregation_field=None, fields={
+        'id': Field(type=TypeEnum.INT, db_name='ID'),
+        'name': Object(name='name', many=False, aggregate=False, aggregation_field=None, fields={
+            'surname': Field(type=TypeEnum.STRING, db_name='SURNAME'),
+            'name': Field(type=TypeEnum.STRING, db_name='NAME'),
+        }),
+        'birth_date': Field(type=TypeEnum.STRING, db_name='BIRTH_DATE'),
+        'group': Field(type=TypeEnum.STRING, db_name='GROUP_NAME'),
+        'status': Field(type=TypeEnum.STRING, db_name='STATUS'),
+        'average_mark': Field(type=TypeEnum.STRING, db_name='AVERAGE_MARK'),
+    })
+    return Endpoint(name='students', sql='students.sql', schema=schema, key='ID', description=None)
+
+
+def _dict_columns(names):
+    # converter compiled for these columns takes values from dicts by names, like before rows became tuples
+    columns = Columns(names)
+    columns.positions = {name: name for name in names}
+    return columns
+
+
+def run(count=100000, repeat=5):
+    connection = database(count)
+    dicts, rows = fetch_dicts(connection), fetch_rows(connection)
+    convert_dict = endpoint().converter.bind(_dict_columns(COLUMNS))
+    convert_row = endpoint().converter.bind(rows.columns)
+    assert [convert_dict(record, None) for record in dicts] == [convert_row(record, None) for record in rows]
+    return {
+        'peak memory': (peak_memory(fetch_dicts, connection), peak_memory(fetch_rows, connection)),
+        'fetch': (
+            min(timeit.repeat(lambda: fetch_dicts(connection), number=1, repeat=repeat)),
+            min(timeit.repeat(lambda: fetch_rows(connection), number=1, repeat=repeat)),
+        ),
+        'convert': (
+            min(timeit.repeat(lambda: [convert_dict(record, None) for record in dicts], number=1, repeat=repeat)),
+            min(timeit.repeat(lambda: [convert_row(record, None) for record in rows], number=1, repeat=repeat)),
+        ),
+    }
+
+
+if __name__ == '__main__':
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    results = run(row_count)
+    dicts_peak, rows_peak = results.pop('peak memory')
+    print(f'peak memory of {row_count} rows: dicts {dicts_peak / 2 ** 20:.1f}MiB, tuples {rows_peak / 2 ** 20:.1f}MiB, '
+          f'x{dicts_peak / rows_peak:.2f} smaller')
+    for name, (dicts_time, rows_time) in results.items():
+        print(f'{name:>8}: dicts {dicts_time:.3f}s, tuples {rows_time:.3f}s, speedup x{dicts_time / rows_time:.2f}')
@@ -0,0 +1,23 @@
+"""
+Settings of the benchmark suite: galaxy_db is a SQLite stand-in, caches are in memory.
+Paths of the stand-in database and of generated endpoints are passed by benchmarks.suite in environment.
+"""
+import os
+
+from galaxy_api.settings import *
+
+DATABASES['galaxy_db'] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': os.environ['BENCHMARK_DATABASE'],
+}
+DATABASE_POOLS = {}
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+API_KEY = 'benchmark'
+ACCESS_HISTORY_HOURS = 0
+METRICS_ENABLED = False
+SERVER_TIMING_ENABLED = False
+LOCAL_CACHE_MAX_ENTRIES = 0
@@ -0,0 +1,277 @@
+"""
+Offline benchmark suite: generated endpoints of varying shape (flat, paginated, aggregated, deeply nested selects)
+over a SQLite stand-in for galaxy_db populated with synthetic data. Measures loading of endpoints, query compilation,
+conversion, JSON and XML rendering and full requests through the Django test client.
+Results are seconds per operation, run saves them as a JSON baseline and compare flags regressions against it.
+
+Usage:
+    python -m benchmarks.suite run [--students N] [--repeat N] [--output baseline.json]
+    python -m benchmarks.suite compare baseline.json current.json [--threshold 0.1]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import timeit
+from types import SimpleNamespace
+
+import yaml
+
+SUBJECTS_COUNT = 20
+GROUPS_COUNT = 50
+MARKS_PER_STUDENT = 10
+
+
+def populate(database, students):
+    rnd = random.Random(0)
+    with sqlite3.connect(database) as connection:
+        connection.executescript("""
+            CREATE TABLE GROUPS (ID INTEGER PRIMARY KEY, CODE TEXT, FACULTY TEXT);
+            CREATE TABLE SUBJECTS (ID INTEGER PRIMARY KEY, NAME TEXT);
+            CREATE TABLE STUDENTS (ID INTEGER PRIMARY KEY, NAME TEXT, GROUP_ID INTEGER, BIRTH_DATE TEXT);
+            CREATE TABLE MARKS (ID INTEGER PRIMARY KEY, STUDENT_ID INTEGER, SUBJECT_ID INTEGER, VALUE INTEGER);
+            CREATE INDEX MARKS_STUDENT ON MARKS (STUDENT_ID);
+        """)
+        connection.executemany('INSERT INTO GROUPS VALUES (?, ?, ?)', [
+            (idx, f'group {idx}', f'faculty {idx % 5}') for idx in range(GROUPS_COUNT)
+        ])
+        connection.executemany('INSERT INTO SUBJECTS VALUES (?, ?)', [
+            (idx, f'subject {idx}') for idx in range(SUBJECTS_COUNT)
+        ])
+        connection.executemany('INSERT INTO STUDENTS VALUES (?, ?, ?, ?)', [
+            (idx, f'student {idx}', rnd.randrange(GROUPS_COUNT), f'{1990 + idx % 10}-0{1 + idx % 9}-1{idx % 10}')
+            for idx in range(students)
+        ])
+        connection.executemany('INSERT INTO MARKS VALUES (?, ?, ?, ?)', [
+            (idx, idx // MARKS_PER_STUDENT, rnd.randrange(SUBJECTS_COUNT), rnd.randrange(2, 6))
+            for idx in range(students * MARKS_PER_STUDENT)
+        ])
+
+
+def _field(db_name, type_='integer'):
+    return {'type': type_, 'db_name': db_name}
+
+
+def _object(name, fields, many=False, aggregation_field=None):
+    return {'name': name, 'many': many, 'aggregate': aggregation_field is not None,
+            'aggregation_field': aggregation_field, 'fields': fields}
+
+
+def _sql_param(name):
+    return {'name': name, 'type': 'integer', 'position': 0}
+
+
+def _students_schema():
+    return _object('student', {
+        'id': dict(_field('ID'), xml_attribute=True),
+        'name': _field('NAME', 'string'),
+        'group': _field('GROUP_ID'),
+        'birth_date': _field('BIRTH_DATE', 'string'),
+    })
+
+
+_GROUP_FILTER = {'name': 'group', 'type': 'integer', 'operation': 'eq', 'condition': 'GROUP_ID = %s',
+                 'required': False}
+
+ENDPOINTS = {
+    'groups': dict(
+        sql='SELECT ID, CODE, FACULTY FROM GROUPS WHERE ID = %s', key='ID', sql_params=[_sql_param('id')],
+        schema=_object('group', {'code': _field('CODE', 'string'), 'faculty': _field('FACULTY', 'string')}),
+    ),
+    'subjects': dict(
+        sql='SELECT ID, NAME FROM SUBJECTS WHERE ID = %s', key='ID', sql_params=[_sql_param('id')],
+        schema=_object('subject', {'id': _field('ID'), 'name': _field('NAME', 'string')}),
+    ),
+    'student_marks': dict(
+        sql='SELECT ID, SUBJECT_ID, VALUE FROM MARKS WHERE STUDENT_ID = %s', key='ID',
+        sql_params=[_sql_param('student')],
+        schema=_object('mark', {
+            'value': _field('VALUE'),
+            'subject': {'endpoint': 'subjects', 'params': {'id': 'SUBJECT_ID'}},
+        }),
+    ),
+    'flat': dict(
+        sql='SELECT ID, NAME, GROUP_ID, BIRTH_DATE FROM STUDENTS', key='ID', params=[_GROUP_FILTER],
+        schema=_students_schema(),
+    ),
+    'paginated': dict(
+        sql='SELECT ID, NAME, GROUP_ID, BIRTH_DATE FROM STUDENTS', key='ID', params=[_GROUP_FILTER],
+        pagination_enabled=True, schema=_students_schema(),
+    ),
+    'aggregated': dict(
+        sql='SELECT m.STUDENT_ID, s.NAME AS SUBJECT, m.VALUE FROM MARKS m JOIN SUBJECTS s ON s.ID = m.SUBJECT_ID',
+        key='STUDENT_ID', aggregation_enabled=True,
+        schema=_object('student', {
+            'id': dict(_field('STUDENT_ID'), xml_attribute=True),
+            'marks': _object('mark', {
+                'subject': _field('SUBJECT', 'string'),
+                'values': _object('value', {'value': _field('VALUE')}, many=True),
+            }, many=True, aggregation_field='SUBJECT'),
+        }),
+    ),
+    'nested': dict(
+        sql='SELECT ID, NAME, GROUP_ID FROM STUDENTS', key='ID', pagination_enabled=True,
+        schema=_object('student', {
+            'id': dict(_field('ID'), xml_attribute=True),
+            'name': _field('NAME', 'string'),
+            'group': {'endpoint': 'groups', 'params': {'id': 'GROUP_ID'}},
+            'marks': {'endpoint': 'student_marks', 'params': {'student': 'ID'}},
+        }),
+    ),
+}
+
+# endpoints measured, the others are only selected from
+MEASURED = ['flat', 'paginated', 'aggregated', 'nested']
+
+
+def write_endpoints(directory):
+    os.makedirs(os.path.join(directory, 'sql'))
+    for name, description in ENDPOINTS.items():
+        description = dict(description)
+        with open(os.path.join(directory, 'sql', f'{name}.sql'), 'w', encoding='utf8') as sql_file:
+            sql_file.write(description.pop('sql'))
+        description.update(name=name, sql=f'{name}.sql', description=f'Benchmark {name}',
+                           cache={'enabled': False})
+        with open(os.path.join(directory, f'{name}.yaml'), 'w', encoding='utf8') as yaml_file:
+            yaml.safe_dump(description, yaml_file)
+
+
+def _best(func, number, repeat):
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def measure(repeat, requests):
+    """
+    Seconds per operation of every benchmark, django is set up with benchmarks.settings
+    """
+    from django.test import Client, RequestFactory
+
+    from api import endpoint_loader, query_execution
+    from api.endpoint_data_wrapper import EndpointSelectWrapper
+    from api.endpoint_loader import load_endpoints
+    from api.endpoint_processor import EndpointProcessor
+    from api.renderers import ApiJsonRenderer, ApiXmlRenderer
+
+    def load_all_endpoints():
+        # unchanged files are not parsed again, every repetition parses all of them
+        endpoint_loader._loaded.clear()
+        return load_endpoints()
+
+    results = {'load_endpoints': _best(load_all_endpoints, 1, repeat)}
+    endpoints = load_endpoints()
+    client = Client()
+    for name in MEASURED:
+        endpoint = endpoints[name]
+        processor = EndpointProcessor(endpoint)
+        page = processor.page({}) if endpoint.pagination_enabled else None
+        filters = [param.condition for param in endpoint.params]
+        results[f'compile.{name}'] = _best(
+            lambda: query_execution.Query(endpoint.query.name, endpoint.query.sql).render(filters, page), 100, repeat
+        )
+
+        query_result = query_execution._execute_query(endpoint.query, [], [], page)
+        selected_data = EndpointSelectWrapper(endpoint.selects)
+        selected_data.load(query_result)
+        results[f'convert.{name}'] = _best(lambda: processor.convert(query_result, selected_data), 1, repeat)
+
+        data = processor.process({}, RequestFactory().get(f'/{name}'))
+        renderer_context = {'view': SimpleNamespace(endpoint=endpoint)}
+        results[f'render.json.{name}'] = _best(lambda: ApiJsonRenderer().render(data), 1, repeat)
+        results[f'render.xml.{name}'] = _best(
+            lambda: ApiXmlRenderer().render(data, renderer_context=renderer_context), 1, repeat
+        )
+
+        for response_format in ['json', 'xml']:
+            def request():
+                response = client.get(f'/{name}?format={response_format}', HTTP_X_API_KEY='benchmark')
+                assert response.status_code == 200, response.content
+            results[f'request.{response_format}.{name}'] = _best(request, requests, repeat)
+    return results
+
+
+def run(students, repeat, requests):
+    directory = tempfile.mkdtemp(prefix='galaxy-benchmark-')
+    database = os.path.join(directory, 'galaxy.sqlite3')
+    populate(database, students)
+    write_endpoints(os.path.join(directory, 'endpoints'))
+    # database credentials and the other settings not overridden by benchmarks.settings are not used
+    os.environ.setdefault('CONFIG', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'galaxy_api.ini.example'))
+    os.environ.update(
+        DJANGO_SETTINGS_MODULE='benchmarks.settings',
+        BENCHMARK_DATABASE=database,
+        GALAXY_DESCRIPTIONS=os.path.join(directory, 'endpoints'),
+    )
+    import django
+    django.setup()
+    return {
+        'meta': {'students': students, 'repeat': repeat, 'requests': requests,
+                 'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version},
+        'results': measure(repeat, requests),
+    }
+
+
+def compare(baseline, current, threshold):
+    """
+    Lines of comparison table and names of benchmarks slower than baseline by more than threshold
+    """
+    lines, regressions = [], []
+    if baseline['meta'] != current['meta']:
+        lines.append(f'Warning: runs differ in parameters: {baseline["meta"]} and {current["meta"]}')
+    for name, baseline_seconds in baseline['results'].items():
+        if name not in current['results']:
+            lines.append(f'{name:>28}: missing in current run')
+            continue
+        seconds = current['results'][name]
+        change = seconds / baseline_seconds - 1
+        flag = ''
+        if change > threshold:
+            flag = 'REGRESSION'
+            regressions.append(name)
+        elif change < -threshold:
+            flag = 'improvement'
+        lines.append(f'{name:>28}: {baseline_seconds * 1000:10.3f}ms -> {seconds * 1000:10.3f}ms '
+                     f'{change:+8.1%} {flag}')
+    return lines, regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.suite')
+    commands = parser.add_subparsers(dest='command')
+    run_parser = commands.add_parser('run', help='Run benchmarks')
+    run_parser.add_argument('--students', type=int, default=2000, help='Students in the stand-in database')
+    run_parser.add_argument('--repeat', type=int, default=5, help='Measurements of each benchmark, the best is kept')
+    run_parser.add_argument('--requests', type=int, default=5, help='Requests of each endpoint per measurement')
+    run_parser.add_argument('--output', help='File to save results to as a baseline')
+    compare_parser = commands.add_parser('compare', help='Compare results with a baseline')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.1,
+                                help='Relative slowdown reported as regression')
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        report = run(args.students, args.repeat, args.requests)
+        for name, seconds in report['results'].items():
+            print(f'{name:>28}: {seconds * 1000:10.3f}ms')
+        if args.output:
+            with open(args.output, 'w', encoding='utf8') as output:
+                json.dump(report, output, indent=2)
+    elif args.command == 'compare':
+        with open(args.baseline, encoding='utf8') as baseline, open(args.current, encoding='utf8') as current:
+            lines, regressions = compare(json.load(baseline), json.load(current), args.threshold)
+        print('\n'.join(lines))
+        if regressions:
+            print(f'{len(regressions)} regressions: {", ".join(regressions)}')
+            return 1
+    else:
+        parser.print_help()
+        return 2
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -57,6 +57,7 @@ MIDDLEWARE = [
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.reloading.ReloadMiddleware',
 ]
 
 ROOT_URLCONF = 'galaxy_api.urls'
@@ -86,6 +87,14 @@ TEMPLATES = [
 API_KEY_HEADER_NAME = 'X-Api-Key'
 
 API_KEY = config.get('API', 'KEY', fallback=None)
+# admins may profile requests and download the profiles, admin features are disabled without ADMIN_KEY
+ADMIN_KEY_HEADER_NAME = 'X-Admin-Key'
+ADMIN_API_KEY = config.get('API', 'ADMIN_KEY', fallback=None)
+# requests of admins with the header are profiled, the header of response holds id of the stored profile
+PROFILE_HEADER_NAME = 'X-Profile'
+PROFILE_TIMEOUT_SECONDS = int(config.get('API', 'PROFILE_TIMEOUT', fallback=24 * 60 * 60))
+# responses break down time of request phases in Server-Timing header
+SERVER_TIMING_ENABLED = config.getboolean('API', 'SERVER_TIMING', fallback=False)
 
 SWAGGER_SETTINGS = {
     'DEFAULT_INFO': 'api.urls.api_info',
@@ -101,13 +110,38 @@ SWAGGER_SETTINGS = {
 
 # Queries directory settings
 QUERIES_DIR = os.environ.get('GALAXY_DESCRIPTIONS')
+# workers check whether endpoints were reloaded at most once per ENDPOINTS_CHECK_INTERVAL seconds, 0 disables checks.
+# with ENDPOINTS_WATCH changes of description files in QUERIES_DIR are checked too
+ENDPOINTS_CHECK_INTERVAL_SECONDS = float(config.get('API', 'ENDPOINTS_CHECK_INTERVAL', fallback=5))
+ENDPOINTS_WATCH = config.getboolean('API', 'ENDPOINTS_WATCH', fallback=False)
 
 # Pagination settings
 
 PAGE_QUERY_PARAM = 'page'
 PAGE_SIZE_QUERY_PARAM = 'pagesize'
+# Cursors of endpoints with keyset pagination
+PAGE_AFTER_QUERY_PARAM = 'after'
+PAGE_BEFORE_QUERY_PARAM = 'before'
 DEFAULT_PAGE_SIZE = int(config.get('API', 'PAGE_SIZE', fallback=20))
 
+# Max number of parent keys loaded by a single nested select query, 0 or 1 disables batching
+SELECT_BATCH_SIZE = int(config.get('API', 'SELECT_BATCH_SIZE', fallback=500))
+
+# Number of rows fetched from database at once by queries
+FETCH_SIZE = int(config.get('API', 'FETCH_SIZE', fallback=1000))
+# rows a query result may have unless an endpoint sets its own max_rows, 0 means no limit.
+# results of endpoints without pagination and aggregation over the limit are streamed instead
+MAX_ROWS = int(config.get('API', 'MAX_ROWS', fallback=100000))
+# Number of rows fetched from database at once by endpoints with streaming enabled
+STREAMING_FETCH_SIZE = int(config.get('API', 'STREAMING_FETCH_SIZE', fallback=1000))
+# threads loading nested selects shared by all requests of a worker process
+SELECT_THREAD_POOL_SIZE = int(config.get('API', 'SELECT_THREADS', fallback=8))
+# selects of one request loaded at the same time, 1 loads them one by one
+SELECT_CONCURRENCY = int(config.get('API', 'SELECT_CONCURRENCY', fallback=4))
+BATCH_MAX_ITEMS = int(config.get('API', 'BATCH_MAX_ITEMS', fallback=1000))
+# endpoints of a batch request processed at the same time
+BATCH_CONCURRENCY = int(config.get('API', 'BATCH_CONCURRENCY', fallback=4))
+
 LOG_ROOT = '/var/log/galaxy-api/'
 
 LOG_HANDLERS = ['console', 'logfile', ]
@@ -152,8 +186,60 @@ DATABASES = {
     }
 }
 
+# read replicas of galaxy_db: REPLICAS lists names of [DATABASE.<name>] sections,
+# connection settings missing in a section are taken from [DATABASE]
+GALAXY_DB_REPLICAS = {}
+for replica in [name.strip() for name in config.get('DATABASE', 'REPLICAS', fallback='').split(',') if name.strip()]:
+    GALAXY_DB_REPLICAS[replica] = f'galaxy_db_{replica}'
+    DATABASES[f'galaxy_db_{replica}'] = dict(DATABASES['galaxy_db'], **{
+        key: config.get(f'DATABASE.{replica}', key, fallback=config['DATABASE'][key])
+        for key in ['NAME', 'USER', 'PASSWORD', 'HOST', 'PORT']
+    })
+# queries are balanced across replicas and the primary too if READ_PRIMARY, the primary takes over if replicas fail
+DATABASE_READ_PRIMARY = config.getboolean('DATABASE', 'READ_PRIMARY', fallback=False)
+# servers failing MAX_FAILURES queries in a row are skipped for RETRY_AFTER seconds
+DATABASE_MAX_FAILURES = int(config.get('DATABASE', 'MAX_FAILURES', fallback=3))
+DATABASE_RETRY_AFTER_SECONDS = float(config.get('DATABASE', 'RETRY_AFTER', fallback=30))
+
+# pools of galaxy_db connections shared by threads of a worker process, disabled when POOL_MAX_SIZE is 0
+DATABASE_POOLS = {}
+if int(config.get('DATABASE', 'POOL_MAX_SIZE', fallback=0)) > 0:
+    for alias in ['galaxy_db'] + list(GALAXY_DB_REPLICAS.values()):
+        DATABASE_POOLS[alias] = {
+            'min_size': int(config.get('DATABASE', 'POOL_MIN_SIZE', fallback=1)),
+            'max_size': int(config.get('DATABASE', 'POOL_MAX_SIZE')),
+            'max_idle': float(config.get('DATABASE', 'POOL_MAX_IDLE', fallback=300)),
+            'pre_ping': config.getboolean('DATABASE', 'POOL_PRE_PING', fallback=True),
+            'timeout': float(config.get('DATABASE', 'POOL_TIMEOUT', fallback=30)),
+        }
+
+# seconds a query may run unless its endpoint sets timeout, 0 means no limit
+QUERY_TIMEOUT_SECONDS = float(config.get('API', 'QUERY_TIMEOUT', fallback=30))
+# seconds all queries of a request, including nested selects, may take together, 0 means no limit
+REQUEST_TIMEOUT_SECONDS = float(config.get('API', 'REQUEST_TIMEOUT', fallback=60))
 SQL_QUERY_CACHE_TIMEOUT_SECONDS = int(config.get('API', 'CACHE_TIMEOUT', fallback=60 * 60))
-API_RESPONSE_CACHE_TIMEOUT_SECONDS = int(config.get('API', 'CACHE_TIMEOUT', fallback=60 * 60))
+# stale results are served for CACHE_STALE_TIMEOUT more seconds while one worker refreshes them
+SQL_QUERY_CACHE_STALE_SECONDS = int(config.get('API', 'CACHE_STALE_TIMEOUT', fallback=5 * 60))
+SQL_QUERY_CACHE_LOCK_TIMEOUT_SECONDS = int(config.get('API', 'CACHE_LOCK_TIMEOUT', fallback=60))
+SQL_QUERY_CACHE_LOCK_WAIT_SECONDS = float(config.get('API', 'CACHE_LOCK_WAIT', fallback=5))
+# query results encoded and responses rendered into more bytes are not cached, 0 means no limit
+CACHE_MAX_ENTRY_SIZE = int(config.get('API', 'CACHE_MAX_ENTRY_SIZE', fallback=10 * 1024 * 1024))
+# in-process cache of hot query results in front of Redis, disabled when LOCAL_CACHE_SIZE is 0
+LOCAL_CACHE_MAX_ENTRIES = int(config.get('API', 'LOCAL_CACHE_SIZE', fallback=0))
+LOCAL_CACHE_MAX_ROWS = int(config.get('API', 'LOCAL_CACHE_ROWS', fallback=100000))
+LOCAL_CACHE_TIMEOUT_SECONDS = float(config.get('API', 'LOCAL_CACHE_TIMEOUT', fallback=5))
+LOCAL_CACHE_CHECK_INTERVAL_SECONDS = float(config.get('API', 'LOCAL_CACHE_CHECK_INTERVAL', fallback=1))
+# requests of the last ACCESS_HISTORY_HOURS hours are counted for cache warming, 0 disables counting
+ACCESS_HISTORY_HOURS = int(config.get('API', 'ACCESS_HISTORY_HOURS', fallback=24))
+# metrics of worker processes are added up in Redis every METRICS_FLUSH_INTERVAL seconds
+METRICS_ENABLED = config.getboolean('API', 'METRICS', fallback=True)
+METRICS_FLUSH_INTERVAL_SECONDS = float(config.get('API', 'METRICS_FLUSH_INTERVAL', fallback=1))
+# request paths warmed by warm_cache command, one per line
+CACHE_WARMING_FILE = config.get('API', 'CACHE_WARMING_FILE', fallback=None)
+# seconds rendered responses are cached unless endpoint sets response_timeout, CACHE_TIMEOUT when not set
+API_RESPONSE_CACHE_TIMEOUT_SECONDS = int(config.get(
+    'API', 'RESPONSE_CACHE_TIMEOUT', fallback=config.get('API', 'CACHE_TIMEOUT', fallback=60 * 60)
+))
 
 CACHES = {
     "default": {
@@ -0,0 +1,53 @@
+import contextlib
+
+import pytest
+from django.db.backends.sqlite3.base import DatabaseWrapper
+
+from api import query_execution
+
+
+@pytest.fixture
+def stand_in():
+    """
+    Creates SQLite connections standing in for galaxy_db, database files are created on first query
+    """
+    connections = []
+
+    def create(path, **kwargs):
+        settings_dict = {
+            'ENGINE': 'django.db.backends.sqlite3', 'NAME': str(path), 'OPTIONS': {},
+            'TIME_ZONE': None, 'CONN_MAX_AGE': 0, 'AUTOCOMMIT': True, 'ATOMIC_REQUESTS': False,
+            'USER': '', 'PASSWORD': '', 'HOST': '', 'PORT': '', 'TEST': {},
+        }
+        connection = DatabaseWrapper(settings_dict, alias=str(path), **kwargs)
+        connections.append(connection)
+        return connection
+
+    yield create
+    for connection in connections:
+        connection.close()
+
+
+@pytest.fixture
+def stand_in_database(stand_in, monkeypatch, tmp_path, django_db_blocker):
+    """
+    Queries are executed on a SQLite stand-in, both on connections of requests and of the pool
+    """
+    connection = stand_in(tmp_path / 'stand-in.sqlite3')
+
+    @contextlib.contextmanager
+    def stand_in_connection(alias):
+        yield connection
+
+    class StandInPool:
+        def acquire(self):
+            return connection
+
+        def release(self, released):
+            pass
+
+    monkeypatch.setattr(query_execution.connection_pool, 'connection', stand_in_connection)
+    # streamed rows are fetched on a connection of the pool
+    monkeypatch.setattr(query_execution.connection_pool, 'get_pool', lambda alias: StandInPool())
+    with django_db_blocker.unblock():
+        yield connection
@@ -0,0 +1,22 @@
+from django.test import RequestFactory
+from rest_framework.request import Request
+
+from api import access_history
+
+
+def test_request_path_does_not_depend_on_params_order():
+    factory = RequestFactory()
+    path = access_history.request_path(factory.get('/students?b=2&a=1&a=0'))
+    assert path == '/students?a=1&a=0&b=2'
+    assert access_history.request_path(factory.get('/students?a=1&b=2&a=0')) == path
+    assert access_history.request_path(factory.get('/students')) == '/students'
+
+
+def test_warming_requests_are_not_recorded(monkeypatch, settings):
+    settings.ACCESS_HISTORY_HOURS = 24
+    recorded = []
+    monkeypatch.setattr(access_history, 'get_redis_connection', recorded.append)
+    request = RequestFactory().get('/students')
+    access_history.mark_warming(request)
+    access_history.record(Request(request))
+    assert not recorded
@@ -0,0 +1,61 @@
+import pytest
+from django.test import RequestFactory
+
+from api.batch_processor import BatchProcessor
+from api.endpoint import Endpoint, Object, Field, SQLParameter, TypeEnum
+from api.endpoint_loader import EndpointStorage
+from api.endpoint_processor import EndpointProcessor
+from api.query_execution import QueryTimeout
+
+
+@pytest.fixture
+def endpoints(monkeypatch):
+    schema = Object(name='mark', many=False, aggregate=False, aggregation_field=None, fields={
+        'value': Field(type=TypeEnum.INT, db_name='VALUE'),
+    })
+    marks = Endpoint(name='marks', sql='marks.sql', schema=schema, key=None, description=None,
+                     sql_params=[SQLParameter(name='student', type=TypeEnum.INT, position=0)])
+    monkeypatch.setattr(EndpointStorage, 'endpoints', {'marks': marks})
+    calls = []
+
+    def process_many(processor, requests_params):
+        calls.append(requests_params)
+        return [[{'value': int(params['student'])}] for params in requests_params]
+
+    monkeypatch.setattr(EndpointProcessor, 'process_many', process_many)
+    return calls
+
+
+def _process(items):
+    return BatchProcessor(RequestFactory().post('/_batch')).process(items)
+
+
+def test_identical_items_are_processed_once(endpoints):
+    results = _process([
+        {'endpoint': 'marks', 'params': {'student': 1}},
+        {'endpoint': 'marks', 'params': {'student': '2'}},
+        {'endpoint': 'marks', 'params': {'student': '1'}},
+    ])
+    assert endpoints == [[{'student': '1'}, {'student': '2'}]]
+    assert [result['data'] for result in results] == [[{'value': 1}], [{'value': 2}], [{'value': 1}]]
+
+
+def test_item_errors_do_not_fail_batch(endpoints):
+    results = _process([
+        {'endpoint': 'marks', 'params': {}},
+        {'endpoint': 'marks', 'params': {'student': 'x'}},
+        {'endpoint': 'marks', 'params': {'student': [1, 2]}},
+        {'endpoint': 'students'},
+        {'endpoint': 'marks', 'params': {'student': 3}},
+    ])
+    assert [result['status'] for result in results] == [400, 400, 400, 404, 200]
+    assert results[0]['error'] == 'Required parameters not specified: student'
+
+
+def test_timed_out_items_fail_with_gateway_timeout(endpoints, monkeypatch):
+    def process_many(processor, requests_params):
+        raise QueryTimeout()
+
+    monkeypatch.setattr(EndpointProcessor, 'process_many', process_many)
+    results = _process([{'endpoint': 'marks', 'params': {'student': 1}}])
+    assert results[0]['status'] == 504 and 'error' in results[0]
@@ -0,0 +1,28 @@
+from api.endpoint_loader import load_endpoints, EndpointStorage
+from benchmarks import suite
+
+
+def _report(**results):
+    return {'meta': {'students': 10}, 'results': results}
+
+
+def test_slowdowns_above_threshold_are_regressions():
+    lines, regressions = suite.compare(
+        _report(convert=1.0, render=1.0, request=1.0),
+        _report(convert=1.05, render=1.5, request=0.5),
+        0.1
+    )
+    assert regressions == ['render']
+    assert 'REGRESSION' in lines[1] and 'improvement' in lines[2]
+
+
+def test_generated_endpoints_are_loaded(tmp_path, settings):
+    suite.write_endpoints(str(tmp_path / 'endpoints'))
+    settings.QUERIES_DIR = str(tmp_path / 'endpoints')
+    previous = EndpointStorage.endpoints
+    try:
+        endpoints = load_endpoints()
+    finally:
+        EndpointStorage.endpoints = previous
+    assert set(suite.MEASURED) <= set(endpoints)
+    assert [select.endpoint for select in endpoints['nested'].selects] == ['groups', 'student_marks']
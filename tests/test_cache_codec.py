@@ -0,0 +1,26 @@
+import datetime
+from decimal import Decimal
+
+from api import cache_codec
+from api.rows import Columns, Rows
+
+
+def test_rows_survive_round_trip():
+    rows = Rows.from_dicts([
+        {'ID': 1, 'NAME': 'a', 'BIRTH_DATE': datetime.date(2000, 1, 1), 'MARK': Decimal('4.5'), 'NOTE': None},
+        {'ID': 2, 'NAME': 'b', 'BIRTH_DATE': datetime.date(2001, 2, 3), 'MARK': Decimal('3.0'), 'NOTE': 'x'},
+    ])
+    decoded = cache_codec.decode(cache_codec.encode(rows))
+    assert decoded == rows
+    assert decoded.columns.names == rows.columns.names
+
+
+def test_empty_result_keeps_columns():
+    decoded = cache_codec.decode(cache_codec.encode(Rows(Columns(['ID']))))
+    assert decoded == []
+    assert decoded.columns.names == ('ID',)
+
+
+def test_column_names_are_stored_once():
+    rows = Rows.from_dicts([{'A_VERY_LONG_COLUMN_NAME': idx} for idx in range(1000)])
+    assert cache_codec.encode(rows).count(b'A_VERY_LONG_COLUMN_NAME') <= 1
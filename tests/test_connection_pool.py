@@ -0,0 +1,77 @@
+import threading
+import time
+
+import pytest
+from django.db import OperationalError
+
+from api.connection_pool import ConnectionPool
+
+
+@pytest.fixture(autouse=True)
+def stand_in_database_access(django_db_blocker):
+    with django_db_blocker.unblock():
+        yield
+
+
+@pytest.fixture
+def create(stand_in, tmp_path):
+    return lambda: stand_in(tmp_path / 'stand-in.sqlite3', allow_thread_sharing=True)
+
+
+def _pool(create, min_size=1, max_size=2, max_idle=60, pre_ping=True, timeout=1):
+    return ConnectionPool(create, min_size=min_size, max_size=max_size, max_idle=max_idle, pre_ping=pre_ping,
+                          timeout=timeout)
+
+
+def _select_one(pool):
+    with pool.connection() as connection, connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+        return cursor.fetchone()[0]
+
+
+def test_connections_are_reused(create):
+    pool = _pool(create)
+    assert _select_one(pool) == 1
+    assert _select_one(pool) == 1
+    stats = pool.stats()
+    assert stats['created'] == 1 and stats['acquired'] == 2 and stats['idle'] == 1 and stats['in_use'] == 0
+
+
+def test_connections_are_shared_between_threads(create):
+    pool = _pool(create)
+    _select_one(pool)
+    results = []
+    thread = threading.Thread(target=lambda: results.append(_select_one(pool)))
+    thread.start()
+    thread.join()
+    assert results == [1] and pool.stats()['created'] == 1
+
+
+def test_acquire_waits_for_released_connection(create):
+    pool = _pool(create, max_size=1, timeout=0.1)
+    connection = pool.acquire()
+    with pytest.raises(OperationalError):
+        pool.acquire()
+    threading.Timer(0.05, pool.release, [connection]).start()
+    pool.timeout = 1
+    assert pool.acquire() is connection
+    assert pool.stats()['timeouts'] == 1 and pool.stats()['waited'] == 1
+
+
+def test_broken_connection_is_replaced_after_ping(create):
+    pool = _pool(create)
+    connection = pool.acquire()
+    pool.release(connection)
+    connection.connection.close()
+    assert pool.acquire() is not connection
+    assert pool.stats()['failed_pings'] == 1 and pool.stats()['size'] == 1
+
+
+def test_idle_connections_are_closed_above_min_size(create):
+    pool = _pool(create, min_size=1, max_size=3, max_idle=0.01)
+    connections = [pool.acquire() for _ in range(3)]
+    for connection in connections:
+        pool.release(connection)
+    time.sleep(0.02)
+    pool.acquire()
+    assert pool.stats()['size'] == 1
@@ -0,0 +1,103 @@
+import contextlib
+import sqlite3
+from types import SimpleNamespace
+
+import pytest
+from django.db import OperationalError
+
+from api import database_router, query_execution
+from api.connection_pool import ConnectionPool, PoolTimeout
+from api.database_router import DatabaseRouter
+from api.endpoint_loader import validate_database
+
+
+@pytest.fixture
+def servers(stand_in, monkeypatch, tmp_path, django_db_blocker):
+    """
+    Stand-in databases of the primary and two replicas, each knows its name; broken replica cannot be opened
+    """
+    stand_ins = {}
+    for name in ['primary', 'replica1', 'replica2']:
+        with sqlite3.connect(str(tmp_path / f'{name}.sqlite3')) as connection:
+            connection.execute('CREATE TABLE SERVER (NAME TEXT)')
+            connection.execute('INSERT INTO SERVER VALUES (?)', (name,))
+        stand_ins[f'galaxy_db_{name}'] = stand_in(tmp_path / f'{name}.sqlite3')
+    stand_ins['galaxy_db_broken'] = stand_in(tmp_path / 'missing' / 'broken.sqlite3')
+
+    @contextlib.contextmanager
+    def stand_in_connection(alias):
+        yield stand_ins[alias]
+
+    monkeypatch.setattr(query_execution.connection_pool, 'connection', stand_in_connection)
+    with django_db_blocker.unblock():
+        yield
+
+
+def _router(monkeypatch, balanced, max_failures=2, **replicas):
+    servers = dict({'primary': 'galaxy_db_primary'}, **replicas)
+    router = DatabaseRouter(servers, balanced, max_failures=max_failures, retry_after=60)
+    monkeypatch.setattr(database_router, '_router', router)
+    return router
+
+
+def _server(database=None):
+    return query_execution._SqlQuery('SELECT NAME FROM SERVER', database=database).execute([])[0][0]
+
+
+def test_queries_are_balanced_across_replicas(servers, monkeypatch):
+    _router(monkeypatch, ['replica1', 'replica2'],
+            replica1='galaxy_db_replica1', replica2='galaxy_db_replica2')
+    assert sorted(_server() for _ in range(4)) == ['replica1', 'replica1', 'replica2', 'replica2']
+
+
+def test_busy_server_is_chosen_last(monkeypatch):
+    router = _router(monkeypatch, ['primary', 'replica1'], replica1='galaxy_db_replica1')
+    for _ in range(2):
+        busy, chosen = router.execute(None, lambda alias: (alias, router.candidates()[0].alias))
+        assert busy != chosen
+
+
+def test_failed_replica_is_skipped(servers, monkeypatch):
+    router = _router(monkeypatch, ['broken', 'replica2'],
+                     broken='galaxy_db_broken', replica2='galaxy_db_replica2')
+    assert [_server() for _ in range(6)] == ['replica2'] * 6
+    stats = router.stats()
+    assert not stats['broken']['up'] and stats['broken']['failed_queries'] == 2
+    assert stats['replica2']['up'] and stats['replica2']['queries'] == 6
+
+
+def test_primary_takes_over_failed_replicas(servers, monkeypatch):
+    _router(monkeypatch, ['broken'], broken='galaxy_db_broken')
+    assert _server() == 'primary'
+
+
+
+
+def test_exhausted_pool_does_not_mark_server_down(stand_in, monkeypatch, tmp_path, django_db_blocker):
+    pool = ConnectionPool(lambda: stand_in(tmp_path / 'primary.sqlite3', allow_thread_sharing=True),
+                          min_size=1, max_size=1, max_idle=60, pre_ping=False, timeout=0.01)
+    monkeypatch.setattr(query_execution.connection_pool, 'get_pool', lambda alias: pool)
+    router = _router(monkeypatch, ['primary', 'replica1'], max_failures=1, replica1='galaxy_db_replica1')
+    with django_db_blocker.unblock():
+        busy = pool.acquire()
+        for _ in range(3):
+            with pytest.raises(PoolTimeout):
+                query_execution._SqlQuery('SELECT 1 AS one').execute([])
+        stats = router.stats()
+        assert stats['primary']['up'] and stats['replica1']['up']
+        assert stats['primary']['failed_queries'] == stats['replica1']['failed_queries'] == 0
+        pool.release(busy)
+        assert query_execution._SqlQuery('SELECT 1 AS one').execute([])[0][0] == 1
+def test_pinned_query_is_not_balanced(servers, monkeypatch):
+    _router(monkeypatch, ['replica1', 'broken'],
+            replica1='galaxy_db_replica1', broken='galaxy_db_broken')
+    assert [_server('primary') for _ in range(2)] == ['primary'] * 2
+    with pytest.raises(OperationalError):
+        _server('broken')
+
+
+def test_endpoints_are_pinned_to_known_servers(settings):
+    settings.GALAXY_DB_REPLICAS = {'replica1': 'galaxy_db_replica1'}
+    validate_database({'marks': SimpleNamespace(name='marks', database='replica1')})
+    with pytest.raises(ValueError):
+        validate_database({'marks': SimpleNamespace(name='marks', database='replica2')})
@@ -0,0 +1,96 @@
+import threading
+import time
+
+import pytest
+
+from api import endpoint_data_wrapper, query_execution
+from api.endpoint import Endpoint, Object, Field, Select, TypeEnum
+from api.endpoint_data_wrapper import EndpointSelectWrapper
+from api.endpoint_loader import EndpointStorage
+from api.endpoint_processor import EndpointProcessor
+from api.rows import Columns, Rows
+
+
+@pytest.fixture(autouse=True)
+def no_connections(monkeypatch):
+    # data wrappers below do not touch the database
+    monkeypatch.setattr(endpoint_data_wrapper, 'close_old_connections', lambda: None)
+
+
+class _SlowDataWrapper:
+    def __init__(self, delay, nested=None):
+        self.delay = delay
+        self.nested = nested
+        self.threads = []
+
+    def load_for(self, data):
+        self.threads.append(threading.current_thread())
+        time.sleep(self.delay)
+        if self.nested is not None:
+            self.nested.load(data)
+
+
+def _select_wrapper(*data_wrappers):
+    select_wrapper = EndpointSelectWrapper([])
+    select_wrapper.endpoints_data_wrappers = {str(idx): wrapper for idx, wrapper in enumerate(data_wrappers)}
+    return select_wrapper
+
+
+def _load_time(select_wrapper):
+    start = time.monotonic()
+    select_wrapper.load([])
+    return time.monotonic() - start
+
+
+def test_selects_are_loaded_concurrently(settings):
+    settings.SELECT_CONCURRENCY = 3
+    assert _load_time(_select_wrapper(*[_SlowDataWrapper(0.2) for _ in range(3)])) < 0.35
+
+
+def test_concurrency_is_limited_per_request(settings):
+    settings.SELECT_CONCURRENCY = 2
+    assert _load_time(_select_wrapper(*[_SlowDataWrapper(0.2) for _ in range(3)])) >= 0.4
+
+
+def test_nested_selects_are_loaded_in_worker_thread(settings):
+    settings.SELECT_CONCURRENCY = 2
+    nested = [_SlowDataWrapper(0), _SlowDataWrapper(0)]
+    parent = _SlowDataWrapper(0, nested=_select_wrapper(*nested))
+    _select_wrapper(parent, _SlowDataWrapper(0)).load([])
+    assert parent.threads[0] is not threading.current_thread()
+    assert nested[0].threads == nested[1].threads == parent.threads
+
+
+def _endpoint(name, fields):
+    schema = Object(name=name, many=False, aggregate=False, aggregation_field=None, fields=fields)
+    return Endpoint(name=name, sql=f'{name}.sql', schema=schema, key='ID', description=None)
+
+
+def test_nested_selects_of_empty_result_are_not_loaded(monkeypatch):
+    faculties = _endpoint('faculties', {'id': Field(type=TypeEnum.INT, db_name='ID')})
+    groups = _endpoint('groups', {'faculty': Select(endpoint='faculties', params={'id': 'FACULTY_ID'})})
+    students = _endpoint('students', {'group': Select(endpoint='groups', params={'id': 'GROUP_ID'})})
+    monkeypatch.setattr(EndpointStorage, 'endpoints', {'faculties': faculties, 'groups': groups, 'students': students})
+
+    def execute_batch_query(query, parameters, policy):
+        assert not parameters
+        return []
+
+    monkeypatch.setattr(query_execution, 'execute_batch_query', execute_batch_query)
+    select_wrapper = EndpointSelectWrapper(students.selects)
+    select_wrapper.load(Rows(Columns(['ID', 'GROUP_ID'])))
+    # streamed batches of empty results are plain lists
+    select_wrapper.load([])
+    assert EndpointProcessor(groups).process_many([]) == []
+
+
+def test_streamed_empty_result_skips_selects(monkeypatch):
+    groups = _endpoint('groups', {'id': Field(type=TypeEnum.INT, db_name='ID')})
+    students = _endpoint('students', {'group': Select(endpoint='groups', params={'id': 'GROUP_ID'})})
+    monkeypatch.setattr(EndpointStorage, 'endpoints', {'groups': groups, 'students': students})
+    monkeypatch.setattr(query_execution, 'execute_batch_query', lambda query, parameters, policy: [])
+
+    monkeypatch.setattr(query_execution, 'stream_query', lambda *args: iter([]))
+    assert list(EndpointProcessor(students).process_stream({})) == []
+    monkeypatch.setattr(query_execution, 'stream_query', lambda *args: iter([[]]))
+    assert list(EndpointProcessor(students).process_stream({})) == [[]]
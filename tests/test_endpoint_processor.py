@@ -0,0 +1,197 @@
+import random
+from urllib import parse
+
+from django.test import RequestFactory
+
+from api.endpoint import Endpoint, Object, Field, Select, TypeEnum, PaginationMode
+from api.endpoint_processor import EndpointProcessor
+from api.rows import Rows
+from api.utils import encode_cursor, decode_cursor
+from benchmarks import converters
+
+
+def _endpoint(**kwargs):
+    schema = Object(name='student', many=False, aggregate=False, aggregation_field=None, fields={
+        'id': Field(type=TypeEnum.INT, db_name='ID'),
+    })
+    return Endpoint(name='students', sql='students.sql', schema=schema, key='ID', description=None, **kwargs)
+
+
+def _query_params(link):
+    return dict(parse.parse_qsl(parse.urlsplit(link).query))
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor('Иванов')) == 'Иванов'
+    assert decode_cursor(encode_cursor(12)) == 12
+
+
+def test_keyset_links_refer_to_page_boundaries():
+    processor = EndpointProcessor(_endpoint(pagination_enabled=True, pagination_mode=PaginationMode.KEYSET))
+    request = RequestFactory().get('/students', {'pagesize': 2, 'after': encode_cursor(1)})
+    page = processor.page(request.GET)
+    assert page.after == 1
+
+    result = processor.paginate_keyset(request, [{'id': 2}, {'id': 3}], page, [2, 3])
+    assert result['has_prev'] and result['has_next']
+    assert _query_params(result['next']) == {'after': encode_cursor(3), 'pagesize': '2'}
+    assert _query_params(result['prev']) == {'before': encode_cursor(2), 'pagesize': '2'}
+
+
+def test_last_keyset_page_has_no_next_link():
+    processor = EndpointProcessor(_endpoint(pagination_enabled=True, pagination_mode=PaginationMode.KEYSET))
+    request = RequestFactory().get('/students', {'pagesize': 2})
+    page = processor.page(request.GET)
+
+    result = processor.paginate_keyset(request, [{'id': 1}], page, [1])
+    assert not result['has_prev'] and not result['has_next']
+    assert result['next'] is None and result['prev'] is None
+
+
+class _SelectedData:
+    def get_data(self, endpoint_name, record):
+        # ID is the first column of rows
+        return [f"{endpoint_name}:{record[0]}"]
+
+
+def _student_marks_schema():
+    return Object(name='student', many=False, aggregate=False, aggregation_field=None, fields={
+        'id': Field(type=TypeEnum.INT, db_name='ID'),
+        'info': Object(name='info', many=False, aggregate=False, aggregation_field=None, fields={
+            'name': Field(type=TypeEnum.STRING, db_name='NAME'),
+        }),
+        'groups': Select(endpoint='groups', params={'student': 'ID'}),
+        'marks': Object(name='mark', many=True, aggregate=True, aggregation_field='SUBJECT', fields={
+            'subject': Field(type=TypeEnum.STRING, db_name='SUBJECT'),
+            'values': Object(name='value', many=True, aggregate=False, aggregation_field=None, fields={
+                'value': Field(type=TypeEnum.INT, db_name='VALUE'),
+            }),
+        }),
+    })
+
+
+def test_convert_data_follows_schema():
+    endpoint = Endpoint(name='students', sql='s.sql', schema=_student_marks_schema(), key='ID', description=None)
+    data = Rows.from_dicts([{'ID': 1, 'NAME': 'a', 'SUBJECT': 'math', 'VALUE': 5}])
+    assert EndpointProcessor(endpoint).convert_data(data, _SelectedData()) == [{
+        'id': 1,
+        'info': {'name': 'a'},
+        'groups': ['groups:1'],
+        'marks': {'subject': 'math', 'values': {'value': 5}},
+    }]
+
+
+def test_convert_data_aggregated_groups_nested_objects():
+    endpoint = Endpoint(name='students', sql='s.sql', schema=_student_marks_schema(), key='ID', description=None,
+                        aggregation_enabled=True)
+    data = Rows.from_dicts([
+        {'ID': 1, 'NAME': 'a', 'SUBJECT': 'math', 'VALUE': 5},
+        {'ID': 2, 'NAME': 'b', 'SUBJECT': 'math', 'VALUE': 3},
+        {'ID': 1, 'NAME': 'a', 'SUBJECT': 'art', 'VALUE': 4},
+        {'ID': 1, 'NAME': 'a', 'SUBJECT': 'math', 'VALUE': 4},
+    ])
+    assert EndpointProcessor(endpoint).convert_data_aggregated(data, _SelectedData()) == [
+        {
+            'id': 1,
+            'info': {'name': 'a'},
+            'groups': ['groups:1'],
+            'marks': [
+                {'subject': 'math', 'values': [{'value': 5}, {'value': 4}]},
+                {'subject': 'art', 'values': [{'value': 4}]},
+            ],
+        },
+        {
+            'id': 2,
+            'info': {'name': 'b'},
+            'groups': ['groups:2'],
+            'marks': [{'subject': 'math', 'values': [{'value': 3}]}],
+        },
+    ]
+
+
+def test_convert_data_aggregated_groups_sibling_aggregates_independently():
+    schema = Object(name='student', many=False, aggregate=False, aggregation_field=None, fields={
+        'id': Field(type=TypeEnum.INT, db_name='ID'),
+        'subjects': Object(name='subject', many=True, aggregate=True, aggregation_field='SUBJECT', fields={
+            'name': Field(type=TypeEnum.STRING, db_name='SUBJECT'),
+        }),
+        'terms': Object(name='term', many=True, aggregate=True, aggregation_field='TERM', fields={
+            'term': Field(type=TypeEnum.INT, db_name='TERM'),
+        }),
+    })
+    endpoint = Endpoint(name='students', sql='s.sql', schema=schema, key='ID', description=None,
+                        aggregation_enabled=True)
+    data = Rows.from_dicts([
+        {'ID': 1, 'SUBJECT': 'math', 'TERM': 1},
+        {'ID': 1, 'SUBJECT': 'art', 'TERM': 1},
+        {'ID': 1, 'SUBJECT': 'math', 'TERM': 2},
+    ])
+    assert EndpointProcessor(endpoint).convert_data_aggregated(data, _SelectedData()) == [{
+        'id': 1,
+        'subjects': [{'name': 'math'}, {'name': 'art'}],
+        'terms': [{'term': 1}, {'term': 2}],
+    }]
+
+
+def test_convert_data_of_object_without_fields():
+    schema = Object(name='student', many=False, aggregate=False, aggregation_field=None, fields={
+        'id': Field(type=TypeEnum.INT, db_name='ID'),
+        'empty': Object(name='empty', many=False, aggregate=False, aggregation_field=None, fields={}),
+    })
+    endpoint = Endpoint(name='students', sql='s.sql', schema=schema, key='ID', description=None)
+    assert EndpointProcessor(endpoint).convert_data(Rows.from_dicts([{'ID': 1}]), _SelectedData()) == [{'id': 1, 'empty': {}}]
+
+
+def test_convert_data_aggregated_lists_rows_once_next_to_sibling_aggregates():
+    schema = Object(name='student', many=False, aggregate=False, aggregation_field=None, fields={
+        'id': Field(type=TypeEnum.INT, db_name='ID'),
+        'items': Object(name='item', many=True, aggregate=False, aggregation_field=None, fields={
+            'x': Field(type=TypeEnum.INT, db_name='B'),
+        }),
+        'g1': Object(name='g1', many=True, aggregate=True, aggregation_field='C', fields={
+            'c': Field(type=TypeEnum.INT, db_name='C'),
+        }),
+        'g2': Object(name='g2', many=True, aggregate=True, aggregation_field='D', fields={
+            'd': Field(type=TypeEnum.INT, db_name='D'),
+        }),
+    })
+    endpoint = Endpoint(name='students', sql='s.sql', schema=schema, key='ID', description=None,
+                        aggregation_enabled=True)
+    data = Rows.from_dicts([
+        {'ID': 1, 'B': 10, 'C': 1, 'D': 1},
+        {'ID': 1, 'B': 11, 'C': 2, 'D': 1},
+    ])
+    assert EndpointProcessor(endpoint).convert_data_aggregated(data, _SelectedData()) == [{
+        'id': 1,
+        'items': [{'x': 10}, {'x': 11}],
+        'g1': [{'c': 1}, {'c': 2}],
+        'g2': [{'d': 1}],
+    }]
+
+
+def _random_object(rnd, depth, many, aggregate):
+    columns = ['A', 'B', 'C', 'D']
+    fields = {f'f{idx}': Field(type=TypeEnum.INT, db_name=rnd.choice(columns)) for idx in range(rnd.randint(0, 2))}
+    for idx in range(rnd.randint(0, 3) if depth < 3 else 0):
+        kind = rnd.choice(['object', 'many', 'aggregate'])
+        fields[f'o{idx}'] = _random_object(rnd, depth + 1, kind != 'object', kind == 'aggregate')
+    return Object(name=f'level{depth}', many=many, aggregate=aggregate,
+                  aggregation_field=rnd.choice(columns) if aggregate else None, fields=fields)
+
+
+def test_convert_data_aggregated_matches_recursive_conversion():
+    rnd = random.Random(0)
+    for _ in range(500):
+        schema = _random_object(rnd, 0, False, False)
+        endpoint = Endpoint(name='random', sql='r.sql', schema=schema, key='ID', description=None,
+                            aggregation_enabled=True)
+        records = [
+            {'ID': rnd.randint(0, 2), 'A': rnd.randint(0, 2), 'B': rnd.randint(0, 2), 'C': rnd.randint(0, 2),
+             'D': rnd.randint(0, 2)}
+            for _ in range(rnd.randint(0, 12))
+        ]
+        # the recursive conversion of each group that compiled converters replaced
+        expected = [
+            converters._walk_aggregated(group[0], group, schema, None) for group in converters._group(records, 'ID')
+        ]
+        assert EndpointProcessor(endpoint).convert_data_aggregated(Rows.from_dicts(records), None) == expected
@@ -0,0 +1,93 @@
+import pytest
+import yaml
+from django.core.cache.backends.locmem import LocMemCache
+
+from api import endpoint_loader, query_execution, reloading
+from api.endpoint_loader import EndpointStorage, load_endpoints, files_changed
+from api.endpoint_processor import EndpointProcessor
+from api.local_cache import LocalCache
+
+
+def _field(db_name):
+    return {'type': 'integer', 'db_name': db_name}
+
+
+def _write(directory, name, fields, sql='SELECT ID FROM T', params=()):
+    (directory / 'sql' / f'{name}.sql').write_text(sql)
+    (directory / f'{name}.yaml').write_text(yaml.safe_dump({
+        'name': name, 'sql': f'{name}.sql', 'key': 'ID', 'description': None, 'params': list(params),
+        'schema': {'name': name, 'many': False, 'aggregate': False, 'aggregation_field': None, 'fields': fields},
+    }))
+
+
+@pytest.fixture
+def descriptions(monkeypatch, settings, tmp_path):
+    (tmp_path / 'sql').mkdir()
+    settings.QUERIES_DIR = str(tmp_path)
+    monkeypatch.setattr(endpoint_loader, '_loaded', {})
+    monkeypatch.setattr(EndpointStorage, 'endpoints', None)
+    _write(tmp_path, 'groups', {'id': _field('ID')})
+    _write(tmp_path, 'students', {'id': _field('ID'), 'group': {'endpoint': 'groups', 'params': {'id': 'ID'}}})
+    _write(tmp_path, 'subjects', {'id': _field('ID')})
+    return tmp_path
+
+
+def test_only_changed_files_are_parsed_again(descriptions):
+    endpoints = load_endpoints()
+    assert not files_changed()
+    _write(descriptions, 'subjects', {'id': _field('ID'), 'code': _field('CODE')})
+    assert files_changed()
+
+    reloaded = load_endpoints()
+    assert reloaded['groups'] is endpoints['groups']
+    assert reloaded['subjects'] is not endpoints['subjects']
+    assert reloaded['subjects'].version != endpoints['subjects'].version
+    assert EndpointStorage.endpoints is reloaded
+
+
+def test_endpoints_selecting_from_changed_one_get_new_version(descriptions):
+    endpoints = load_endpoints()
+    _write(descriptions, 'groups', {'id': _field('ID')}, sql='SELECT ID FROM GROUPS')
+    reloaded = load_endpoints()
+    assert reloaded['groups'].query.version != endpoints['groups'].query.version
+    assert reloaded['students'].version != endpoints['students'].version
+    assert reloaded['subjects'].version == endpoints['subjects'].version
+
+
+def test_invalid_endpoints_keep_the_registry(descriptions):
+    endpoints = load_endpoints()
+    (descriptions / 'groups.yaml').unlink()
+    with pytest.raises(ValueError):
+        load_endpoints()
+    assert EndpointStorage.endpoints is endpoints
+
+
+def _cache_key(endpoint, request_params):
+    params, required_params = EndpointProcessor(endpoint).process_parameters(request_params)
+    return query_execution._generate_cache_key(endpoint.query, required_params, params, None)
+
+
+def test_changed_param_condition_changes_cache_key(descriptions):
+    param = {'name': 'id', 'type': 'integer', 'operation': 'equal', 'condition': 'ID = %s', 'required': False}
+    _write(descriptions, 'subjects', {'id': _field('ID')}, params=[param])
+    key = _cache_key(load_endpoints()['subjects'], {'id': '1'})
+    _write(descriptions, 'subjects', {'id': _field('ID')}, params=[dict(param, condition='ID > %s')])
+    assert _cache_key(load_endpoints()['subjects'], {'id': '1'}) != key
+
+
+def test_triggered_reload_of_changed_endpoints_invalidates_local_caches(descriptions, monkeypatch):
+    shared_cache = LocMemCache('endpoint-reload-tests', {})
+    shared_cache.clear()
+    local_cache = LocalCache(shared_cache, max_entries=10, max_rows=10, timeout=60, check_interval=0)
+    monkeypatch.setattr(reloading, 'cache', shared_cache)
+    monkeypatch.setattr(query_execution, 'local_cache', local_cache)
+    monkeypatch.setattr(reloading, '_routes', None)
+    monkeypatch.setattr(reloading, '_generation', None)
+    load_endpoints()
+    local_cache.set('a', [1])
+    reloading.trigger()
+    assert local_cache.get('a') == [1]
+
+    _write(descriptions, 'subjects', {'id': _field('ID'), 'code': _field('CODE')})
+    assert reloading.trigger()['changed'] == ['subjects']
+    assert local_cache.get('a') is None
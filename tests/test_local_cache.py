@@ -0,0 +1,75 @@
+import io
+import time
+
+import pytest
+from django.core.cache.backends.locmem import LocMemCache
+
+from api import query_execution
+from api.local_cache import LocalCache
+from api.management.commands import warm_cache
+
+
+@pytest.fixture
+def shared_cache():
+    cache = LocMemCache('local-cache-tests', {})
+    cache.clear()
+    return cache
+
+
+def _local_cache(shared_cache, max_entries=2, max_rows=10, timeout=60, check_interval=0):
+    return LocalCache(shared_cache, max_entries=max_entries, max_rows=max_rows, timeout=timeout,
+                      check_interval=check_interval)
+
+
+def test_least_recently_used_entry_is_evicted(shared_cache):
+    local_cache = _local_cache(shared_cache)
+    local_cache.set('a', [1])
+    local_cache.set('b', [2])
+    assert local_cache.get('a') == [1]
+    local_cache.set('c', [3])
+    assert local_cache.get('b') is None
+    assert local_cache.get('a') == [1]
+    assert local_cache.get('c') == [3]
+
+
+def test_entries_are_bounded_by_rows(shared_cache):
+    local_cache = _local_cache(shared_cache, max_entries=10, max_rows=3)
+    local_cache.set('a', [1, 2])
+    local_cache.set('b', [3, 4])
+    local_cache.set('too big', [1, 2, 3, 4])
+    assert local_cache.get('a') is None
+    assert local_cache.get('b') == [3, 4]
+    assert local_cache.get('too big') is None
+
+
+def test_entries_expire(shared_cache):
+    local_cache = _local_cache(shared_cache, timeout=0.01)
+    local_cache.set('a', [1])
+    time.sleep(0.02)
+    assert local_cache.get('a') is None
+
+
+def test_invalidation_reaches_other_workers(shared_cache):
+    worker, other_worker = _local_cache(shared_cache), _local_cache(shared_cache)
+    worker.set('a', [1])
+    other_worker.get('a')
+    other_worker.set('a', [1])
+    worker.invalidate()
+    assert worker.get('a') is None
+    assert other_worker.get('a') is None
+
+
+def test_disabled_cache_keeps_nothing(shared_cache):
+    local_cache = _local_cache(shared_cache, max_entries=0)
+    local_cache.set('a', [1])
+    assert local_cache.get('a') is None
+
+
+def test_forced_warming_invalidates_local_caches(shared_cache, monkeypatch):
+    local_cache = _local_cache(shared_cache)
+    monkeypatch.setattr(query_execution, 'local_cache', local_cache)
+    monkeypatch.setattr(warm_cache, 'warm', lambda path, host, secure: 200)
+    local_cache.set('a', [1])
+    options = {'concurrency': 1, 'host': 'localhost', 'secure': False}
+    warm_cache.Command(stdout=io.StringIO()).warm_all(['/groups'], options)
+    assert local_cache.get('a') is None
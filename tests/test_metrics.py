@@ -0,0 +1,75 @@
+from collections import defaultdict
+
+import pytest
+
+from api import metrics
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.hashes = defaultdict(dict)
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def hincrbyfloat(self, key, field, amount):
+        field = field.encode()
+        self.hashes[key][field] = float(self.hashes[key].get(field, 0)) + amount
+
+    def hgetall(self, key):
+        return {field: str(value).encode() for field, value in self.hashes[key].items()}
+
+    def execute(self):
+        pass
+
+
+@pytest.fixture
+def redis(monkeypatch, settings):
+    settings.METRICS_ENABLED = True
+    settings.METRICS_FLUSH_INTERVAL_SECONDS = 60
+    fake = _FakeRedis()
+    metrics.flush()
+    monkeypatch.setattr(metrics, 'get_redis_connection', lambda alias: fake)
+    return fake
+
+
+def test_histogram_is_rendered_with_cumulative_buckets(redis):
+    histogram = metrics.Histogram('test_seconds', 'Test durations', (0.1, 1))
+    with metrics.labels(endpoint='students', format='json'):
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+    histogram.observe(5, endpoint='marks')
+    lines = metrics.render().splitlines()
+    assert '# TYPE test_seconds histogram' in lines
+    students = [line for line in lines if line.startswith('test_seconds') and 'students' in line]
+    assert students == [
+        'test_seconds_bucket{endpoint="students",format="json",le="0.1"} 1',
+        'test_seconds_bucket{endpoint="students",format="json",le="1"} 2',
+        'test_seconds_bucket{endpoint="students",format="json",le="+Inf"} 2',
+        'test_seconds_count{endpoint="students",format="json"} 2',
+        'test_seconds_sum{endpoint="students",format="json"} 0.55',
+    ]
+    assert 'test_seconds_bucket{endpoint="marks",format="",le="1"} 1' not in lines
+    assert 'test_seconds_bucket{endpoint="marks",format="",le="+Inf"} 1' in lines
+
+
+def test_counters_of_workers_are_added_up(redis):
+    counter = metrics.Counter('test_lookups', 'Test lookups', ('cache', 'result'))
+    counter.inc(cache='query', result='hit')
+    metrics.flush()
+    # another worker process flushing the same sample
+    counter.inc(2, cache='query', result='hit')
+    assert 'test_lookups_total{cache="query",result="hit"} 3' in metrics.render().splitlines()
+
+
+def test_label_values_are_escaped(redis):
+    counter = metrics.Counter('test_escaped', 'Test escaping', ('endpoint',))
+    counter.inc(endpoint='a"b\\c\nd')
+    assert 'test_escaped_total{endpoint="a\\"b\\\\c\\nd"} 1' in metrics.render().splitlines()
+
+
+def test_nothing_is_recorded_when_disabled(redis, settings):
+    settings.METRICS_ENABLED = False
+    counter = metrics.Counter('test_disabled', 'Test disabled', ())
+    counter.inc()
+    assert not any(line.startswith('test_disabled_total') for line in metrics.render().splitlines())
@@ -0,0 +1,261 @@
+import threading
+import time
+
+import pytest
+from django.core.cache.backends.locmem import LocMemCache
+from django_redis.cache import RedisCache
+
+from api import query_execution
+from api.endpoint import CachePolicy
+from api.query_execution import Query, Page, Param
+from api.rows import Columns, Rows
+
+
+def test_query_without_where_gets_where_clause():
+    query = Query('q', 'SELECT a FROM t\n')
+    assert query.filters_allowed
+    assert query.with_filters(['a = %s', 'b = %s']) == 'SELECT a FROM t\nWHERE a = %s AND b = %s\n\n'
+
+
+def test_filters_are_inserted_before_order_by():
+    query = Query('q', 'SELECT a FROM t ORDER BY a')
+    assert query.with_filters(['a = %s']) == 'SELECT a FROM t\nWHERE a = %s\nORDER BY a'
+
+
+def test_filters_extend_existing_where():
+    query = Query('q', 'SELECT a FROM t WHERE x = 1 OR y = 2 GROUP BY a')
+    assert query.with_filters(['a = %s']) == 'SELECT a FROM t WHERE (x = 1 OR y = 2) AND a = %s GROUP BY a'
+
+
+def test_trailing_comments_of_where_stay_after_condition():
+    query = Query('q', 'SELECT a FROM t WHERE x = 1 -- note\n/* more */ GROUP BY a')
+    assert query.with_filters(['a = %s']) == 'SELECT a FROM t WHERE (x = 1) AND a = %s -- note\n/* more */ GROUP BY a'
+    query = Query('q', 'SELECT a FROM t WHERE x = 1 -- note')
+    assert query.with_filters(['a = %s']) == 'SELECT a FROM t WHERE (x = 1) AND a = %s -- note'
+
+
+def test_required_params_are_counted():
+    query = Query('q', 'SELECT a FROM t WHERE x = %s AND y = %s')
+    assert query.required_params_count == 2
+
+
+def test_filters_are_not_applied_to_non_select():
+    query = Query('q', 'EXEC some_procedure %s')
+    assert not query.filters_allowed
+    assert query.with_filters(['a = %s']) == 'EXEC some_procedure %s'
+
+
+def test_render_paginates_filtered_query():
+    query = Query('q', 'SELECT a FROM t')
+    sql = query.render(['a = %s'], Page('a', 10, 2))
+    assert 'SELECT a FROM t\nWHERE a = %s\n' in sql
+    assert 'ORDER BY a' in sql
+    assert 'OFFSET 20 ROWS FETCH NEXT 10  ROWS ONLY' in sql
+
+
+def test_pages_of_sqlite_stand_in_are_limited(monkeypatch):
+    monkeypatch.setattr(query_execution, '_is_sqlite', lambda: True)
+    query = Query('q', 'SELECT a FROM t')
+    assert 'LIMIT 10 OFFSET 20' in query.render([], Page('a', 10, 2))
+    assert 'LIMIT 10' in query.render([], Page('a', 10, 0, keyset=True, after=42))
+
+
+def test_filter_values_precede_required_params_after_them():
+    query = Query('q', 'SELECT a FROM t WHERE x = %s GROUP BY a HAVING COUNT(*) > %s')
+    assert query.arrange_values([1, 2], [3]) == [1, 3, 2]
+
+
+def test_batch_query_refers_placeholders_to_keys_table():
+    query = Query('q', 'SELECT a FROM t WHERE x = %s')
+    sql = query.render_batch(['b = %s'], 2, 2)
+    assert 'FROM (VALUES (%s, %s, %s), (%s, %s, %s)) AS __batch_keys (__batch_index, p0, p1)' in sql
+    assert 'WHERE (x = __batch_keys.p0) AND b = __batch_keys.p1' in sql
+    assert '%s' not in sql.split('CROSS APPLY')[1]
+
+
+def test_batch_is_not_allowed_for_ordered_query():
+    assert Query('q', 'SELECT a FROM t').batch_allowed
+    assert not Query('q', 'SELECT a FROM t ORDER BY a').batch_allowed
+
+
+def test_keyset_page_selects_rows_after_cursor():
+    query = Query('q', 'SELECT a FROM t')
+    page = Page('a', 10, 0, keyset=True, after=42)
+    sql = query.render([], page)
+    assert 'WHERE a > %s' in sql
+    assert 'ORDER BY a ASC' in sql
+    assert 'OFFSET 0 ROWS FETCH NEXT 10 ROWS ONLY' in sql
+    assert page.get_value() == [42]
+
+
+def test_keyset_page_selects_rows_before_cursor_in_reverse():
+    page = Page('a', 10, 0, keyset=True, before=42)
+    sql = Query('q', 'SELECT a FROM t').render([], page)
+    assert 'WHERE a < %s' in sql
+    assert 'ORDER BY a DESC' in sql
+    assert page.backward
+
+
+def test_first_keyset_page_has_no_cursor():
+    page = Page('a', 10, 0, keyset=True)
+    sql = Query('q', 'SELECT a FROM t').render([], page)
+    assert 'WHERE a' not in sql
+    assert page.get_value() == []
+
+
+def test_aggregated_page_selects_ranks_of_distinct_keys():
+    sql = Query('q', 'SELECT a, b FROM t').render([], Page('a', 10, 2, aggregated=True))
+    assert 'DENSE_RANK() OVER (ORDER BY a ASC) AS __page_rank' in sql
+    assert 'WHERE __page_rank > 20 AND __page_rank <= 30' in sql
+
+
+def test_aggregated_keyset_page_ranks_keys_after_cursor():
+    page = Page('a', 10, 0, keyset=True, after=5, aggregated=True)
+    sql = Query('q', 'SELECT a, b FROM t').render([], page)
+    assert 'WHERE a > %s' in sql
+    assert 'WHERE __page_rank > 0 AND __page_rank <= 10' in sql
+
+
+@pytest.fixture
+def query_cache(monkeypatch):
+    cache = LocMemCache('query-execution-tests', {})
+    cache.clear()
+    monkeypatch.setattr(query_execution, 'cache', cache)
+    return cache
+
+
+class _StandInRedis:
+    def __init__(self, values):
+        self.values = values
+
+    def eval(self, script, numkeys, key, token):
+        assert numkeys == 1 and 'del' in script
+        if self.values.get(key) == token:
+            del self.values[key]
+
+
+def test_lock_is_released_only_by_its_holder(monkeypatch):
+    redis_cache = RedisCache('unix:///nonexistent.sock', {})
+    token = redis_cache.client.encode('token')
+    values = {redis_cache.client.make_key('q.lock'): token}
+    monkeypatch.setattr(query_execution, 'cache', redis_cache)
+    monkeypatch.setattr(query_execution, 'get_redis_connection', lambda alias: _StandInRedis(values))
+    query_execution._release_lock('q', 'other token')
+    assert values
+    query_execution._release_lock('q', 'token')
+    assert not values
+
+
+def _counting_execution(monkeypatch, delay=0.0):
+    calls = []
+
+    def execute(query, required_params, params, page):
+        calls.append(query.name)
+        time.sleep(delay)
+        return Rows.from_dicts([{'call': len(calls)}])
+
+    monkeypatch.setattr(query_execution, '_execute_query', execute)
+    return calls
+
+
+def test_concurrent_misses_execute_query_once(monkeypatch, query_cache):
+    calls = _counting_execution(monkeypatch, delay=0.2)
+    query = Query('q', 'SELECT a FROM t')
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(query_execution.execute_query(query, [], [], None)))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == ['q']
+    assert [result.dicts() for result in results] == [[{'call': 1}]] * 5
+
+
+
+
+def test_concurrent_batch_misses_execute_each_query_once(monkeypatch, query_cache):
+    calls = []
+
+    def execute_batch(query, parameters):
+        calls.extend(params[0].value for _, params in parameters)
+        time.sleep(0.2)
+        return [Rows.from_dicts([{'id': params[0].value}]) for _, params in parameters]
+
+    monkeypatch.setattr(query_execution, '_execute_batch', execute_batch)
+    query = Query('q', 'SELECT a FROM t')
+    results = []
+
+    def execute(ids):
+        parameters = [([], [Param('id', 'id = %s', value)]) for value in ids]
+        results.append((ids, [result.dicts() for result in query_execution.execute_batch_query(query, parameters)]))
+
+    threads = [threading.Thread(target=execute, args=(ids,)) for ids in [[1, 2], [2, 3], [1, 2, 3]] * 2]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(calls) == [1, 2, 3]
+    assert len(results) == 6
+    assert all(dicts == [[{'id': value}] for value in ids] for ids, dicts in results)
+def test_stale_result_is_served_while_refreshed(monkeypatch, settings, query_cache):
+    settings.SQL_QUERY_CACHE_TIMEOUT_SECONDS = 0
+    calls = _counting_execution(monkeypatch)
+    refreshes = []
+    monkeypatch.setattr(query_execution, '_in_background', lambda target, *args: refreshes.append((target, args)))
+    query = Query('q', 'SELECT a FROM t')
+    assert query_execution.execute_query(query, [], [], None).dicts() == [{'call': 1}]
+    assert query_execution.execute_query(query, [], [], None).dicts() == [{'call': 1}]
+    assert len(refreshes) == 1 and calls == ['q']
+
+    target, args = refreshes.pop()
+    target(*args)
+    assert query_execution.execute_query(query, [], [], None).dicts() == [{'call': 2}]
+
+
+def _empty_execution(monkeypatch):
+    calls = []
+
+    def execute(query, required_params, params, page):
+        calls.append(query.name)
+        return Rows(Columns(['a']))
+
+    monkeypatch.setattr(query_execution, '_execute_query', execute)
+    return calls
+
+
+def test_empty_result_is_cached_by_default(monkeypatch, query_cache):
+    calls = _empty_execution(monkeypatch)
+    query = Query('q', 'SELECT a FROM t')
+    assert query_execution.execute_query(query, [], [], None) == []
+    assert query_execution.execute_query(query, [], [], None) == []
+    assert calls == ['q']
+
+
+def test_empty_result_is_not_cached_when_disabled_by_policy(monkeypatch, query_cache):
+    calls = _empty_execution(monkeypatch)
+    query = Query('q', 'SELECT a FROM t')
+    policy = CachePolicy(cache_empty=False)
+    query_execution.execute_query(query, [], [], None, policy)
+    query_execution.execute_query(query, [], [], None, policy)
+    assert calls == ['q', 'q']
+
+
+def test_disabled_cache_always_executes_query(monkeypatch, query_cache):
+    calls = _counting_execution(monkeypatch)
+    query = Query('q', 'SELECT a FROM t')
+    policy = CachePolicy(enabled=False)
+    query_execution.execute_query(query, [], [], None, policy)
+    assert query_execution.execute_query(query, [], [], None, policy).dicts() == [{'call': 2}]
+
+
+def test_forced_refresh_replaces_cached_result(monkeypatch, query_cache):
+    calls = _counting_execution(monkeypatch)
+    query = Query('q', 'SELECT a FROM t')
+    query_execution.execute_query(query, [], [], None)
+    with query_execution.forced_refresh():
+        assert query_execution.execute_query(query, [], [], None).dicts() == [{'call': 2}]
+    assert query_execution.execute_query(query, [], [], None).dicts() == [{'call': 2}]
+    assert len(calls) == 2
@@ -0,0 +1,47 @@
+import time
+
+import pytest
+
+from api import query_execution
+from api.query_execution import QueryTimeout
+
+SLOW_SQL = 'WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT count(*) AS c FROM n'
+
+
+def _execute(sql, timeout):
+    return query_execution._SqlQuery(sql, timeout).execute([])
+
+
+def test_query_is_cancelled_after_timeout(stand_in_database):
+    start = time.monotonic()
+    with pytest.raises(QueryTimeout):
+        _execute(SLOW_SQL, 0.2)
+    assert time.monotonic() - start < 2
+    # connection is usable after cancelled query
+    assert _execute('SELECT 1 AS one', 0.2).dicts() == [{'one': 1}]
+
+
+def test_global_timeout_is_used_when_endpoint_has_none(stand_in_database, settings):
+    settings.QUERY_TIMEOUT_SECONDS = 0.2
+    with pytest.raises(QueryTimeout):
+        _execute(SLOW_SQL, None)
+
+
+def test_request_deadline_shortens_query_timeout(stand_in_database):
+    start = time.monotonic()
+    with query_execution.deadline(0.2), pytest.raises(QueryTimeout):
+        _execute(SLOW_SQL, 30)
+    assert time.monotonic() - start < 2
+
+
+def test_query_is_not_started_after_deadline(stand_in_database):
+    with query_execution.deadline(0.01):
+        time.sleep(0.02)
+        with pytest.raises(QueryTimeout):
+            _execute('SELECT 1 AS one', 30)
+
+
+def test_zero_timeout_does_not_limit_query(stand_in_database, settings):
+    settings.QUERY_TIMEOUT_SECONDS = 0
+    assert query_execution._query_timeout(None) == 0
+    assert _execute('SELECT 1 AS one', None).dicts() == [{'one': 1}]
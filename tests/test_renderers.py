@@ -0,0 +1,66 @@
+import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from api.endpoint import Endpoint, Object, Field, TypeEnum
+from api.renderers import ApiJsonRenderer, ApiXmlRenderer
+
+
+def _endpoint():
+    schema = Object(name='student', many=False, aggregate=False, aggregation_field=None, fields={
+        'id': Field(type=TypeEnum.INT, db_name='ID', xml_attribute=True),
+        'name': Field(type=TypeEnum.STRING, db_name='NAME'),
+    })
+    return Endpoint(name='students', sql='students.sql', schema=schema, key='ID', description=None)
+
+
+def test_streamed_json_equals_rendered_json():
+    batches = [
+        [{'id': 1, 'name': 'Иванов '}, {'id': 2, 'name': None}],
+        [],
+        [{'id': 3, 'date': datetime.date(2019, 9, 1)}],
+    ]
+    renderer = ApiJsonRenderer()
+    streamed = b''.join(renderer.render_stream(iter(batches)))
+    rendered = renderer.render([record for batch in batches for record in batch])
+    assert streamed == rendered
+
+
+def test_streamed_empty_json_list():
+    assert b''.join(ApiJsonRenderer().render_stream(iter([]))) == b'[]'
+
+
+def test_streamed_xml_equals_rendered_xml():
+    batches = [[{'id': 1, 'name': 'a & b'}, {'id': 2, 'name': 'c'}], [{'id': 3, 'name': ''}]]
+    renderer = ApiXmlRenderer()
+    context = {'view': SimpleNamespace(endpoint=_endpoint())}
+    chunks = list(renderer.render_stream(iter(batches), context))
+    rendered = renderer.render([record for batch in batches for record in batch], renderer_context=context)
+    assert len(chunks) == 3
+    assert b''.join(chunks) == rendered.encode('utf-8')
+
+
+def _failing_batches():
+    yield [{'id': 1, 'name': 'a'}]
+    raise RuntimeError('connection lost')
+
+
+def _render_failing_stream(renderer):
+    chunks = []
+    with pytest.raises(RuntimeError):
+        for chunk in renderer.render_stream(_failing_batches(), {'view': SimpleNamespace(endpoint=_endpoint())}):
+            chunks.append(chunk)
+    return b''.join(chunks).decode('utf-8')
+
+
+def test_streamed_xml_reports_error_inside_document(caplog):
+    content = _render_failing_stream(ApiXmlRenderer())
+    assert content.endswith('<error>Response is incomplete due to internal server error</error>')
+    assert 'Streaming of students failed' in caplog.text
+
+
+def test_streamed_json_is_aborted_on_error(caplog):
+    content = _render_failing_stream(ApiJsonRenderer())
+    assert content == '[{"id":1,"name":"a"}'
+    assert 'Streaming of students failed' in caplog.text
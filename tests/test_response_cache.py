@@ -0,0 +1,97 @@
+import json
+
+import pytest
+from django.core.cache.backends.locmem import LocMemCache
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+
+from api import query_execution, response_cache
+from api.endpoint import Endpoint, Object, Field, TypeEnum, CachePolicy
+from api.query_execution import Query
+from api.renderers import ApiJsonRenderer, ApiXmlRenderer
+from api.views import EndpointView
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = LocMemCache('response-cache-tests', {})
+    cache.clear()
+    monkeypatch.setattr(response_cache, 'cache', cache)
+    return cache
+
+
+def _endpoint():
+    schema = Object(name='student', fields={}, many=False, aggregate=False, aggregation_field=None)
+    return Endpoint(name='students', sql='s.sql', schema=schema, key=None, description=None)
+
+
+def _request(url, renderer=ApiJsonRenderer, **headers):
+    request = Request(APIRequestFactory().get(url, **headers))
+    request.accepted_renderer = renderer()
+    return request
+
+
+def test_key_does_not_depend_on_params_order_and_format_param():
+    endpoint = _endpoint()
+    key = response_cache.cache_key(endpoint, _request('/students?a=1&b=2'))
+    assert response_cache.cache_key(endpoint, _request('/students?b=2&a=1&format=json')) == key
+    assert response_cache.cache_key(endpoint, _request('/students?a=1&b=3')) != key
+    assert response_cache.cache_key(endpoint, _request('/students?a=1&b=2', ApiXmlRenderer)) != key
+
+
+def test_cached_response_is_not_modified_for_matching_etag(cache):
+    request = _request('/students')
+    response = response_cache.store_on_render(request, Response([]), 'key', _endpoint())
+    response.accepted_renderer = request.accepted_renderer
+    response.accepted_media_type = request.accepted_renderer.media_type
+    response.renderer_context = {}
+    etag = response.render()['ETag']
+
+    cached = response_cache.cached_response(_request('/students'), 'key')
+    assert cached.status_code == 200 and cached.content == b'[]' and cached['ETag'] == etag
+    assert response_cache.cached_response(_request('/students', HTTP_IF_NONE_MATCH=etag), 'key').status_code == 304
+    assert response_cache.cached_response(_request('/students'), 'other-key') is None
+
+
+def _students_view(policy):
+    schema = Object(name='student', many=False, aggregate=False, aggregation_field=None, fields={
+        'id': Field(type=TypeEnum.INT, db_name='ID'),
+    })
+    endpoint = Endpoint(name='students', sql='students.sql', schema=schema, key='ID', description=None, cache=policy)
+    endpoint.query = Query('students.sql', 'SELECT ID FROM STUDENTS')
+    return EndpointView.as_view(endpoint=endpoint)
+
+
+def _get_students(view):
+    response = view(APIRequestFactory().get('/students', HTTP_X_API_KEY='key'))
+    if hasattr(response, 'render'):
+        # cached responses are rendered already
+        response.render()
+    return json.loads(response.content)
+
+
+@pytest.mark.parametrize('cache_empty, cached', [(False, False), (True, True)])
+def test_empty_response_is_cached_unless_disabled_by_policy(stand_in_database, cache, monkeypatch, settings,
+                                                             cache_empty, cached):
+    settings.API_KEY = 'key'
+    settings.ACCESS_HISTORY_HOURS = 0
+    monkeypatch.setattr(query_execution, 'cache', cache)
+    stand_in_database.cursor().execute('CREATE TABLE STUDENTS (ID INTEGER)')
+    view = _students_view(CachePolicy(cache_empty=cache_empty, response_timeout=300))
+    assert _get_students(view) == []
+
+    stand_in_database.cursor().execute('INSERT INTO STUDENTS VALUES (1)')
+    assert _get_students(view) == ([] if cached else [{'id': 1}])
+
+
+def test_large_responses_are_not_cached(stand_in_database, cache, monkeypatch, settings):
+    settings.API_KEY = 'key'
+    settings.ACCESS_HISTORY_HOURS = 0
+    settings.CACHE_MAX_ENTRY_SIZE = 100
+    monkeypatch.setattr(query_execution, 'cache', LocMemCache('large-responses', {}))
+    stand_in_database.cursor().execute('CREATE TABLE STUDENTS (ID INTEGER)')
+    stand_in_database.cursor().executemany('INSERT INTO STUDENTS VALUES (?)', [(idx,) for idx in range(100)])
+    view = _students_view(CachePolicy(response_timeout=300))
+    assert len(_get_students(view)) == 100
+    assert not cache._cache
@@ -0,0 +1,71 @@
+import json
+
+import pytest
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import RequestFactory
+
+from api import query_execution
+from api.endpoint import Endpoint, Object, Field, TypeEnum, CachePolicy
+from api.query_execution import TooManyRows, Query
+from api.rows import Rows
+from api.views import EndpointView
+
+ENDLESS_SQL = 'WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT i AS ID FROM n'
+FIFTY_SQL = 'WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n LIMIT 50) SELECT i AS ID FROM n'
+
+
+def test_rows_over_limit_are_not_fetched(stand_in_database, settings):
+    settings.FETCH_SIZE = 4
+    settings.QUERY_TIMEOUT_SECONDS = 5
+    with pytest.raises(TooManyRows) as error:
+        query_execution._SqlQuery(ENDLESS_SQL, max_rows=10, name='endless.sql').execute([])
+    assert error.value.query_name == 'endless.sql'
+    assert 'pagination' in str(error.value.detail)
+
+
+def test_global_limit_applies_unless_endpoint_sets_its_own(stand_in_database, settings):
+    settings.MAX_ROWS = 10
+    with pytest.raises(TooManyRows):
+        query_execution._SqlQuery(FIFTY_SQL).execute([])
+    assert len(query_execution._SqlQuery(FIFTY_SQL, max_rows=50).execute([])) == 50
+    assert len(query_execution._SqlQuery(FIFTY_SQL, max_rows=0).execute([])) == 50
+
+
+def test_large_results_are_not_cached(monkeypatch, settings):
+    cache = LocMemCache('row-limit-tests', {})
+    cache.clear()
+    monkeypatch.setattr(query_execution, 'cache', cache)
+    settings.CACHE_MAX_ENTRY_SIZE = 200
+    policy = CachePolicy()
+    query_execution._store('small', Rows.from_dicts([{'ID': 1}]), policy)
+    query_execution._store('large', Rows.from_dicts([{'ID': f'row {idx}'} for idx in range(1000)]), policy)
+    assert cache.get('small') is not None
+    assert cache.get('large') is None
+
+
+def _view(sql, **kwargs):
+    schema = Object(name='row', many=False, aggregate=False, aggregation_field=None, fields={
+        'id': Field(type=TypeEnum.INT, db_name='ID'),
+    })
+    endpoint = Endpoint(name='rows', sql='rows.sql', schema=schema, key='ID', description=None,
+                        cache=CachePolicy(enabled=False), max_rows=10, **kwargs)
+    endpoint.query = Query('rows.sql', sql, max_rows=endpoint.max_rows)
+    return EndpointView.as_view(endpoint=endpoint)
+
+
+def _get(view, settings):
+    settings.API_KEY = 'key'
+    return view(RequestFactory().get('/rows', HTTP_X_API_KEY='key'))
+
+
+def test_too_large_result_is_streamed(stand_in_database, settings):
+    response = _get(_view(FIFTY_SQL), settings)
+    assert response.status_code == 200 and response.streaming
+    assert json.loads(b''.join(response.streaming_content)) == [{'id': idx} for idx in range(1, 51)]
+
+
+def test_too_large_result_of_aggregated_endpoint_fails(stand_in_database, settings):
+    response = _get(_view(FIFTY_SQL, aggregation_enabled=True), settings)
+    response.render()
+    assert response.status_code == 400
+    assert 'pagination' in json.loads(response.content)['detail']
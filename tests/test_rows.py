@@ -0,0 +1,25 @@
+from api import rows
+from api.rows import Columns, Rows
+
+
+def test_rows_share_columns():
+    result = Rows.from_dicts([{'ID': 1, 'NAME': 'a'}, {'ID': 2, 'NAME': 'b'}])
+    assert result == [(1, 'a'), (2, 'b')]
+    assert result.value(result[1], 'NAME') == 'b'
+    assert result.dicts() == [{'ID': 1, 'NAME': 'a'}, {'ID': 2, 'NAME': 'b'}]
+
+
+def test_rows_are_rearranged_to_other_columns():
+    result = Rows.from_dicts([{'ID': 1, 'NAME': 'a'}])
+    columns = Columns(['NAME', 'ID'])
+    assert result.with_columns(Columns(['ID', 'NAME'])) is result
+    assert result.with_columns(columns) == [('a', 1)]
+
+
+def test_concat_keeps_columns_of_first_result():
+    first = Rows.from_dicts([{'ID': 1, 'NAME': 'a'}])
+    second = Rows.from_dicts([{'NAME': 'b', 'ID': 2}])
+    result = rows.concat([first, second])
+    assert result.columns is first.columns
+    assert result == [(1, 'a'), (2, 'b')]
+    assert rows.concat([]) == []
@@ -0,0 +1,47 @@
+import marshal
+
+import pytest
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import RequestFactory
+
+from api import profiling, server_timing
+from api.endpoint_data_wrapper import run_concurrently
+
+
+def test_phases_of_worker_threads_are_added_up(monkeypatch):
+    monkeypatch.setattr('api.endpoint_data_wrapper.close_old_connections', lambda: None)
+    timings = server_timing.Timings()
+    with server_timing.collect(timings):
+        run_concurrently([lambda: server_timing.add('sql', 0.01)] * 3, 3)
+        server_timing.add('render', 0.002)
+    server_timing.add('sql', 1)
+    assert timings.header(0.05) == 'sql;dur=30.0, render;dur=2.0, total;dur=50.0'
+
+
+@pytest.fixture
+def cache(monkeypatch, settings):
+    settings.ADMIN_API_KEY = 'admin'
+    cache = LocMemCache('profiling-tests', {})
+    cache.clear()
+    monkeypatch.setattr(profiling, 'cache', cache)
+    return cache
+
+
+def _request(**headers):
+    return RequestFactory().get('/students', **headers)
+
+
+def test_only_admins_profile_requests(cache):
+    assert not profiling.requested(_request(HTTP_X_PROFILE='1'))
+    assert not profiling.requested(_request(HTTP_X_PROFILE='1', HTTP_X_ADMIN_KEY='guess'))
+    assert not profiling.requested(_request(HTTP_X_ADMIN_KEY='admin'))
+    with profiling.profiled(_request(HTTP_X_ADMIN_KEY='admin')) as profile_id:
+        assert profile_id is None
+
+
+def test_profile_is_stored(cache):
+    with profiling.profiled(_request(HTTP_X_PROFILE='1', HTTP_X_ADMIN_KEY='admin')) as profile_id:
+        sorted(range(1000))
+    stats = marshal.loads(profiling.load(profile_id))
+    assert any(function == "<built-in method builtins.sorted>" for _, _, function in stats)
+    assert profiling.load('unknown') is None